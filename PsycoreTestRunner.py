@@ -1,6 +1,8 @@
+import copy
 import yaml
 import tempfile
 import os
+from concurrent.futures import ThreadPoolExecutor
 from psycore import Psycore
 from typing import Optional, Dict, Any, Union
 
@@ -71,26 +73,34 @@ class PsycoreTestRunner:
         Returns:
             self for method chaining
         """
-        def deep_update(d: Dict[str, Any], u: Dict[str, Any]) -> Dict[str, Any]:
-            for k, v in u.items():
-                if isinstance(v, dict) and k in d and isinstance(d[k], dict):
-                    d[k] = deep_update(d[k], v)
-                else:
-                    d[k] = v
-            return d
-        
-        self.config = deep_update(self.config, updates)
+        self.config = self._deep_update(self.config, updates)
         self.resetPsycore()
         if preprocess:
             self.preprocess()
             
         return self
     
-    def _create_temp_config_file(self) -> str:
-        """Create a temporary YAML file with the current configuration."""
+    @staticmethod
+    def _deep_update(d: Dict[str, Any], u: Dict[str, Any]) -> Dict[str, Any]:
+        for k, v in u.items():
+            if isinstance(v, dict) and k in d and isinstance(d[k], dict):
+                d[k] = PsycoreTestRunner._deep_update(d[k], v)
+            else:
+                d[k] = v
+        return d
+
+    def _create_temp_config_file(self, config: Dict[str, Any] = None) -> str:
+        """Create a temporary YAML file with the given configuration, defaulting to the current one."""
         with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as temp_file:
-            yaml.dump(self.config, temp_file)
+            yaml.dump(self.config if config is None else config, temp_file)
             return temp_file.name
+
+    def _build_psycore(self, config: Dict[str, Any] = None) -> Psycore:
+        temp_file_path = self._create_temp_config_file(config)
+        try:
+            return Psycore(temp_file_path)
+        finally:
+            os.unlink(temp_file_path)
         
     def resetPsycore(self) -> 'PsycoreTestRunner':
         """
@@ -99,24 +109,23 @@ class PsycoreTestRunner:
         Returns:
             self for method chaining
         """
-        try:
-            temp_file_path = self._create_temp_config_file()
-            self.psycore = Psycore(temp_file_path)
-        finally:
-            os.unlink(temp_file_path)
+        self.psycore = self._build_psycore()
     
 
 
         return self
     
-    def preprocess(self) -> 'PsycoreTestRunner':
+    def preprocess(self, force: bool = False) -> 'PsycoreTestRunner':
         """
         Run preprocessing with the current configuration.
         
+        Args:
+            force: Preprocess even if this configuration's namespace is already populated
+            
         Returns:
             self for method chaining
         """
-        self.psycore.preprocess(skip_confirmation=True)
+        self.psycore.preprocess(skip_confirmation=True, force=force)
         
     def evaluate_prompt(self, prompt: str) -> Any:
         """
@@ -146,15 +155,77 @@ class PsycoreTestRunner:
         return evaluation
     
 
-    def evaluate_prompts(self, prompts: list[str]) -> list[Any]:
+    def evaluate_prompts(self, prompts: list[str], max_workers: Optional[int] = None) -> list[Any]:
         """
-        Evaluate a list of prompts using the current configuration.
+        Evaluate a list of prompts concurrently using the current configuration.
+        Each prompt gets its own chat history so results don't depend on evaluation order.
         
         Args:
             prompts: List of prompts to evaluate
+            max_workers: Prompts evaluated at once, defaults to evaluation.prompt_workers in the config
             
+        Returns:
+            Results in the same order as prompts
         """
-        return [self.evaluate_prompt(prompt) for prompt in prompts]
+        if self.psycore is None:
+            raise RuntimeError("Psycore instance not initialized. Call preprocess() first or initialize with preprocess=True")
+        return self.psycore.evaluate_prompts(prompts, max_workers)
+
+    def evaluate_configs(self, configs: list[Dict[str, Any]], prompts: list[str], preprocess: bool = False, max_workers: Optional[int] = None, return_exceptions: bool = False) -> list[Any]:
+        """
+        Evaluate prompts against several configurations, running the configurations concurrently.
+        Configurations should share a preprocessing group, otherwise they compete for the preprocessing step.
+        The runner's own configuration and Psycore instance are left unchanged.
+        
+        Args:
+            configs: Configuration updates, each applied on top of the current configuration
+            prompts: List of prompts to evaluate against every configuration
+            preprocess: Whether to preprocess the configurations first, once per preprocessing fingerprint and skipped for already preprocessed ones
+            max_workers: Configurations evaluated at once, defaults to evaluation.config_workers in the config
+            return_exceptions: Return a configuration's exception in place of its results rather than raising it
+            
+        Returns:
+            A list of prompt results for each configuration, in the same order as configs
+        """
+        results: list[Any] = [None] * len(configs)
+        psycores = {}
+        # The first config with each fingerprint preprocesses it, the rest reuse its outcome, including its exception
+        preprocessed = {}
+        # Building and preprocessing run one at a time as they reconfigure process wide state like logging and rate limits
+        for i, config in enumerate(configs):
+            try:
+                psycore = self._build_psycore(self._deep_update(copy.deepcopy(self.config), config))
+                if preprocess:
+                    fingerprint = psycore.preprocessing_fingerprint
+                    if fingerprint not in preprocessed:
+                        try:
+                            preprocessed[fingerprint] = psycore.preprocess(skip_confirmation=True)
+                        except Exception as e:
+                            preprocessed[fingerprint] = e
+                    if isinstance(preprocessed[fingerprint], Exception):
+                        raise preprocessed[fingerprint]
+                psycores[i] = psycore
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results[i] = e
+        if len(psycores) == 0:
+            return results
+        if max_workers is None:
+            max_workers = next(iter(psycores.values())).config_workers
+
+        def evaluate(i):
+            try:
+                return psycores[i].evaluate_prompts(prompts)
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                return e
+
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(psycores)))) as executor:
+            for i, result in zip(psycores.keys(), executor.map(evaluate, psycores.keys())):
+                results[i] = result
+        return results
     
     def get_config(self) -> Dict[str, Any]:
         """
@@ -1,20 +1,157 @@
+import os
+import sys
+import glob
+import numpy as np
 import pandas as pd
 import json
 
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.results import ResultManager
+
 class ResultVisualiser:
-    def __init__(self, results_path):
+    # Flattened results are kept as Parquet segments here, each refresh only adds the results that changed
+    COLUMNAR_DIR = "columnar"
+    KEYS = ["config_hash", "prompt_index"]
+    # Column name and where it's read from in each RAG result
+    METRICS = {
+        "graph_recall": ("graph_evaluation", "recall", None),
+        "graph_precision": ("graph_evaluation", "precision", None),
+        "graph_f_beta": ("graph_evaluation", "f_beta", None),
+        "bertscore_precision": ("bertscore_evaluation", "precision", 0),
+        "bertscore_recall": ("bertscore_evaluation", "recall", 0),
+        "bertscore_f1": ("bertscore_evaluation", "f1", 0),
+        "rougeL_precision": ("rouge_evaluation", "rougeL", 0),
+        "rougeL_recall": ("rouge_evaluation", "rougeL", 1),
+        "rougeL_f1": ("rouge_evaluation", "rougeL", 2),
+    }
+
+    def __init__(self, results_path, refresh=True):
         self.results_path = results_path
-        # Results csv
-        self.results_csv = pd.read_csv(results_path+"/results.csv")
-        self.configs = []
-        for index, row in self.results_csv.iterrows():
-            config = self.read_line(row)
-            result_path = row["result_path"]
-            with open(result_path, "r") as f:
+        self.columnar_path = os.path.join(results_path, self.COLUMNAR_DIR)
+        self.prompts = pd.DataFrame()
+        self.rag_results = pd.DataFrame()
+        self.weighted = pd.DataFrame()
+        if refresh:
+            self.refresh()
+
+    def _result_file(self, row):
+        # Older trackers stored paths relative to where the sweep ran, sometimes with Windows separators
+        if os.path.exists(row["result_path"]):
+            return row["result_path"]
+        return os.path.join(self.results_path, f"{row['config_hash']}.json")
+
+    def _load_segments(self, table):
+        paths = sorted(glob.glob(os.path.join(self.columnar_path, f"*-{table}.parquet")))
+        if len(paths) == 0:
+            return pd.DataFrame()
+        return pd.concat([pd.read_parquet(path) for path in paths], ignore_index=True)
+
+    @staticmethod
+    def _latest(table):
+        """Keeps only the rows from the newest segment each config was ingested in."""
+        if len(table) == 0:
+            return table
+        latest = table.groupby("config_hash")["segment"].transform("max")
+        return table[table["segment"] == latest].reset_index(drop=True)
+
+    def refresh(self):
+        """
+        Ingests results added or rewritten since the last refresh into a new segment, then recomputes the weighted results.
+        :return: Number of results ingested.
+        """
+        # Results tracked by the ResultManager, imported from results.csv the first time
+        result_manager = ResultManager(self.results_path)
+        self.results_csv = result_manager.to_dataframe()
+        result_manager.close()
+
+        prompts = self._latest(self._load_segments("prompts"))
+        ingested = {}
+        if len(prompts) > 0:
+            ingested = prompts.groupby("config_hash")["result_mtime"].max().to_dict()
+
+        prompt_rows, rag_rows = [], []
+        ingested_count = 0
+        for row in self.results_csv.to_dict("records"):
+            result_file = self._result_file(row)
+            if not os.path.exists(result_file):
+                continue
+            mtime = os.path.getmtime(result_file)
+            if row["config_hash"] in ingested and ingested[row["config_hash"]] >= mtime:
+                continue
+            with open(result_file, "r") as f:
                 result = json.load(f)
-            weighted_results = self.weight_results(result)
-            config['results'] = weighted_results
-            self.configs.append(config)
+            new_prompts, new_rag_results = self._flatten_result(row["config_hash"], result, mtime)
+            prompt_rows.extend(new_prompts)
+            rag_rows.extend(new_rag_results)
+            ingested_count += 1
+
+        if ingested_count > 0:
+            os.makedirs(self.columnar_path, exist_ok=True)
+            existing = glob.glob(os.path.join(self.columnar_path, "*-prompts.parquet"))
+            segment = max([int(os.path.basename(path).split("-")[0]) for path in existing], default=0) + 1
+            new_prompts = pd.DataFrame(prompt_rows)
+            new_prompts["segment"] = segment
+            new_rag = pd.DataFrame(rag_rows, columns=self.KEYS + ["position", "score"] + list(self.METRICS.keys()))
+            new_rag["segment"] = segment
+            # The RAG segment is written first so a prompts segment is only ever seen with its RAG results
+            new_rag.to_parquet(os.path.join(self.columnar_path, f"{segment:06d}-rag_results.parquet"), index=False)
+            new_prompts.to_parquet(os.path.join(self.columnar_path, f"{segment:06d}-prompts.parquet"), index=False)
+            prompts = self._latest(pd.concat([prompts, new_prompts], ignore_index=True))
+
+        self.prompts = prompts
+        self.rag_results = self._load_segments("rag_results")
+        # Only the segments whose prompts were kept, which also drops any written by a refresh that stopped before its prompts
+        if len(self.rag_results) > 0:
+            self.rag_results = self.rag_results.merge(self.prompts[["config_hash", "segment"]].drop_duplicates(), on=["config_hash", "segment"])
+        self.weighted = self._weight(self.prompts, self.rag_results)
+        return ingested_count
+
+    def _flatten_result(self, config_hash, result_dict, mtime=0.0):
+        prompt_rows, rag_rows = [], []
+        for prompt_index, (prompt, prompt_result) in enumerate(result_dict.items()):
+            prompt_rows.append({
+                "config_hash": config_hash,
+                "prompt_index": prompt_index,
+                "prompt": prompt,
+                "response": prompt_result["response"],
+                "chosen_prompt": prompt_result["chosen_prompt"],
+                "retry_count": prompt_result["retry_count"],
+                "result_mtime": mtime,
+            })
+            for position, rag_result in enumerate(prompt_result["rag_results"]):
+                rag_row = [config_hash, prompt_index, position, rag_result["score"]]
+                for section, metric, index in self.METRICS.values():
+                    value = rag_result.get(section, {}).get(metric, np.nan)
+                    rag_row.append(value[index] if index is not None and isinstance(value, list) else value)
+                rag_rows.append(rag_row)
+        return prompt_rows, rag_rows
+
+    def _weight(self, prompts, rag_results):
+        """
+        Averages each prompt's RAG results weighted by rank, sorted by score the lowest has weight 1 and the highest n.
+        """
+        if len(prompts) == 0:
+            return pd.DataFrame()
+        metrics = list(self.METRICS.keys())
+        if len(rag_results) > 0:
+            # Stable sort on score then position gives the same order ties had when sorted in Python
+            ordered = rag_results.sort_values(self.KEYS + ["score", "position"], kind="mergesort")
+            grouped = ordered.groupby(self.KEYS, sort=False)
+            rank = grouped.cumcount().to_numpy() + 1
+            count = grouped["score"].transform("size").to_numpy()
+            weights = rank / (count * (count + 1) / 2)
+            weighted = pd.DataFrame(ordered[metrics].to_numpy(dtype=float) * weights[:, None], columns=metrics, index=ordered.index)
+            weighted[self.KEYS] = ordered[self.KEYS]
+            sums = weighted.groupby(self.KEYS)[metrics].sum(min_count=1)
+            sums["rag_count"] = ordered.groupby(self.KEYS).size()
+            table = prompts.merge(sums.reset_index(), on=self.KEYS, how="left")
+        else:
+            table = prompts.copy()
+            for metric in metrics + ["rag_count"]:
+                table[metric] = np.nan
+        table["rag_count"] = table["rag_count"].fillna(0).astype(int)
+        return table
 
     def read_line(self, row):
         results_dict = {
@@ -48,113 +185,104 @@ class ResultVisualiser:
                 "pass_threshold": row["iteration.pass_threshold"]
             }
         }
-        return results_dict            
+        return results_dict
+
+    @staticmethod
+    def _nested_results(weighted_row):
+        return {
+            "retry_count": weighted_row["retry_count"],
+            "rag_count": weighted_row["rag_count"],
+            "graph_evaluation": {
+                "recall": weighted_row["graph_recall"],
+                "precision": weighted_row["graph_precision"],
+                "f_beta": weighted_row["graph_f_beta"],
+                "beta": 1.0
+            },
+            "bertscore_evaluation": {
+                "precision": weighted_row["bertscore_precision"],
+                "recall": weighted_row["bertscore_recall"],
+                "f1": weighted_row["bertscore_f1"]
+            },
+            "rouge_evaluation": {
+                "rougeL": [weighted_row["rougeL_precision"], weighted_row["rougeL_recall"], weighted_row["rougeL_f1"]]
+            },
+            "chosen_prompt": weighted_row["chosen_prompt"],
+            "response": weighted_row["response"],
+        }
 
     def weight_results(self, result_dict):
-        prompt_index = {}
-        for prompt in result_dict:
-            prompt_index[prompt] = {}
-            response = result_dict[prompt]["response"]
-            retry_count = result_dict[prompt]["retry_count"]
-            chosen_prompt = result_dict[prompt]["chosen_prompt"]
-            rag_results = result_dict[prompt]["rag_results"]
-            rag_count = len(rag_results)
-            # Sort all rag results by score
-            rag_results.sort(key=lambda x: x["score"], reverse=False)
-            final_results = {
-                "retry_count": retry_count,
-                "rag_count": rag_count,
-                "graph_evaluation": {
-                    "recall": 0,
-                    "precision": 0,
-                    "f_beta": 0,
-                    "beta": 1.0
-                },
-                "bertscore_evaluation": {
-                    "precision": 0,
-                    "recall": 0,
-                    "f1": 0
-                },
-                "rouge_evaluation": {
-                    "rougeL": [0, 0, 0]
-                },
-                "chosen_prompt": chosen_prompt,
-                "response": response,
-            }
-            for i, rag_result in enumerate(rag_results):
-                # We multiply the score by the index + 1
-                final_results["graph_evaluation"]["recall"] += rag_result["graph_evaluation"]["recall"] * (i + 1)
-                final_results["graph_evaluation"]["precision"] += rag_result["graph_evaluation"]["precision"] * (i + 1)
-                final_results["graph_evaluation"]["f_beta"] += rag_result["graph_evaluation"]["f_beta"] * (i + 1)
-                final_results["bertscore_evaluation"]["precision"] += rag_result["bertscore_evaluation"]["precision"][0] * (i + 1)
-                final_results["bertscore_evaluation"]["recall"] += rag_result["bertscore_evaluation"]["recall"][0] * (i + 1)
-                final_results["bertscore_evaluation"]["f1"] += rag_result["bertscore_evaluation"]["f1"][0] * (i + 1)
-                for j in range(len(final_results["rouge_evaluation"]["rougeL"])):
-                    final_results["rouge_evaluation"]["rougeL"][j] += rag_result["rouge_evaluation"]["rougeL"][j] * (i + 1)
-
-            final_results["graph_evaluation"]["recall"] /= (rag_count * (rag_count + 1) / 2)
-            final_results["graph_evaluation"]["precision"] /= (rag_count * (rag_count + 1) / 2)
-            final_results["graph_evaluation"]["f_beta"] /= (rag_count * (rag_count + 1) / 2)
-            final_results["bertscore_evaluation"]["precision"] /= (rag_count * (rag_count + 1) / 2)
-            final_results["bertscore_evaluation"]["recall"] /= (rag_count * (rag_count + 1) / 2)
-            final_results["bertscore_evaluation"]["f1"] /= (rag_count * (rag_count + 1) / 2)
-            for j in range(len(final_results["rouge_evaluation"]["rougeL"])):
-                final_results["rouge_evaluation"]["rougeL"][j] /= (rag_count * (rag_count + 1) / 2)
-
-            prompt_index[prompt] = final_results
-        return prompt_index
+        """Rank weighted results of a single result file, keyed by prompt."""
+        prompt_rows, rag_rows = self._flatten_result("", result_dict)
+        prompts = pd.DataFrame(prompt_rows)
+        rag_results = pd.DataFrame(rag_rows, columns=self.KEYS + ["position", "score"] + list(self.METRICS.keys()))
+        weighted = self._weight(prompts, rag_results)
+        return {row["prompt"]: self._nested_results(row) for row in weighted.to_dict("records")}
+
+    @property
+    def configs(self):
+        """Each config with its weighted results keyed by prompt, the layout results used to be loaded into."""
+        results_by_hash = {}
+        for row in self.weighted.to_dict("records"):
+            results_by_hash.setdefault(row["config_hash"], {})[row["prompt"]] = self._nested_results(row)
+        configs = []
+        for row in self.results_csv.to_dict("records"):
+            if row["config_hash"] not in results_by_hash:
+                continue
+            config = self.read_line(row)
+            config['results'] = results_by_hash[row["config_hash"]]
+            configs.append(config)
+        return configs
 
     def save_results_to_csv(self, output_path):
         """Save the weighted results to a CSV file."""
-        rows = []
-        for config in self.configs:
-            for prompt, results in config['results'].items():
-                # Clean and escape text for CSV
-                original_prompt = str(prompt).replace('\n', ' ').replace('\r', ' ').strip()
-                chosen_prompt = str(results['chosen_prompt']).replace('\n', ' ').replace('\r', ' ').strip()
-                response = str(results['response']).replace('\n', ' ').replace('\r', ' ').strip()
-                
-                row = {
-                    'original_prompt': original_prompt,
-                    'chosen_prompt': chosen_prompt,
-                    'response': response,
-                    'model_primary': config['model']['primary'],
-                    'model_allow_image_input': config['model']['allow_image_input'],
-                    'graph_verification_enabled': config['graph_verification']['enabled'],
-                    'graph_verification_method': config['graph_verification']['method'],
-                    'graph_verification_llm_model': config['graph_verification']['llm_model'],
-                    'prompt_mode': config['prompt_mode']['mode'],
-                    'prompt_mode_elaborator': config['prompt_mode']['elaborator_model'],
-                    'text_summariser_model': config['text_summariser']['model'],
-                    'embedding_method': config['embedding']['method'],
-                    'embedding_model': config['embedding']['model'],
-                    'rag_text_similarity_threshold': config['rag']['text_similarity_threshold'],
-                    'rag_loop_retries': config['rag']['loop_retries'],
-                    'rag_pass_threshold': config['rag']['pass_threshold'],
-                    'retry_count': results['retry_count'],
-                    'rag_count': results['rag_count'],
-                    'graph_recall': results['graph_evaluation']['recall'],
-                    'graph_precision': results['graph_evaluation']['precision'],
-                    'graph_f_beta': results['graph_evaluation']['f_beta'],
-                    'bertscore_precision': results['bertscore_evaluation']['precision'],
-                    'bertscore_recall': results['bertscore_evaluation']['recall'],
-                    'bertscore_f1': results['bertscore_evaluation']['f1'],
-                    'rougeL_precision': results['rouge_evaluation']['rougeL'][0],
-                    'rougeL_recall': results['rouge_evaluation']['rougeL'][1],
-                    'rougeL_f1': results['rouge_evaluation']['rougeL'][2]
-                }
-                rows.append(row)
-                print(f"Added row for original prompt: {original_prompt[:100]}...")  # Print first 100 chars of prompt
-        
-        df = pd.DataFrame(rows)
+        if len(self.weighted) == 0:
+            print("No results to save")
+            return
+        tracker = self.results_csv.copy()
+        tracker["config_order"] = np.arange(len(tracker))
+        table = self.weighted.merge(tracker, on="config_hash").sort_values(["config_order", "prompt_index"])
+
+        def clean(column):
+            # Clean and escape text for CSV
+            return table[column].astype(str).str.replace('\n', ' ', regex=False).str.replace('\r', ' ', regex=False).str.strip()
+
+        df = pd.DataFrame({
+            'original_prompt': clean('prompt'),
+            'chosen_prompt': clean('chosen_prompt'),
+            'response': clean('response'),
+            'model_primary': table['model.primary'],
+            'model_allow_image_input': table['model.allow_image_input'],
+            'graph_verification_enabled': table['graph_verification.enabled'],
+            'graph_verification_method': table['graph_verification.method'],
+            'graph_verification_llm_model': table['graph_verification.llm_model'],
+            'prompt_mode': table['prompt_mode.mode'],
+            'prompt_mode_elaborator': table['prompt_mode.elaborator_model'],
+            'text_summariser_model': table['text_summariser.model'],
+            'embedding_method': table['embedding.method'],
+            'embedding_model': table['embedding.model'],
+            'rag_text_similarity_threshold': table['rag.text_similarity_threshold'],
+            'rag_loop_retries': table['iteration.loop_retries'],
+            'rag_pass_threshold': table['iteration.pass_threshold'],
+            'retry_count': table['retry_count'],
+            'rag_count': table['rag_count'],
+            'graph_recall': table['graph_recall'],
+            'graph_precision': table['graph_precision'],
+            'graph_f_beta': table['graph_f_beta'],
+            'bertscore_precision': table['bertscore_precision'],
+            'bertscore_recall': table['bertscore_recall'],
+            'bertscore_f1': table['bertscore_f1'],
+            'rougeL_precision': table['rougeL_precision'],
+            'rougeL_recall': table['rougeL_recall'],
+            'rougeL_f1': table['rougeL_f1']
+        })
         # Ensure proper CSV escaping
         df.to_csv(output_path, index=False, quoting=1)  # QUOTE_ALL mode
         print(f"\nResults saved to {output_path}")
-        print(f"Total rows saved: {len(rows)}")
+        print(f"Total rows saved: {len(df)}")
         print("\nFirst few rows of data:")
         print(df.head())
 
 
 if __name__ == "__main__":
     visualiser = ResultVisualiser("results")
-    visualiser.save_results_to_csv("results/weighted_results.csv")
\ No newline at end of file
+    visualiser.save_results_to_csv("results/weighted_results.csv")
@@ -11,6 +11,7 @@ sys.path.insert(0, parent_dir)
 
 import PsycoreTestRunner
 from src.results import ResultManager
+from src.sweep_scheduler import SweepScheduler
 import asyncio
 
 
@@ -128,10 +129,19 @@ class VariationType:
         return preprocessing_groups
 
 class TestConfigRunner:
-    def __init__(self, config_path: str, discord_webhook_url: str = None):
+    # Most configs evaluated concurrently against the same preprocessed data
+    BATCH_SIZE = 5
+
+    def __init__(self, config_path: str, discord_webhook_url: str = None, shard_index: int = 0, num_shards: int = 1):
+        """
+        shard_index and num_shards split the sweep between workers, each worker runs with the same configs and its own shard_index.
+        Shards are taken from every selected config, whether or not it already has results, so workers agree on them.
+        """
         print(f"Initializing TestConfigRunner with config_path: {config_path}")
         self.config_path = config_path
         self.discord_webhook_url = discord_webhook_url
+        self.shard_index = shard_index
+        self.num_shards = num_shards
         if discord_webhook_url:
             self.discord_webhook = DiscordWebhook(discord_webhook_url)
         print("Creating variations...")
@@ -345,98 +355,95 @@ class TestConfigRunner:
                 
             log_message("PsycoreTestRunner initialized successfully", "✅")
             
-            last_graph_type = None
-            last_embedding_type = None
-            
+            # Every selected config is loaded up front so the scheduler can order the whole sweep.
+            # Shards are computed before existing results are skipped, so every worker splits the same config set
+            all_configs = {}
+            fingerprints = {}
             for group, configs in preprocessing_groups.items():
                 # Skip groups that don't match selected preprocessing types if preprocessing is enabled
                 if preprocessing_enabled.value and group not in preprocessing_type.value:
                     continue
-                    
-                # Extract current graph type and embedding type from group name
-                # Group name format is like "llm_graph_aws_embedding"
-                parts = group.split('_')
-                current_graph_type = parts[0]  # llm or bert
-                current_embedding_type = parts[2]  # aws or clip
-                
-                group_message = f"📁 Processing group: {group}\n"
-                group_message += f"• Graph Type: {current_graph_type}\n"
-                group_message += f"• Embedding Type: {current_embedding_type}\n"
-                group_message += f"• Number of configs: {len(configs)}"
-                log_message(group_message, "📁")
-                
-                should_preprocess = preprocessing_enabled.value and (
-                    last_graph_type is None or  # First run
-                    last_graph_type != current_graph_type or  # Graph type changed
-                    last_embedding_type != current_embedding_type  # Embedding type changed
-                )
-                
-                last_graph_type = current_graph_type
-                last_embedding_type = current_embedding_type
-                
-                for i in range(0, len(configs), 5):
-                    batch = configs[i:i+5]
-                    batch_message = f"📋 Processing batch {i//5 + 1} of {(len(configs) + 4)//5}:\n"
-                    for config_path in batch:
-                        batch_message += f"• {os.path.basename(config_path)}\n"
-                    log_message(batch_message, "📋")
-                    
-                    for config_path in batch:
+                for config_path in configs:
+                    try:
+                        config_name = os.path.basename(config_path)
+                        log_message(f"Loading configuration from {config_name}...", "📄")
                         try:
-                            config_name = os.path.basename(config_path)
-                            log_message(f"Testing configuration: {config_name}", "⚙️")
-                            
-                            log_message(f"Loading configuration from {config_name}...", "📄")
-                            try:
-                                with open(config_path, 'r') as f:
-                                    config = yaml.safe_load(f)
-                                if config is None:
-                                    log_message(f"Warning: Empty or invalid YAML file: {config_name}", "⚠️")
-                                    continue
-                            except yaml.YAMLError as e:
-                                log_message(f"Error parsing YAML file {config_name}: {str(e)}", "❌")
-                                continue
-                            
-                            merged_config = TestConfigRunner.deep_merge(config, self.default_config)
-                            print(merged_config)
-                            
-                            log_message(f"\nMerged config before preprocessing for {config_name}:", "⚙️")
-                            log_message(json.dumps(merged_config, indent=2), "📄")
-                            
-                            
-                            exists, config_hash = self.result_manager.check_hash_exists(merged_config)
-                            if exists and not overwrite_enabled.value:
-                                log_message(f"Result already exists for {config_name} (hash: {config_hash}). Skipping...", "⏭️")
+                            with open(config_path, 'r') as f:
+                                config = yaml.safe_load(f)
+                            if config is None:
+                                log_message(f"Warning: Empty or invalid YAML file: {config_name}", "⚠️")
                                 continue
-                            
-                            log_message(f"Updating runner configuration...", "⚙️")
-                            
-                            if (should_preprocess and i == 0):
-                                log_message(f"Updating runner configuration with True", "🔄")
-                                log_message(f"Updating runner configuration where {current_embedding_type} Embedding and {current_graph_type} Graph are used", "🔄")
-                                runner.update_config(merged_config, True)
-                            else:
-                                runner.update_config(merged_config, False)
-                            
-                            
-                            log_message(f"Running tests with prompts...", "▶️")
-                            results = runner.evaluate_prompts(prompts)
-                            
-                            
-                            prompt_results = {prompt: result for prompt, result in zip(prompts, results)}
-                            
-                            
-                            log_message(f"Saving results...", "💾")
-                            self.result_manager.write_result(merged_config, prompt_results)
-                            
-                            log_message(f"Completed testing: {config_name}", "✅")
-                            
-                        except Exception as e:
-                            import traceback
-                            error_msg = f"Error processing {os.path.basename(config_path)}:\n{str(e)}"
-                            print(error_msg)
-                            log_message(error_msg, "❌")
+                        except yaml.YAMLError as e:
+                            log_message(f"Error parsing YAML file {config_name}: {str(e)}", "❌")
                             continue
+                        
+                        merged_config = TestConfigRunner.deep_merge(config, self.default_config)
+                        
+                        fingerprints[config_path] = SweepScheduler.profile(merged_config).fingerprint
+                        all_configs[config_path] = merged_config
+                    except Exception as e:
+                        error_msg = f"Error processing {os.path.basename(config_path)}:\n{str(e)}"
+                        print(error_msg)
+                        log_message(error_msg, "❌")
+                        continue
+            
+            shard_plan = SweepScheduler().shard_for(all_configs, self.shard_index, self.num_shards)
+            log_message(f"📋 Scheduled {len(shard_plan)} of {len(all_configs)} configurations for shard {self.shard_index + 1} of {self.num_shards}", "📋")
+            
+            plan = []
+            for config_path in shard_plan:
+                exists, config_hash = self.result_manager.check_hash_exists(all_configs[config_path])
+                if exists and not overwrite_enabled.value:
+                    log_message(f"Result already exists for {os.path.basename(config_path)} (hash: {config_hash}). Skipping...", "⏭️")
+                    continue
+                plan.append(config_path)
+            
+            # Consecutive configs sharing preprocessed data are evaluated concurrently in batches
+            batches = []
+            for config_path in plan:
+                if batches and fingerprints[batches[-1][-1]] == fingerprints[config_path] and len(batches[-1]) < self.BATCH_SIZE:
+                    batches[-1].append(config_path)
+                else:
+                    batches.append([config_path])
+            
+            preprocessed = set()
+            for batch_number, batch in enumerate(batches, 1):
+                fingerprint = fingerprints[batch[0]]
+                batch_message = f"📋 Processing batch {batch_number} of {len(batches)} (preprocessing {fingerprint}):\n"
+                for config_path in batch:
+                    batch_message += f"• {os.path.basename(config_path)}\n"
+                log_message(batch_message, "📋")
+                
+                should_preprocess = preprocessing_enabled.value and fingerprint not in preprocessed
+                preprocessed.add(fingerprint)
+                if should_preprocess:
+                    log_message(f"Preprocessing data for {fingerprint}", "🔄")
+                log_message(f"Running tests with prompts on {len(batch)} configurations...", "▶️")
+                batch_results = runner.evaluate_configs(
+                    [all_configs[config_path] for config_path in batch], prompts,
+                    preprocess=should_preprocess, return_exceptions=True
+                )
+                
+                for config_path, results in zip(batch, batch_results):
+                    config_name = os.path.basename(config_path)
+                    if isinstance(results, Exception):
+                        error_msg = f"Error processing {config_name}:\n{str(results)}"
+                        print(error_msg)
+                        log_message(error_msg, "❌")
+                        continue
+                    try:
+                        prompt_results = {prompt: result for prompt, result in zip(prompts, results)}
+                        
+                        
+                        log_message(f"Saving results...", "💾")
+                        self.result_manager.write_result(all_configs[config_path], prompt_results)
+                        
+                        log_message(f"Completed testing: {config_name}", "✅")
+                    except Exception as e:
+                        error_msg = f"Error processing {config_name}:\n{str(e)}"
+                        print(error_msg)
+                        log_message(error_msg, "❌")
+                        continue
             
             log_message("All tests completed successfully!", "✅")
             
@@ -539,7 +546,10 @@ current_dir = os.getcwd()
 config_path = os.path.join(current_dir, "config_variations")
 print(f"Using config path: {config_path}")
 print(f"Config path exists: {os.path.exists(config_path)}")
-runner = TestConfigRunner(config_path, discord_webhook_url="https://discord.com/api/webhooks/")
+runner = TestConfigRunner(
+    config_path, discord_webhook_url="https://discord.com/api/webhooks/",
+    shard_index=int(os.environ.get("SWEEP_SHARD_INDEX", 0)), num_shards=int(os.environ.get("SWEEP_NUM_SHARDS", 1))
+)
 print("TestConfigRunner instance created")
 runner.select_test_types()
 
@@ -29,6 +29,7 @@ def parse_arguments():
     parser.add_argument("--preprocess", action="store_true", help="Preprocess the data")
     parser.add_argument("--proceed", action="store_true", help="Allows program to proceed after preprocessing")
     parser.add_argument("--skip-confirmation", action="store_true", help="Skip confirmation prompts during preprocessing")
+    parser.add_argument("--force", action="store_true", help="Preprocess even if this configuration has already been preprocessed")
     return parser.parse_args()
 
 def initialize_psycore(args):
@@ -40,7 +41,7 @@ def process_prompt(base_prompt, psycore_instance, rag_elaborator):
     elaborated_prompt = rag_elaborator.elaborate(base_prompt)
     chosen_rag_prompt, _ = prompt_stage.decide_between_prompts(base_prompt, elaborated_prompt)
     
-    rag_stage = RAGStage(psycore_instance.vdb, 5)
+    rag_stage = RAGStage(psycore_instance.vdb, 5, psycore_instance.chunk_store)
     rag_results = rag_stage.get_rag_prompt_filtered(chosen_rag_prompt, psycore_instance.rag_text_similarity_threshold)
     
     rag_chat_results = psycore_instance.rag_chat.chat(base_prompt, rag_results)
@@ -68,7 +69,7 @@ def s3_uri_to_link(s3_uri):
 
 def initialize_session(psycore_instance, args):
     if args.preprocess:
-        psycore_instance.preprocess(skip_confirmation=args.skip_confirmation)
+        psycore_instance.preprocess(skip_confirmation=args.skip_confirmation, force=args.force)
         if not args.proceed:
             exit(0)
     
@@ -1,18 +1,21 @@
 from src.system_manager import LocalCredentials, ConfigManager, LoggerController
-from src.data.s3_handler import S3Handler, S3Bucket
-from src.data.s3_quick_fetch import S3QuickFetch
-from src.kg import BERT_KG, LLM_KG, dict_data_to_relations
-from src.llm import ModelCatalogue, EmbeddingType
-from src.llm.wrappers import ChatModelWrapper, EmbeddingWrapper
-from src.vector_database import CLIPEmbedder, LangchainEmbedder, AWSEmbedder, PineconeService, Embedder, VectorService
+from src.data.s3_handler import S3Bucket
+from src.kg import dict_data_to_relations
+from src.llm.rate_limiter import RateLimiter
+from src.llm.response_cache import ResponseCache
+from src.vector_database import Embedder, VectorService, ChunkStore
 from src.preprocessing.file_preprocessor import FilePreprocessor
+from src.preprocessing.artifact_cache import ArtifactCache
+from src.component_factory import ComponentFactory
 from src.main import PromptStage, Elaborator, RAGElaborator, UserPromptElaboration
 from src.main import RAGStage, RAGChatStage, IterativeStage
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from src.evaluation import BERTEvaluator, RougeEvaluator, GraphEvaluator
 import logging
 import sys
 import json
+import time
 from src.evaluation import GraphEvaluator, RougeEvaluator, BERTEvaluator
 parser = argparse.ArgumentParser()
 
@@ -30,8 +33,9 @@ class Psycore:
             "graphs": LocalCredentials.get_credential('S3_GRAPHS_BUCKET').secret_key
             }
         }
-        self.s3_handler = S3Handler(self.s3_creds)
-        self.s3_quick_fetch = S3QuickFetch(self.s3_handler)
+        self.s3_handler = ComponentFactory.s3_handler(self.s3_creds, self.preprocessing_fingerprint)
+        self.s3_quick_fetch = ComponentFactory.s3_quick_fetch(self.s3_handler)
+        self.chunk_store = ComponentFactory.chunk_store(self.s3_handler, self.preprocessing_fingerprint)
         self.logger.debug("Exiting init_s3")
 
     def init_config(self,config_path=None):
@@ -47,76 +51,81 @@ class Psycore:
         self.loop_retries = config.get_iteration_loop_retries()
         self.iterator_pass_threshold = config.get_iteration_pass_threshold()
         self.rag_text_similarity_threshold = config.get_rag_text_similarity_threshold()
-        primaryModelType = config.get_model()
-        if config.get_embedding_method() == "langchain":
-            try:
-                modelType = ModelCatalogue.get_MEmbeddings()[config.get_embedding_model()]
-                self.embedding_wrapper = EmbeddingWrapper(modelType)
-                self.embedder = LangchainEmbedder(self.embedding_wrapper)
-            except KeyError:
-                raise ValueError(f"Embedding model type '{config.get_embedding_model()}' is not recognized in the ModelCatalogue as a multimodal embedding. \nOptions are {list(ModelCatalogue.get_MEmbeddings().keys())}")
-        elif config.get_embedding_method() == "aws":
-            self.embedder = AWSEmbedder(config.get_embedding_model())
-        elif config.get_embedding_method() == "clip":
-            self.embedder = CLIPEmbedder()
-        try:
-            modelType = ModelCatalogue.get_MLLMs()[primaryModelType]
-            self.main_wrapper = ChatModelWrapper(modelType)
-        except KeyError:
-            raise ValueError(f"Model type '{primaryModelType}' is not recognized in the ModelCatalogue as an MLLM. \nOptions are {list(ModelCatalogue.get_MLLMs().keys())}")
+        self.relation_normalise = config.is_relation_normalisation_enabled()
+        self.relation_similarity_threshold = config.get_relation_similarity_threshold()
+        # Configs with the same fingerprint share their vectors and S3 artefacts
+        self.preprocessing_fingerprint = config.get_preprocessing_fingerprint()
+        self.artifact_cache_path = config.get_artifact_cache_path() if config.is_artifact_cache_enabled() else None
+        self.prompt_workers = config.get_evaluation_prompt_workers()
+        self.config_workers = config.get_evaluation_config_workers()
+        RateLimiter.configure(config.get_rate_limits())
+        ResponseCache.configure(config.is_llm_cache_enabled(), config.get_llm_cache_path(), config.get_llm_cache_ttl_seconds(), config.get_llm_cache_max_entries())
+        # Components are built through the factory so configs sharing settings reuse the same models and clients
+        rate_limits = config.get_rate_limits()
+        self.embedder = ComponentFactory.embedder(config)
+        self.main_wrapper = ComponentFactory.chat_model(config.get_model(), rate_limits)
         if config.get_text_summariser_model() is not None:
-            modelType = ModelCatalogue.get_MLLMs()[config.get_text_summariser_model()]
-            self.text_summariser = ChatModelWrapper(modelType)
+            self.text_summariser = ComponentFactory.chat_model(config.get_text_summariser_model(), rate_limits)
         else:
             self.text_summariser = self.main_wrapper
         if config.get_elaborator_model() is not None:
-            modelType = ModelCatalogue.get_MLLMs()[config.get_elaborator_model()]
-            self.elaborator_model = ChatModelWrapper(modelType)
+            self.elaborator_model = ComponentFactory.chat_model(config.get_elaborator_model(), rate_limits)
         else:
             self.elaborator_model = self.main_wrapper
         self.allow_mllm_images = config.allow_images()
-        if config.is_graph_verification_enabled() == True:
-            graphModel = config.get_graph_method()
-            if graphModel == "llm":
-                graphModelName = config.get_graph_llm_model()
-                try:
-                    modelType = ModelCatalogue.get_models_with_json_schema()[graphModelName]
-                    wrapper = ChatModelWrapper(modelType)
-                    self.graphModel = LLM_KG(wrapper, self.embedder)
-                except KeyError:
-                    raise ValueError(f"Graph model type '{graphModelName}' is not recognized in the ModelCatalogue as with json schema encoding.\n Options are {list(ModelCatalogue.get_models_with_json_schema().keys())}")
-
-            elif graphModel == "bert":
-                self.graphModel = BERT_KG()
-        else:
-            self.graphModel = None
+        self.graphModel = ComponentFactory.graph_model(config, self.embedder)
         self.prompt_style = config.get_prompt_mode()
         self.logger.debug("Exiting init_config")
 
     def init_vector_database(self):
         self.logger.debug("Entering init_vector_database")
-        self.vdb = PineconeService(self.embedder, {
-            "index_name": LocalCredentials.get_credential('PINECONE_INDEX').secret_key,
-            "api_key": LocalCredentials.get_credential('PINECONE_API_KEY').secret_key,
-            "aws_region": LocalCredentials.get_credential('PINECONE_REGION').secret_key
-        })
+        self.vdb = ComponentFactory.pinecone_service(self.embedder, self.preprocessing_fingerprint)
         self.logger.debug("Exiting init_vector_database")
 
-    def preprocess(self, skip_confirmation=False):
+    def is_preprocessed(self) -> bool:
+        """Whether a preprocessing run for this config's fingerprint finished, vectors left by a crashed run don't count."""
+        manifest = self.s3_handler.download_preprocessing_manifest()
+        return manifest is not None and manifest.get("fingerprint") == self.preprocessing_fingerprint
+
+    def preprocess(self, skip_confirmation=False, force=False) -> bool:
+        """
+        Preprocesses the documents into this config's namespace, skipped if a previous run completed unless force is set.
+        :return: Whether this config's data is preprocessed afterwards.
+        """
+        if not force and self.is_preprocessed():
+            print(f"Preprocessed data for this configuration ({self.preprocessing_fingerprint}) already exists, skipping preprocessing.")
+            return True
         if not skip_confirmation:
-            confirmation = input("Are you sure you want to preprocess the data? This will delete all existing data from the VDB and S3 buckets. (y/n): ")
+            confirmation = input(f"Are you sure you want to preprocess the data? This will delete existing data for this configuration ({self.preprocessing_fingerprint}) from the VDB and S3 buckets. (y/n): ")
             if confirmation != "y":
                 print("Preprocessing cancelled.")
-                return
+                return False
         self.logger.debug("Entering preprocess")
+        # Removed first so the data only counts as preprocessed again once this run completes
+        self.s3_handler.delete_preprocessing_manifest()
         self.vdb.reset_data()
         self.s3_handler.reset_buckets()
-        self.file_preprocessor = FilePreprocessor(self.s3_handler, self.vdb, self.embedder,self.text_summariser, self.graphModel)
+        self.chunk_store.reset()
+        # Image paths are reused between preprocessing runs so any cached images are now stale
+        self.s3_quick_fetch.clear_image_cache()
+        self.rag_chat.s3_quick_fetch.clear_image_cache()
+        artifact_cache = ArtifactCache(self.artifact_cache_path) if self.artifact_cache_path is not None else None
+        self.file_preprocessor = FilePreprocessor(self.s3_handler, self.vdb, self.embedder,self.text_summariser, self.graphModel, self.chunk_store, artifact_cache)
         files = self.s3_handler.list_base_directory_files(S3Bucket.DOCUMENTS) 
         if self.document_ids is not None and len(self.document_ids) > 0:
             files = [files[i] for i in self.document_ids]
-        self.file_preprocessor.process_files(files)
+        try:
+            self.file_preprocessor.process_files(files)
+        finally:
+            if artifact_cache is not None:
+                artifact_cache.close()
+        self.s3_handler.upload_preprocessing_manifest({
+            "fingerprint": self.preprocessing_fingerprint,
+            "documents": files,
+            "completed": time.time(),
+        })
         self.logger.debug("Exiting preprocess")
+        return True
 
 
     def process_prompt(self, base_prompt, rag_elaborator : Elaborator = None):
@@ -124,47 +133,70 @@ class Psycore:
         prompt_stage = PromptStage(None, self.prompt_style)
         elaborated_prompt = rag_elaborator.elaborate(base_prompt)
         chosen_rag_prompt, elaborated = prompt_stage.decide_between_prompts(base_prompt, elaborated_prompt)
-        rag_stage = RAGStage(self.vdb, 5)
+        rag_stage = RAGStage(self.vdb, 5, self.chunk_store)
         rag_results = rag_stage.get_rag_prompt_filtered(chosen_rag_prompt, self.rag_text_similarity_threshold)
         rag_chat_results = self.rag_chat.chat(base_prompt, rag_results)
         rag_elaborator.queue_history(rag_chat_results.content)
         print(f"Output:\n{rag_chat_results.content}\nSource:\n{[(result['document_path'], result['vector_id'], result['score']) for result in rag_results]}\nRAG Prompt:\n{chosen_rag_prompt}")
         self.logger.debug("Exiting process_prompt")
 
-    def evaluate_prompt(self, base_prompt) -> dict:
-        logger = LoggerController.get_logger()
+    def choose_prompt(self, base_prompt) -> tuple[str, str]:
+        """
+        Elaborates a prompt and picks the prompt to retrieve with.
+        :return: Tuple of the elaborated prompt and the chosen prompt.
+        """
         prompt_stage = PromptStage(None, self.prompt_style)
         elaborator = RAGElaborator(self.elaborator_model)
         elaborated_prompt = elaborator.elaborate(base_prompt)
         chosen_prompt, elaborated = prompt_stage.decide_between_prompts(base_prompt, elaborated_prompt)
-        rag_stage = RAGStage(self.vdb, 5)
+        return elaborated_prompt, chosen_prompt
+
+    def evaluate_prompt(self, base_prompt, rag_chat: RAGChatStage = None) -> dict:
+        """
+        Runs a prompt through the full pipeline and evaluates the RAG results.
+        :param base_prompt: The user's prompt.
+        :param rag_chat: Chat stage to answer with, defaults to the shared one whose history carries over between prompts.
+        :return: Results dict.
+        """
+        elaborated_prompt, chosen_prompt = self.choose_prompt(base_prompt)
+        rag_stage = RAGStage(self.vdb, 5, self.chunk_store)
         rag_results = rag_stage.get_rag_prompt_filtered(chosen_prompt, self.rag_text_similarity_threshold)
-        rag_chat_results = self.rag_chat.chat(base_prompt, rag_results)
+        return self.evaluate_retrieved_prompt(base_prompt, elaborated_prompt, chosen_prompt, rag_results, rag_chat)
+
+    def evaluate_retrieved_prompt(self, base_prompt, elaborated_prompt, chosen_prompt, rag_results: list[dict], rag_chat: RAGChatStage = None) -> dict:
+        """
+        Answers a prompt from its retrieved results, verifies the answer and evaluates the RAG results.
+        :param rag_chat: Chat stage to answer with, defaults to the shared one whose history carries over between prompts.
+        :return: Results dict.
+        """
+        if rag_chat is None:
+            rag_chat = self.rag_chat
+        logger = LoggerController.get_logger()
+        rag_chat_results = rag_chat.chat(base_prompt, rag_results)
         
         logger.info(rag_results)
         logger.info("Evaluating RAG results")
 
-        iterative_stage = IterativeStage(self.s3_quick_fetch, self.graphModel, self.iterator_pass_threshold,rag_results)
+        iterative_stage = IterativeStage(self.s3_quick_fetch, self.graphModel, self.iterator_pass_threshold,rag_results, self.relation_normalise, self.embedder, self.relation_similarity_threshold)
         stage_results = iterative_stage.decision_maker(rag_results,rag_chat_results)
         retry_count = 0
         while len(stage_results[1]) > 0 and retry_count < self.loop_retries:
             missing_relations = stage_results[1]
             string_relations = [ str(relation) for relation in missing_relations]
-            rag_chat_results = self.rag_chat.chat(base_prompt + ", bear in mind: " + ", ".join(string_relations), rag_results)
+            rag_chat_results = rag_chat.chat(base_prompt + ", bear in mind: " + ", ".join(string_relations), rag_results)
             stage_results = iterative_stage.decision_maker(rag_results,rag_chat_results)
             retry_count += 1
         print(stage_results)
         (threshold, valid_relations, missing_relations) = stage_results
         evaluators = [
-            GraphEvaluator(iterative_stage, self.graphModel),
+            # Evaluation matches relations under the same rules as verification
+            GraphEvaluator(iterative_stage, self.graphModel, normalise=self.relation_normalise),
             BERTEvaluator(iterative_stage),
             RougeEvaluator(iterative_stage)
         ]
-        for i in range(len(rag_results)):
-            logger.info(f"Evaluating RAG result {i}")
-            for evaluator in evaluators:
-                logger.info(f"Evaluating with {evaluator.__class__.__name__}")
-                rag_results[i] = evaluator.evaluate_rag_result(rag_chat_results.content, rag_results[i])
+        for evaluator in evaluators:
+            logger.info(f"Evaluating {len(rag_results)} RAG results with {evaluator.__class__.__name__}")
+            rag_results = evaluator.evaluate_rag_results(rag_chat_results.content, rag_results)
         logger.info("Finished evaluating RAG results")
         results = {
             "response": rag_chat_results.content,
@@ -176,6 +208,30 @@ class Psycore:
         }
         return results
 
+    def evaluate_prompts(self, prompts: list[str], max_workers: int = None) -> list[dict]:
+        """
+        Evaluates several prompts concurrently. Each prompt gets its own chat history,
+        so results match evaluating them one at a time and don't depend on the order they finish in.
+        Retrieval for all the prompts is done in one batch once they've been elaborated.
+        :param prompts: Prompts to evaluate.
+        :param max_workers: Prompts evaluated at once, defaults to evaluation.prompt_workers.
+        :return: Results in the same order as prompts.
+        """
+        if max_workers is None:
+            max_workers = self.prompt_workers
+        if len(prompts) == 0:
+            return []
+        # Model calls from every worker go through the shared rate limiters
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(prompts)))) as executor:
+            chosen = list(executor.map(self.choose_prompt, prompts))
+            rag_stage = RAGStage(self.vdb, 5, self.chunk_store)
+            all_rag_results = rag_stage.get_rag_prompts_filtered([chosen_prompt for _, chosen_prompt in chosen], self.rag_text_similarity_threshold)
+            def evaluate(i):
+                elaborated_prompt, chosen_prompt = chosen[i]
+                rag_chat = RAGChatStage(self.main_wrapper, self.s3_handler, self.s3_quick_fetch)
+                return self.evaluate_retrieved_prompt(prompts[i], elaborated_prompt, chosen_prompt, all_rag_results[i], rag_chat)
+            return list(executor.map(evaluate, range(len(prompts))))
+
 
     def __init__(self, config_path=None):
 
@@ -202,10 +258,11 @@ if __name__ == "__main__":
     parser.add_argument("--preprocess", action="store_true", help="Preprocess the data")
     parser.add_argument("--proceed", action="store_true", help="If preprocessing, allows program to work as normal afterwards rather than only preprocessing")
     parser.add_argument("--skip-confirmation", action="store_true", help="Skip confirmation prompts during preprocessing")
+    parser.add_argument("--force", action="store_true", help="Preprocess even if this configuration has already been preprocessed")
     args = parser.parse_args()
     psycore = Psycore(args.config)
     if args.preprocess:
-        psycore.preprocess(skip_confirmation=args.skip_confirmation)
+        psycore.preprocess(skip_confirmation=args.skip_confirmation, force=args.force)
         if not args.proceed:
             exit(0)
     else:
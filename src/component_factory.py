@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from src.system_manager import ConfigManager, LocalCredentials, LoggerController
+from src.data.s3_handler import S3Handler
+from src.data.s3_quick_fetch import S3QuickFetch
+from src.kg import BERT_KG, LLM_KG
+from src.llm import ModelCatalogue
+from src.llm.wrappers import ChatModelWrapper, EmbeddingWrapper
+from src.vector_database import CLIPEmbedder, LangchainEmbedder, AWSEmbedder, PineconeService, Embedder, ChunkStore
+
+logger = LoggerController.get_logger()
+
+class ComponentFactory:
+    """
+    Builds Psycore's components, reusing ones already built from the same settings.
+    Sweeps create a Psycore per config, and without this every config reloads models and reconnects to AWS and Pinecone.
+    Components are keyed by the part of the config they are built from, so changing one setting only rebuilds what uses it.
+    """
+    _components = {}
+    _lock = threading.RLock()
+
+    @staticmethod
+    def _key(*parts) -> str:
+        return json.dumps(parts, sort_keys=True, default=str)
+
+    @staticmethod
+    def get(kind: str, key: str, create):
+        """
+        Gets the component of this kind built with key, calling create to build it the first time.
+        """
+        with ComponentFactory._lock:
+            component = ComponentFactory._components.get((kind, key))
+            if component is None:
+                logger.debug(f"Building {kind} for {key}")
+                component = create()
+                ComponentFactory._components[(kind, key)] = component
+            else:
+                logger.debug(f"Reusing {kind} for {key}")
+            return component
+
+    @staticmethod
+    def clear():
+        """Drops every built component, e.g. to free models no longer used by a sweep."""
+        with ComponentFactory._lock:
+            ComponentFactory._components.clear()
+
+    @staticmethod
+    def chat_model(model_name: str, rate_limits: dict = None) -> ChatModelWrapper:
+        """
+        :param model_name: ModelCatalogue MLLM name.
+        :param rate_limits: The configured rate limits, wrappers take their limiter when built so they're rebuilt if these change.
+        """
+        def create():
+            try:
+                return ChatModelWrapper(ModelCatalogue.get_MLLMs()[model_name])
+            except KeyError:
+                raise ValueError(f"Model type '{model_name}' is not recognized in the ModelCatalogue as an MLLM. \nOptions are {list(ModelCatalogue.get_MLLMs().keys())}")
+        return ComponentFactory.get("chat_model", ComponentFactory._key(model_name, rate_limits), create)
+
+    @staticmethod
+    def embedder(config: ConfigManager) -> Embedder:
+        method = config.get_embedding_method()
+        if method == "langchain":
+            def create():
+                try:
+                    modelType = ModelCatalogue.get_MEmbeddings()[config.get_embedding_model()]
+                except KeyError:
+                    raise ValueError(f"Embedding model type '{config.get_embedding_model()}' is not recognized in the ModelCatalogue as a multimodal embedding. \nOptions are {list(ModelCatalogue.get_MEmbeddings().keys())}")
+                return LangchainEmbedder(EmbeddingWrapper(modelType))
+            key = ComponentFactory._key(method, config.get_embedding_model(), config.get_rate_limits())
+        elif method == "aws":
+            create = lambda: AWSEmbedder(config.get_embedding_model())
+            key = ComponentFactory._key(method, config.get_embedding_model(), config.get_rate_limits())
+        elif method == "clip":
+            create = lambda: CLIPEmbedder(config.get_clip_backend())
+            key = ComponentFactory._key(method, config.get_clip_backend())
+        return ComponentFactory.get("embedder", key, create)
+
+    @staticmethod
+    def graph_model(config: ConfigManager, embedder: Embedder):
+        """Gets the graph creator for the config, or None when graph verification is disabled."""
+        if not config.is_graph_verification_enabled():
+            return None
+        graphModel = config.get_graph_method()
+        if graphModel == "llm":
+            graphModelName = config.get_graph_llm_model()
+            def create():
+                try:
+                    modelType = ModelCatalogue.get_models_with_json_schema()[graphModelName]
+                except KeyError:
+                    raise ValueError(f"Graph model type '{graphModelName}' is not recognized in the ModelCatalogue as with json schema encoding.\n Options are {list(ModelCatalogue.get_models_with_json_schema().keys())}")
+                return LLM_KG(ComponentFactory.chat_model(graphModelName, config.get_rate_limits()), embedder)
+            key = ComponentFactory._key(graphModel, graphModelName, embedder.embedding_key(), config.get_rate_limits())
+        elif graphModel == "bert":
+            settings = config.get_bert_kg_settings()
+            create = lambda: BERT_KG(**settings)
+            key = ComponentFactory._key(graphModel, settings)
+        return ComponentFactory.get("graph_model", key, create)
+
+    @staticmethod
+    def s3_handler(creds: dict, key_prefix: str = "") -> S3Handler:
+        # The AWS session is shared between prefixes, each prefix only gets a lightweight copy of the handler
+        base = ComponentFactory.get(
+            "s3_handler", ComponentFactory._key(creds["aws_iam"].user_key, creds["region"]),
+            lambda: S3Handler(creds)
+        )
+        if key_prefix == base.key_prefix:
+            return base
+        return ComponentFactory.get(
+            "s3_handler", ComponentFactory._key(creds["aws_iam"].user_key, creds["region"], key_prefix),
+            lambda: base.with_key_prefix(key_prefix)
+        )
+
+    @staticmethod
+    def s3_quick_fetch(s3_handler: S3Handler) -> S3QuickFetch:
+        return ComponentFactory.get("s3_quick_fetch", ComponentFactory._key(id(s3_handler)), lambda: S3QuickFetch(s3_handler))
+
+    @staticmethod
+    def chunk_store(s3_handler: S3Handler, fingerprint: str) -> ChunkStore:
+        directory = os.path.join(ChunkStore.DEFAULT_DIR, fingerprint)
+        return ComponentFactory.get("chunk_store", ComponentFactory._key(id(s3_handler), directory), lambda: ChunkStore(s3_handler, directory))
+
+    @staticmethod
+    def pinecone_service(embedder: Embedder, namespace: str) -> PineconeService:
+        credentials = {
+            "index_name": LocalCredentials.get_credential('PINECONE_INDEX').secret_key,
+            "api_key": LocalCredentials.get_credential('PINECONE_API_KEY').secret_key,
+            "aws_region": LocalCredentials.get_credential('PINECONE_REGION').secret_key
+        }
+        key = ComponentFactory._key(credentials["index_name"], id(embedder), namespace)
+        return ComponentFactory.get("pinecone_service", key, lambda: PineconeService(embedder, credentials, namespace=namespace))
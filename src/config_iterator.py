@@ -1,10 +1,13 @@
 import yaml
 import itertools
-from typing import Dict, List, Any, Tuple
+import math
+from typing import Dict, Iterator, List, Any, Tuple
 import os
 from pathlib import Path
 from src.llm.model_catalogue import ModelCatalogue
-import hashlib
+
+# Marks a setting to remove from a generated config
+_REMOVE = object()
 
 class ConfigIterator:
     # Static model lists
@@ -48,6 +51,15 @@ class ConfigIterator:
         "graph_verification.method": ["llm", "bert"]
     }
     
+    # Settings with no effect for some values of another, as (setting, controlling setting, check on its value)
+    IRRELEVANT_WHEN = [
+        ("prompt_mode.elaborator_model", "prompt_mode.mode", lambda mode: mode == "original"),
+    ]
+    # Opt in with prune_retries, these used to be written as separate configs
+    IRRELEVANT_WHEN_PRUNING_RETRIES = [
+        ("iteration.loop_retries", "iteration.pass_threshold", lambda threshold: threshold == 0),
+    ]
+
     def __init__(self, base_config_path: str = "../config.yaml"):
         """Initialize the config iterator with a base configuration file."""
         self.base_config_path = base_config_path
@@ -58,11 +70,6 @@ class ConfigIterator:
         with open(config_path, 'r') as f:
             return yaml.safe_load(f)
     
-    def _hash_config(self, config: Dict) -> str:
-        """Generate a hash of the config content."""
-        config_str = yaml.dump(config, sort_keys=True)
-        return hashlib.md5(config_str.encode()).hexdigest()
-
     def _get_model_category(self, config: Dict) -> str:
         """Determine the category of models used in the config."""
         models_used = set()
@@ -155,23 +162,17 @@ class ConfigIterator:
             
         return category, method_folder
 
-    def _save_config(self, config: Dict, output_path: str, written_hashes: Dict[str, str]) -> bool:
+    def _save_config(self, config: Dict, output_path: str) -> str:
         """
-        Save a configuration to a YAML file if it hasn't been written before.
+        Save a configuration to a YAML file in the folder for its model category and methods.
         
         Args:
             config: The configuration to save
             output_path: Path where to save the config
-            written_hashes: Dictionary tracking hashes of written configs
             
         Returns:
-            bool: True if config was written, False if it was a duplicate
+            str: The path the config was written to
         """
-        config_hash = self._hash_config(config)
-        if config_hash in written_hashes:
-            print(f"Skipping duplicate config (matches {written_hashes[config_hash]})")
-            return False
-            
         # Create directory structure
         category, method_folder = self._get_folder_structure(config)
         full_path = os.path.join(
@@ -186,111 +187,124 @@ class ConfigIterator:
         
         with open(new_output_path, 'w') as f:
             yaml.dump(config, f, default_flow_style=False)
-        written_hashes[config_hash] = new_output_path
-        return True
-
-    def _handle_original_mode(self, new_config: Dict) -> None:
-        """Handle the case where prompt_mode.mode is 'original' by reverting elaborator_model."""
-        try:
-            if (
-                'prompt_mode' in new_config and
-                'mode' in new_config['prompt_mode'] and
-                new_config['prompt_mode']['mode'] == 'original'
-            ):
-                base_elab = self.base_config.get('prompt_mode', {}).get('elaborator_model', None)
-                if base_elab is not None:
-                    new_config['prompt_mode']['elaborator_model'] = base_elab
-                elif 'elaborator_model' in new_config['prompt_mode']:
-                    del new_config['prompt_mode']['elaborator_model']
-        except Exception as e:
-            print(f"Warning: Could not check/revert elaborator_model: {e}")
+        return new_output_path
 
-    def _handle_embedding_method(self, new_config: Dict) -> None:
-        """Handle embedding method-specific configurations."""
-        if "embedding.method" not in new_config:
-            return
+    def _base_value(self, key: str):
+        """The base config's value of a dotted setting, or _REMOVE when it has none."""
+        current = self.base_config
+        for part in key.split('.'):
+            if not isinstance(current, dict) or current.get(part) is None:
+                return _REMOVE
+            current = current[part]
+        return current
 
-        method = new_config["embedding"]["method"]
-        if method == "aws":
-            new_config["embedding"]["model"] = "amazon.titan-embed-image-v1"
-        elif method == "clip" and "model" in new_config["embedding"]:
-            del new_config["embedding"]["model"]
+    def _irrelevant_rules(self, prune_retries: bool) -> List[Tuple[str, str, Any]]:
+        return self.IRRELEVANT_WHEN + (self.IRRELEVANT_WHEN_PRUNING_RETRIES if prune_retries else [])
 
-    def _handle_graph_verification(self, new_config: Dict, output_dir: str, config_count: int, written_hashes: Dict[str, str]) -> int:
-        """Handle graph verification method-specific configurations and save configs."""
-        if "graph_verification.method" not in new_config:
-            config_count += 1
-            output_path = os.path.join(output_dir, f"config_variation_{config_count}.yaml")
-            if self._save_config(new_config, output_path, written_hashes):
-                print(f"Generated config variation {config_count}")
-            return config_count
+    def _iter_combinations(self, variations: Dict[str, List[Any]], prune_retries: bool = False) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Lazily walks the combinations of variations in itertools.product order, numbered from 1 by their position.
+        A setting made irrelevant by another is reverted to the base config's value and only its first value is kept,
+        the combinations that are skipped would give the same config as the one kept.
+        """
+        rules = self._irrelevant_rules(prune_retries)
+        keys = list(variations.keys())
+        for index, combination in enumerate(itertools.product(*variations.values()), 1):
+            values = dict(zip(keys, combination))
+            for setting, controlling_setting, is_irrelevant in rules:
+                control_value = values[controlling_setting] if controlling_setting in values else self._base_value(controlling_setting)
+                if not is_irrelevant(control_value):
+                    continue
+                if setting in values and values[setting] != variations[setting][0]:
+                    break
+                values[setting] = self._base_value(setting)
+            else:
+                yield index, values
 
-        method = new_config["graph_verification"]["method"]
-        if method == "llm":
-            for json_model in self.JSON_FRIENDLY_MODELS:
-                llm_config = self._deep_copy_config(new_config)
-                llm_config["graph_verification"]["llm_model"] = json_model
-                config_count += 1
-                output_path = os.path.join(output_dir, f"config_variation_{config_count}.yaml")
-                if self._save_config(llm_config, output_path, written_hashes):
-                    print(f"Generated config variation {config_count}")
-        elif method == "bert":
-            if "llm_model" in new_config["graph_verification"]:
-                del new_config["graph_verification"]["llm_model"]
-            config_count += 1
-            output_path = os.path.join(output_dir, f"config_variation_{config_count}.yaml")
-            if self._save_config(new_config, output_path, written_hashes):
-                print(f"Generated config variation {config_count}")
+    def iter_variations(self, variations: Dict[str, List[Any]], prune_retries: bool = False) -> Iterator[Tuple[int, Dict]]:
+        """
+        Lazily generates every distinct configuration, one at a time and in the order get_all_variations writes them.
+        
+        Args:
+            variations: Dictionary mapping config paths to lists of possible values
+            prune_retries: Also treat loop_retries as irrelevant with a pass threshold of 0, which the original generator didn't
+        
+        Yields:
+            The position of the configuration's combination, counting from 1, and the configuration,
+            which shares unchanged sections with the base config so must not be modified
+        """
+        # Canonical combinations only repeat when a value is listed twice, so they're compared before any config is built
+        seen = set()
+        for index, values in self._iter_combinations(variations, prune_retries):
+            combination = tuple(values.items())
+            if combination in seen:
+                continue
+            seen.add(combination)
+            yield index, self._with_values(self.base_config, values)
 
-        return config_count
+    def estimate_count(self, variations: Dict[str, List[Any]], prune_retries: bool = False) -> int:
+        """
+        Counts the configurations iter_variations generates without enumerating them.
+        Exact unless a value is listed twice.
+        """
+        sizes = {key: len(values) for key, values in variations.items()}
+        total = 1
+        for setting, controlling_setting, is_irrelevant in self._irrelevant_rules(prune_retries):
+            setting_size = sizes.pop(setting, 1)
+            if controlling_setting in variations:
+                control_values = variations[controlling_setting]
+                sizes.pop(controlling_setting)
+            else:
+                control_values = [self._base_value(controlling_setting)]
+            # An irrelevant setting keeps a single value
+            total *= sum(min(1, setting_size) if is_irrelevant(value) else setting_size for value in control_values)
+        return total * math.prod(sizes.values())
 
-    def get_all_variations(self, variations: Dict[str, List[Any]], output_dir: str = "config_variations") -> int:
+    def get_all_variations(self, variations: Dict[str, List[Any]], output_dir: str = "config_variations", prune_retries: bool = False) -> int:
         """
-        Generate all possible configuration variations and write them to files as they are produced.
+        Generate all distinct configuration variations and write them to files as they are produced.
+        Each file is numbered by the position of its combination, so names stay the same when duplicates are skipped.
         
         Args:
             variations: Dictionary mapping config paths to lists of possible values
                       e.g., {"model.primary": ["oai_4o_latest", "gpt-3.5-turbo"]}
             output_dir: Directory to save the generated config files
+            prune_retries: Skip loop_retries variations with a pass threshold of 0, where they have no effect
         
         Returns:
-            Number of configurations generated
+            Number of configuration combinations, including duplicates that weren't written
         """
         os.makedirs(output_dir, exist_ok=True)
+        print(f"Generating {self.estimate_count(variations, prune_retries)} config variations")
         
-        keys = list(variations.keys())
-        values = list(variations.values())
-        combinations = list(itertools.product(*values))
-        
-        config_count = 0
-        written_hashes = {}  # Track hashes of written configs
+        for index, config in self.iter_variations(variations, prune_retries):
+            output_path = os.path.join(output_dir, f"config_variation_{index}.yaml")
+            self._save_config(config, output_path)
+            print(f"Generated config variation {index}")
         
-        for combination in combinations:
-            new_config = self._deep_copy_config(self.base_config)
-            
-            # Apply the variation
-            for key, value in zip(keys, combination):
-                self._set_nested_value(new_config, key.split('.'), value)
-
-            # Handle special cases
-            self._handle_original_mode(new_config)
-            self._handle_embedding_method(new_config)
-            config_count = self._handle_graph_verification(new_config, output_dir, config_count, written_hashes)
-        
-        return config_count
+        return math.prod(len(values) for values in variations.values())
     
-    def _deep_copy_config(self, config: Dict) -> Dict:
-        """Create a deep copy of the configuration dictionary."""
-        return yaml.safe_load(yaml.dump(config))
-    
-    def _set_nested_value(self, config: Dict, key_path: List[str], value: Any):
-        """Set a value in a nested dictionary using a list of keys."""
-        current = config
-        for key in key_path[:-1]:
-            if key not in current:
-                current[key] = {}
-            current = current[key]
-        current[key_path[-1]] = value
+    def _with_values(self, config: Dict, values: Dict[str, Any]) -> Dict:
+        """
+        Copy of config with values set by dotted path, or removed for _REMOVE.
+        Only the sections along changed paths are copied, the rest is shared with config.
+        """
+        new_config = dict(config)
+        copied = set()
+        for key, value in values.items():
+            key_path = key.split('.')
+            current = new_config
+            for depth, part in enumerate(key_path[:-1]):
+                section_path = tuple(key_path[:depth + 1])
+                if section_path not in copied:
+                    current[part] = dict(current.get(part) or {})
+                    copied.add(section_path)
+                current = current[part]
+            if value is _REMOVE:
+                current.pop(key_path[-1], None)
+            else:
+                current[key_path[-1]] = value
+        return new_config
 
 def main():
     # Example usage
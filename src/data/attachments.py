@@ -6,14 +6,17 @@ from enum import Enum
 from PIL import Image
 from io import BytesIO
 from src.llm.wrappers import ChatModelWrapper
-from src.llm.content_formatter import ContentFormatter
+from src.llm.content_formatter import ContentFormatter, IMAGE_LABEL
+from src.llm.template_cache import TemplateCache
 from .filereader import FileReader
+from .image_normaliser import ImageNormaliser
 from src.system_manager import LoggerController
 
 # Initialize the logger
 logger = LoggerController.get_logger()
 
 MAX_LLM_IMAGE_PIXELS = 512
+SUMMARY_SYSTEM_PROMPT = "You are a description generator. You will describe in as much detail as possible the image you are given. You will only respond with the description of the image."
 
 class AttachmentTypes(Enum):
     IMAGE = 1
@@ -75,36 +78,61 @@ class Attachment:
                 logger.error(f"Error extracting attachment: {str(e)}")
                 self.needs_extraction = True
 
+    @staticmethod
+    def prepare_llm_image(image_source) -> tuple[bytes, int, int]:
+        """
+        Converts an image into the JPEG that is sent to MLLMs, fitting it within MAX_LLM_IMAGE_PIXELS.
+        :param image_source: Path or file-like object of the image.
+        :return: Tuple of the JPEG bytes, width and height.
+        """
+        return ImageNormaliser.to_jpeg(image_source, MAX_LLM_IMAGE_PIXELS)
+
     def _extract_image(self):
         try: 
-            with Image.open(self.attachment_data) as img:
-                img = img.convert("RGB")
-                if (MAX_LLM_IMAGE_PIXELS != None):
-                    img = img.resize((MAX_LLM_IMAGE_PIXELS, MAX_LLM_IMAGE_PIXELS))
-                buffer = BytesIO()
-                img.save(buffer, format="JPEG")
-                self.attachment_data = base64.b64encode(buffer.getvalue()).decode("utf-8")
-                self.additional_data.update({
-                    "width": img.width,
-                    "height": img.height,
-                    "format": img.format
-                })
+            jpeg_bytes, width, height = Attachment.prepare_llm_image(self.attachment_data)
+            self.attachment_data = base64.b64encode(jpeg_bytes).decode("utf-8")
+            self.additional_data.update({
+                "width": width,
+                "height": height,
+                "format": "JPEG"
+            })
         except Exception as e:
             logger.error(f"Failed to process image: {str(e)}")
             raise FailedExtraction(self, f"Failed to process image: {str(e)}")
 
+    def _summary_template():
+        # The same template is used for every image so it is compiled once and reused
+        return TemplateCache.get(SUMMARY_SYSTEM_PROMPT, (("user", IMAGE_LABEL, 1, ""),))
+
     def text_summary(self, wrapper: ChatModelWrapper):
         if self.attachment_type != AttachmentTypes.IMAGE:
             # If the attachment is not an image, we don't need to process it as if regular text, or audio, it's already in text format
             return self.attachment_data
         else:
-            chat = ContentFormatter.format_base_chat("You are a description generator. You will describe in as much detail as possible the image you are given. You will only respond with the description of the image.")
-            chat = ContentFormatter.add_format_to_chat(chat, ContentFormatter.prep_images(1,))
             prompt_data = ContentFormatter.format_prompt(image_data=[self.attachment_data])
-            template = ContentFormatter.chat_to_template(chat)
+            template = Attachment._summary_template()
             description = ContentFormatter.chat_to_model(template, wrapper, prompt_data)
             return description.content
 
+    @staticmethod
+    def batch_text_summary(attachments: list["Attachment"], wrapper: ChatModelWrapper) -> list[str]:
+        """
+        Summarises several attachments, sending all image descriptions to the model concurrently.
+        :param attachments: List of attachments to summarise.
+        :param wrapper: Model used to describe images.
+        :return: List of summaries in the same order as attachments.
+        """
+        summaries = [attachment.attachment_data for attachment in attachments]
+        image_indexes = [i for i, attachment in enumerate(attachments) if attachment.attachment_type == AttachmentTypes.IMAGE]
+        if len(image_indexes) == 0:
+            return summaries
+        template = Attachment._summary_template()
+        prompt_data = [ContentFormatter.format_prompt(image_data=[attachments[i].attachment_data]) for i in image_indexes]
+        descriptions = ContentFormatter.batch_chat_to_model([template] * len(image_indexes), wrapper, prompt_data)
+        for i, description in zip(image_indexes, descriptions):
+            summaries[i] = description.content
+        return summaries
+
 
     def _extract_audio(self):
         # We process audio files by splitting them into smaller chunks and transcribing them using Whisper
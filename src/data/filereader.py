@@ -2,6 +2,7 @@ from PIL import Image
 import io, imagehash,base64, docx2txt,pandas # PyMuPDF
 import fitz
 from src.system_manager import LoggerController
+from .image_normaliser import ImageNormaliser
 
 logger = LoggerController.get_logger()
 
@@ -100,7 +101,7 @@ class FileReader:
                         xref = img[0]
                         base_image = doc.extract_image(xref)
                         image_bytes = base_image["image"]
-                        image = Image.open(io.BytesIO(image_bytes))
+                        image = ImageNormaliser.open_for_hash(image_bytes)
                         
                         # Ensure rectangle coordinates are properly ordered
                         x0, y0, x1, y1 = img[1:5]
@@ -120,9 +121,9 @@ class FileReader:
                             if hash_value not in processed_hashes:
                                 logger.debug(f"Found new unique image with hash {hash_value}")
                                 processed_hashes.add(hash_value)
-                                buffer = io.BytesIO()
-                                image.convert("RGB").save(buffer, format="JPEG")
-                                jpeg_data = base64.b64encode(buffer.getvalue()).decode("utf-8")
+                                # Embedded JPEGs are kept as-is, anything else is re-encoded once
+                                jpeg_bytes, _, _ = ImageNormaliser.to_jpeg(image_bytes)
+                                jpeg_data = base64.b64encode(jpeg_bytes).decode("utf-8")
                                 images.append({
                                     "page": page_num,
                                     "bbox": bbox,
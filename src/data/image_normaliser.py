@@ -0,0 +1,61 @@
+from PIL import Image
+from io import BytesIO
+from typing import BinaryIO, Union
+from src.system_manager import LoggerController
+
+logger = LoggerController.get_logger()
+
+class ImageNormaliser:
+    # Once an image is this many times larger than its target, Image.reduce is used for the bulk of the downscale before resampling
+    REDUCING_GAP = 2.0
+    # JPEGs are decoded at a reduced scale for hashing as perceptual hashes only look at a 32x32 thumbnail
+    HASH_DRAFT_PIXELS = 128
+
+    @staticmethod
+    def _read_bytes(image_source: Union[str, bytes, BinaryIO]) -> bytes:
+        if isinstance(image_source, bytes):
+            return image_source
+        if isinstance(image_source, str):
+            with open(image_source, "rb") as f:
+                return f.read()
+        image_source.seek(0)
+        return image_source.read()
+
+    @staticmethod
+    def to_jpeg(image_source: Union[str, bytes, BinaryIO], max_pixels: int | None = None) -> tuple[bytes, int, int]:
+        """
+        Converts an image to JPEG, shrinking it to fit within max_pixels while keeping its aspect ratio.
+        JPEGs that already fit are returned untouched, larger ones are decoded at a reduced scale with draft mode.
+        :param image_source: Path, bytes or file-like object of the image.
+        :param max_pixels: Maximum width and height of the output, None keeps the original size.
+        :return: Tuple of the JPEG bytes, width and height.
+        """
+        raw_bytes = ImageNormaliser._read_bytes(image_source)
+        with Image.open(BytesIO(raw_bytes)) as img:
+            width, height = img.size
+            fits = max_pixels is None or max(width, height) <= max_pixels
+            if img.format == "JPEG" and img.mode in ("RGB", "L") and fits:
+                logger.debug(f"Image is already a {width}x{height} JPEG, skipping re-encode")
+                return raw_bytes, width, height
+
+            if img.format == "JPEG" and not fits:
+                # Lets libjpeg decode at 1/2, 1/4 or 1/8 scale, never going below the requested size
+                img.draft("RGB", (max_pixels, max_pixels))
+            img = img.convert("RGB")
+            if not fits:
+                img.thumbnail((max_pixels, max_pixels), reducing_gap=ImageNormaliser.REDUCING_GAP)
+            buffer = BytesIO()
+            img.save(buffer, format="JPEG")
+            return buffer.getvalue(), img.width, img.height
+
+    @staticmethod
+    def open_for_hash(image_bytes: bytes) -> Image.Image:
+        """
+        Opens an image for perceptual hashing, using draft mode so large JPEGs aren't fully decoded.
+        :param image_bytes: Encoded image bytes.
+        :return: PIL image suitable for imagehash.
+        """
+        image = Image.open(BytesIO(image_bytes))
+        if image.format == "JPEG":
+            image.draft("L", (ImageNormaliser.HASH_DRAFT_PIXELS, ImageNormaliser.HASH_DRAFT_PIXELS))
+        return image
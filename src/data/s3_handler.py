@@ -1,3 +1,5 @@
+import copy
+import json
 import os
 import uuid
 import boto3
@@ -21,8 +23,14 @@ class S3Bucket(Enum):
 
 
 class S3Handler:
-    def __init__(self, creds={}):
+    CHUNK_STORE_PREFIX = "chunk_store"
+    # Written once preprocessing finishes, so partly preprocessed data is never mistaken for complete
+    PREPROCESSING_MANIFEST = "preprocessing_manifest.json"
+
+    def __init__(self, creds={}, key_prefix: str = ""):
         logger.debug("Entering S3Handler.__init__")
+        # Generated text, images and graphs are stored under this prefix so each preprocessing config keeps its own
+        self.key_prefix = key_prefix
         aws_cred = creds["aws_iam"]
         session = boto3.Session(
             aws_access_key_id=aws_cred.user_key,
@@ -66,6 +74,17 @@ class S3Handler:
             raise
         logger.debug("Exiting _upload_to_s3")
 
+    def with_key_prefix(self, key_prefix: str) -> "S3Handler":
+        """Copy of this handler that shares its AWS session but stores generated files under key_prefix."""
+        handler = copy.copy(self)
+        handler.key_prefix = key_prefix
+        return handler
+
+    def _key(self, key: str) -> str:
+        if self.key_prefix:
+            return f"{self.key_prefix}/{key}"
+        return key
+
     def parse_s3_uri(self, s3_uri: str) -> tuple[str, str]:
         logger.debug("Entering parse_s3_uri with s3_uri=%s", s3_uri)
         if not s3_uri.startswith('s3://'):
@@ -103,7 +122,7 @@ class S3Handler:
     def upload_document_text(self, doc_s3_link: str, text_content: str, file_type: str = "main") -> str:
         logger.debug("Entering upload_document_text with doc_s3_link=%s, file_type=%s", doc_s3_link, file_type)
         doc_id = doc_s3_link.split("/")[-1].split(".")[0]
-        key = f"{doc_id}/{file_type}.txt"
+        key = self._key(f"{doc_id}/{file_type}.txt")
         return self._upload_to_s3(S3Bucket.TEXT, key, text_content, 'text/plain')
         logger.debug("Exiting upload_document_text")
 
@@ -114,25 +133,87 @@ class S3Handler:
 
     def upload_image(self, document_id: str, image_data: BinaryIO, image_number: int, extension: str = ".png") -> str:
         logger.debug("Entering upload_image with document_id=%s, image_number=%s, extension=%s", document_id, image_number, extension)
-        key = f"{document_id}/image{image_number}{extension}"
+        key = self._key(f"{document_id}/image{image_number}{extension}")
         return self._upload_to_s3(S3Bucket.IMAGES, key, image_data, 'image/png')
         logger.debug("Exiting upload_image")
 
+    def upload_llm_image(self, document_id: str, image_data: Union[bytes, BinaryIO], image_number: int, extension: str = ".jpg", content_type: str = "image/jpeg") -> str:
+        logger.debug("Entering upload_llm_image with document_id=%s, image_number=%s, extension=%s", document_id, image_number, extension)
+        # The LLM ready derivative sits next to the original image so retrieval only has to fetch the small pre-encoded copy
+        key = self._key(f"{document_id}/image{image_number}_llm{extension}")
+        return self._upload_to_s3(S3Bucket.IMAGES, key, image_data, content_type)
+
     def upload_image_text(self, document_id: str, text_content: str, image_number: int) -> str:
         logger.debug("Entering upload_image_text with document_id=%s, image_number=%s", document_id, image_number)
         return self.upload_document_text(document_id, text_content, file_type=f"image{image_number}")
         logger.debug("Exiting upload_image_text")
 
+    def graph_key(self, document_id: str) -> str:
+        return self._key(f"{document_id}/graph.json")
+
     def upload_graph(self, document_id: str, graph_json: str) -> str:
         logger.debug("Entering upload_graph with document_id=%s", document_id)
-        key = f"{document_id}/graph.json"
+        key = self.graph_key(document_id)
         return self._upload_to_s3(S3Bucket.GRAPHS, key, graph_json.encode('utf-8'), 'application/json')
         logger.debug("Exiting upload_graph")
 
+    def upload_chunk_store_file(self, name: str, data: bytes) -> str:
+        logger.debug("Entering upload_chunk_store_file with name=%s", name)
+        key = self._key(f"{self.CHUNK_STORE_PREFIX}/{name}")
+        return self._upload_to_s3(S3Bucket.TEXT, key, data, 'application/octet-stream')
+
+    def download_chunk_store_file(self, name: str) -> Optional[bytes]:
+        """
+        Downloads a chunk store file, returning None if it hasn't been uploaded.
+        """
+        logger.debug("Entering download_chunk_store_file with name=%s", name)
+        try:
+            response = self.s3.get_object(Bucket=S3Bucket.TEXT.value, Key=self._key(f"{self.CHUNK_STORE_PREFIX}/{name}"))
+            return response['Body'].read()
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def chunk_store_file_etag(self, name: str) -> Optional[str]:
+        """
+        Gets the ETag of an uploaded chunk store file, which changes whenever it is uploaded again, or None if it hasn't been uploaded.
+        """
+        logger.debug("Entering chunk_store_file_etag with name=%s", name)
+        try:
+            response = self.s3.head_object(Bucket=S3Bucket.TEXT.value, Key=self._key(f"{self.CHUNK_STORE_PREFIX}/{name}"))
+            return response['ETag']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def upload_preprocessing_manifest(self, manifest: Dict[str, Any]) -> str:
+        logger.debug("Entering upload_preprocessing_manifest")
+        key = self._key(self.PREPROCESSING_MANIFEST)
+        return self._upload_to_s3(S3Bucket.TEXT, key, json.dumps(manifest), 'application/json')
+
+    def download_preprocessing_manifest(self) -> Optional[Dict[str, Any]]:
+        """
+        Downloads the manifest of the last completed preprocessing run, returning None if none has completed.
+        """
+        logger.debug("Entering download_preprocessing_manifest")
+        try:
+            response = self.s3.get_object(Bucket=S3Bucket.TEXT.value, Key=self._key(self.PREPROCESSING_MANIFEST))
+            return json.loads(response['Body'].read())
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+
+    def delete_preprocessing_manifest(self) -> None:
+        logger.debug("Entering delete_preprocessing_manifest")
+        self.s3.delete_object(Bucket=S3Bucket.TEXT.value, Key=self._key(self.PREPROCESSING_MANIFEST))
+
     def concat_and_replace_summary(self, document_id: str) -> str:
         logger.debug("Entering concat_and_replace_summary with document_id=%s", document_id)
         try:
-            response = self.s3.list_objects_v2(Bucket=S3Bucket.TEXT.value, Prefix=f"{document_id}/")
+            response = self.s3.list_objects_v2(Bucket=S3Bucket.TEXT.value, Prefix=self._key(f"{document_id}/"))
             if 'Contents' not in response:
                 raise ValueError(f"No text files found for document: {document_id}")
 
@@ -228,8 +309,8 @@ class S3Handler:
     def reset_buckets(self) -> None:
         logger.debug("Entering reset_buckets")
         """
-        Deletes all objects from the text, images, and graphs buckets.
-        Use with caution.
+        Deletes all objects under key_prefix from the text, images, and graphs buckets.
+        Use with caution, without a key prefix this clears the buckets entirely.
 
         This will not reset the documents bucket.
         """
@@ -238,20 +319,24 @@ class S3Handler:
             S3Bucket.IMAGES.value,
             S3Bucket.GRAPHS.value
         ]
+        prefix = f"{self.key_prefix}/" if self.key_prefix else ""
 
         for bucket in buckets:
             try:
-                response = self.s3.list_objects_v2(Bucket=bucket)
-                if 'Contents' in response:
-                    objects_to_delete = [{'Key': obj['Key']} for obj in response['Contents']]
-                    # Boto3 supports batch deletion of up to 1000 objects
-                    self.s3.delete_objects(
-                        Bucket=bucket,
-                        Delete={'Objects': objects_to_delete}
-                    )
-                    print(f"Cleared {len(objects_to_delete)} objects from {bucket}")
+                deleted = 0
+                for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+                    if 'Contents' in page:
+                        objects_to_delete = [{'Key': obj['Key']} for obj in page['Contents']]
+                        # Pages hold at most 1000 objects, the most a batch delete accepts
+                        self.s3.delete_objects(
+                            Bucket=bucket,
+                            Delete={'Objects': objects_to_delete}
+                        )
+                        deleted += len(objects_to_delete)
+                if deleted > 0:
+                    print(f"Cleared {deleted} objects from {bucket}/{prefix}")
                 else:
-                    print(f"No objects found in {bucket}")
+                    print(f"No objects found in {bucket}/{prefix}")
             except ClientError as e:
                 print(f"Error resetting bucket {bucket}: {e}")
                 raise
@@ -1,23 +1,114 @@
 from .s3_handler import S3Handler, S3Bucket
 from .attachments import Attachment, AttachmentTypes
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import base64
+import threading
+
 class S3QuickFetch:
-    def __init__(self, s3_handler: S3Handler):
+    IMAGE_CACHE_SIZE = 256
+    MAX_FETCH_WORKERS = 8
+
+    def __init__(self, s3_handler: S3Handler, image_cache_size: int = IMAGE_CACHE_SIZE, max_fetch_workers: int = MAX_FETCH_WORKERS):
         self.s3_handler = s3_handler
+        self.image_cache_size = image_cache_size
+        self.max_fetch_workers = max_fetch_workers
+        # LLM ready images keyed by their S3 path, so the same figure is only downloaded and re-encoded once
+        self._image_cache = OrderedDict()
+        self._image_cache_lock = threading.Lock()
 
     def get_image(self, image_s3: str) -> Attachment:
-        local_path = self.s3_handler.temp_download_file(image_s3)
-        attachment = Attachment(attachment_type=AttachmentTypes.IMAGE, attachment_data=local_path,needs_extraction=True)
+        cached = self._get_cached_image(image_s3)
+        if cached is not None:
+            return cached
+        # We read straight into memory rather than going through a temp file on disk
+        image_bytes = self.s3_handler.download_file(image_s3)
+        attachment = Attachment(attachment_type=AttachmentTypes.IMAGE, attachment_data=BytesIO(image_bytes),needs_extraction=True)
         attachment.extract()
-        self.s3_handler.cleanup_temp_file(local_path)
+        if not attachment.needs_extraction:
+            self._cache_image(image_s3, attachment)
+        return attachment
+
+    def get_llm_image(self, image_s3: str, llm_image_s3: str) -> Attachment:
+        """
+        Fetches the pre-encoded LLM image created at preprocessing time, no decoding or resizing is needed.
+        :param image_s3: S3 URI of the original image, used as the cache key.
+        :param llm_image_s3: S3 URI of the LLM ready JPEG.
+        :return: Image attachment.
+        """
+        cached = self._get_cached_image(image_s3)
+        if cached is not None:
+            return cached
+        image_bytes = self.s3_handler.download_file(llm_image_s3)
+        attachment = Attachment(attachment_type=AttachmentTypes.IMAGE, attachment_data=base64.b64encode(image_bytes).decode("utf-8"), needs_extraction=False, additional_data={"format": "JPEG"})
+        self._cache_image(image_s3, attachment)
         return attachment
 
+    def get_result_image(self, rag_data: dict) -> Attachment:
+        if rag_data.get("llm_image_path") is not None:
+            return self.get_llm_image(rag_data["image_path"], rag_data["llm_image_path"])
+        return self.get_image(rag_data["image_path"])
+
+    def get_images(self, image_s3_list: list[str]) -> list[Attachment]:
+        """
+        Fetches and prepares several images concurrently.
+        :param image_s3_list: List of image S3 URIs.
+        :return: List of image attachments in the same order as image_s3_list.
+        """
+        return self._fetch_concurrently(image_s3_list, image_s3_list, self.get_image)
+
+    def get_result_images(self, rag_results: list[dict]) -> list[Attachment]:
+        """
+        Fetches the images for several image RAG results concurrently, using their LLM ready copy when there is one.
+        :param rag_results: List of image RAG results.
+        :return: List of image attachments in the same order as rag_results.
+        """
+        return self._fetch_concurrently([result["image_path"] for result in rag_results], rag_results, self.get_result_image)
+
+    def _fetch_concurrently(self, keys: list[str], items: list, fetch) -> list[Attachment]:
+        unique_items = {}
+        for key, item in zip(keys, items):
+            unique_items.setdefault(key, item)
+        if len(unique_items) == 0:
+            return []
+        if len(unique_items) == 1:
+            fetched = {key: fetch(item) for key, item in unique_items.items()}
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_fetch_workers, len(unique_items))) as executor:
+                fetched = dict(zip(unique_items.keys(), executor.map(fetch, unique_items.values())))
+        return [fetched[key] for key in keys]
+
+    def clear_image_cache(self):
+        with self._image_cache_lock:
+            self._image_cache.clear()
+
+    def _get_cached_image(self, image_s3: str) -> Attachment:
+        with self._image_cache_lock:
+            cached = self._image_cache.get(image_s3)
+            if cached is None:
+                return None
+            self._image_cache.move_to_end(image_s3)
+        attachment_data, additional_data = cached
+        # A fresh attachment is returned each time so callers can't alter the cached copy
+        return Attachment(attachment_type=AttachmentTypes.IMAGE, attachment_data=attachment_data, needs_extraction=False, additional_data=dict(additional_data))
+
+    def _cache_image(self, image_s3: str, attachment: Attachment):
+        if self.image_cache_size <= 0:
+            return
+        with self._image_cache_lock:
+            self._image_cache[image_s3] = (attachment.attachment_data, dict(attachment.additional_data))
+            self._image_cache.move_to_end(image_s3)
+            while len(self._image_cache) > self.image_cache_size:
+                self._image_cache.popitem(last=False)
+
 
     def fetch_text(self, text_s3: str) -> str:
         file = self.s3_handler.temp_download_file(text_s3)
         file_data = open(file, "r").read()
         self.s3_handler.cleanup_temp_file(file)
         return file_data
-    
+
     def pull_summary(self, rag_data: dict):
         if rag_data["type"] == "text":
             return rag_data["text"]
@@ -11,6 +11,12 @@ class Evaluator(ABC):
     def evaluate_rag_result(self, result: str, rag_data: dict):
         return rag_data
 
+    def evaluate_rag_results(self, result: str, rag_results: list[dict]) -> list[dict]:
+        """
+        Evaluates the answer against every RAG result, subclasses can override this to share work between results.
+        """
+        return [self.evaluate_rag_result(result, rag_data) for rag_data in rag_results]
+
 
 
     @abstractmethod
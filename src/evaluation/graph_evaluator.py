@@ -1,14 +1,45 @@
 from .evaluator import Evaluator
-from src.kg import GraphCreator, GraphRelation, dict_data_to_relations
+from src.kg import GraphCreator, GraphRelation, dict_data_to_relations, TripleVocabulary, intersection_counts, normalise_term
 from src.main.iterative_stage import IterativeStage
 from src.data.s3_quick_fetch import S3QuickFetch
+import numpy as np
+from numpy import ndarray
 import json
 class GraphEvaluator(Evaluator):
 
-    def __init__(self, iterative_stage: IterativeStage, graph_creator: GraphCreator = None,  beta: float = 1.0):
+    def __init__(self, iterative_stage: IterativeStage, graph_creator: GraphCreator = None,  beta: float = 1.0, normalise: bool = False):
+        """
+        :param normalise: Compare relations on their normalised terms (case, whitespace and word forms) rather than exact strings.
+        Off by default so the metrics stay comparable with earlier results.
+        """
         super().__init__(iterative_stage)
         self.graph_creator = graph_creator if graph_creator else GraphCreator()
         self.beta = beta
+        # Graphs are encoded as triple IDs once and reused for every RAG result that compares against them
+        self.vocabulary = TripleVocabulary(normalise_term if normalise else None)
+        self._encoded_graphs = {}
+
+    def _encoded_graph(self, key, relations: list[GraphRelation]) -> ndarray:
+        if key not in self._encoded_graphs:
+            self._encoded_graphs[key] = self.vocabulary.encode(relations)
+        return self._encoded_graphs[key]
+
+    def batch_metrics(self, reference_graphs: list[ndarray], result_graphs: list[ndarray], beta: float = 1.0) -> dict[str, ndarray]:
+        """
+        Compares each result graph with the reference graph at the same index, all in one pass.
+        :param reference_graphs: Graphs encoded with self.vocabulary.
+        :param result_graphs: Graphs encoded with self.vocabulary.
+        :param beta: The beta value for the F-beta score.
+        :return: Arrays of precision (shared / result size), recall (shared / reference size) and f_beta.
+        """
+        true_positives = intersection_counts(reference_graphs, result_graphs, len(self.vocabulary)).astype(float)
+        reference_sizes = np.array([len(graph) for graph in reference_graphs], dtype=float)
+        result_sizes = np.array([len(graph) for graph in result_graphs], dtype=float)
+        precision = np.divide(true_positives, result_sizes, out=np.zeros_like(true_positives), where=result_sizes > 0)
+        recall = np.divide(true_positives, reference_sizes, out=np.zeros_like(true_positives), where=reference_sizes > 0)
+        denominator = beta ** 2 * precision + recall
+        f_beta = np.divide((1 + beta ** 2) * precision * recall, denominator, out=np.zeros_like(true_positives), where=(precision + recall) > 0)
+        return {"precision": precision, "recall": recall, "f_beta": f_beta}
         
     def convert_output_to_graph(self, output: str):
         """
@@ -26,12 +57,8 @@ class GraphEvaluator(Evaluator):
         """
         if not llm_graph:
             return 0.0
-
-        retrieved_set = set(retrieved_graph)
-        llm_set = set(llm_graph)
-
-        true_positives = retrieved_set.intersection(llm_set)
-        return len(true_positives) / len(llm_set)
+        metrics = self.batch_metrics([self.vocabulary.encode(retrieved_graph)], [self.vocabulary.encode(llm_graph)])
+        return float(metrics["precision"][0])
     
     def compare_graph_recall(self, full_truth_graph: list[GraphRelation], retrieved_graph: list[GraphRelation]) -> float:
         """
@@ -40,12 +67,8 @@ class GraphEvaluator(Evaluator):
         """
         if not full_truth_graph:
             return 0.0
-
-        truth_set = set(full_truth_graph)
-        retrieved_set = set(retrieved_graph)
-
-        true_positives = truth_set.intersection(retrieved_set)
-        return len(true_positives) / len(truth_set)
+        metrics = self.batch_metrics([self.vocabulary.encode(full_truth_graph)], [self.vocabulary.encode(retrieved_graph)])
+        return float(metrics["recall"][0])
     
     def f_beta_score(self, precision: float, recall: float, beta: float = 1.0) -> float:
         if (precision + recall) == 0:
@@ -77,23 +100,41 @@ class GraphEvaluator(Evaluator):
      
     
 
-    def evaluate_rag_result(self, result: str, rag_data: dict):
-        graph_s3_path = rag_data["graph_path"]
-        
-        graph_data = self.iterative_stage.doc_graphs[rag_data["document_path"]]
-        summary_text = self.iterative_stage.chunk_summaries[rag_data["vector_id"]]["summary"]
-        summary_graph = self.iterative_stage.chunk_summaries[rag_data["vector_id"]]["graph"]
-        llm_graph = self.graph_creator.create_graph_relations(result)
-        
-        recall = self.compare_graph_precision(graph_data, summary_graph)
-        precision = self.compare_graph_precision(graph_data, llm_graph)
-        f_beta = self.compare_graph_f_beta(graph_data, llm_graph, self.beta)
+    def _answer_graph(self, result: str) -> list[GraphRelation]:
+        # Evaluators using the stage's model share its graph of the final answer
+        if self.graph_creator is self.iterative_stage.graphModel:
+            return self.iterative_stage.answer_graph(result)
+        return self.graph_creator.create_graph_relations(result)
 
-        graph_evaluation = {
-            "recall": recall,
-            "precision": precision,
-            "f_beta": f_beta,
-            "beta": self.beta
-            }
-        rag_data["graph_evaluation"] = graph_evaluation
-        return rag_data
\ No newline at end of file
+    def evaluate_rag_results(self, result: str, rag_results: list[dict]) -> list[dict]:
+        """
+        Evaluates every RAG result at once. The answer's graph is only created once,
+        and the metrics for all results come from a single vectorised comparison.
+        "recall" is the share of the chunk summary's relations found in the document graph,
+        "precision" the share of the answer's relations found in the document graph,
+        and "f_beta" combines that precision with the share of the document graph found in the answer.
+        """
+        if len(rag_results) == 0:
+            return rag_results
+        llm_graph = self._encoded_graph(("answer", result), self._answer_graph(result))
+        document_graphs = [
+            self._encoded_graph(("document", rag_data["document_path"]), self.iterative_stage.doc_graphs[rag_data["document_path"]])
+            for rag_data in rag_results
+        ]
+        summary_graphs = [
+            self._encoded_graph(("summary", rag_data["vector_id"]), self.iterative_stage.chunk_summaries[rag_data["vector_id"]]["graph"])
+            for rag_data in rag_results
+        ]
+        count = len(rag_results)
+        metrics = self.batch_metrics(document_graphs + document_graphs, summary_graphs + [llm_graph] * count, self.beta)
+        for i, rag_data in enumerate(rag_results):
+            rag_data["graph_evaluation"] = {
+                "recall": float(metrics["precision"][i]),
+                "precision": float(metrics["precision"][count + i]),
+                "f_beta": float(metrics["f_beta"][count + i]),
+                "beta": self.beta
+                }
+        return rag_results
+
+    def evaluate_rag_result(self, result: str, rag_data: dict):
+        return self.evaluate_rag_results(result, [rag_data])[0]
\ No newline at end of file
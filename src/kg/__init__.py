@@ -1,3 +1,5 @@
 from .bert import BERT_KG
 from .graph_creator import GraphCreator, GraphRelation, dict_data_to_relations
 from .llm import LLM_KG
+from .triple_vocabulary import TripleVocabulary, intersection_counts
+from .relation_matcher import RelationMatcher, normalise_term, normalise_relation
\ No newline at end of file
@@ -2,6 +2,7 @@
 
 import re
 import json
+import time
 import torch
 from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
 from src.kg.graph_creator import GraphCreator, GraphRelation, remove_dup_relations
@@ -11,24 +12,41 @@ from src.system_manager.LoggerController import LoggerController
 
 logger = LoggerController.get_logger()
 class BERT_KG(GraphCreator):
-    def __init__(self, model_name: str = "Babelscape/rebel-large"):
+    def __init__(self, model_name: str = "Babelscape/rebel-large", batch_size: int = 4, num_beams: int = 10, chunk_size: int = 1000, chunk_overlap: int = 500, quantize: bool = False, num_threads: int | None = None):
+        """
+        :param model_name: REBEL model to load.
+        :param batch_size: Number of chunks generated together, padded to the longest in the batch.
+        :param num_beams: Beam search width, lower is faster but may miss relations.
+        :param chunk_size: Tokens per chunk.
+        :param chunk_overlap: Tokens shared between neighbouring chunks, every overlapping token is processed twice.
+        :param quantize: Apply dynamic int8 quantization to the linear layers, faster on CPU at a small accuracy cost.
+        :param num_threads: Number of threads torch uses on CPU, None keeps torch's default.
+        """
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        self.model_name = model_name
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.num_beams = num_beams
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
         self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+        self.model.eval()
+        if quantize:
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        # Padding tokens show up in batched outputs shorter than the longest, so they're stripped with the other special tokens
+        special_tokens = ["<s>", "</s>"]
+        if self.tokenizer.pad_token is not None:
+            special_tokens.append(self.tokenizer.pad_token)
+        self.special_token_pattern = re.compile("|".join(re.escape(token) for token in special_tokens))
 
-    def chunk_relations(self, text: str):
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True)
-        
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=1024,
-                num_beams=10,
-                early_stopping=False,
-            )
-        
-        decoded_output = self.tokenizer.decode(outputs[0], skip_special_tokens=False)
-                
-        cleaned_output = re.sub(r"<s>|</s>", "", decoded_output).strip()
+    def graph_key(self) -> str:
+        # Batch size and thread count don't change the output so they're left out
+        return f"{type(self).__name__}:{self.model_name}:{self.num_beams}:{self.chunk_size}:{self.chunk_overlap}:{self.quantize}"
+
+    def parse_triplets(self, decoded_output: str) -> list[GraphRelation]:
+        cleaned_output = self.special_token_pattern.sub("", decoded_output).strip()
         triplet_info = cleaned_output.split("<triplet> ")[1:]
 
         triplets = []
@@ -46,12 +64,50 @@ class BERT_KG(GraphCreator):
 
         return triplets
 
+    def batch_chunk_relations(self, texts: list[str]) -> list[list[GraphRelation]]:
+        """
+        Extracts relations from several chunks, generating batch_size chunks at a time.
+        :param texts: List of chunk texts.
+        :return: List of relations for each chunk, in the same order as texts.
+        """
+        all_triplets = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            inputs = self.tokenizer(batch, return_tensors="pt", truncation=True, padding=True)
+            with torch.inference_mode():
+                outputs = self.model.generate(
+                    **inputs,
+                    max_new_tokens=1024,
+                    num_beams=self.num_beams,
+                    early_stopping=False,
+                )
+            decoded_outputs = self.tokenizer.batch_decode(outputs, skip_special_tokens=False)
+            all_triplets.extend(self.parse_triplets(decoded_output) for decoded_output in decoded_outputs)
+        return all_triplets
+
+    def chunk_relations(self, text: str):
+        return self.batch_chunk_relations([text])[0]
+
+    def create_graph_relations_batch(self, texts: list[str]) -> list[list[GraphRelation]]:
+        # Chunks from every text share the same generation batches, so short texts don't each pay for a mostly empty batch
+        split_texts = [ContentFormatter.chunk_text(text, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap) for text in texts]
+        chunk_relations = self.batch_chunk_relations([chunk for chunks in split_texts for chunk in chunks])
+        all_relations = []
+        start = 0
+        for chunks in split_texts:
+            relations = [relation for relations in chunk_relations[start:start + len(chunks)] for relation in relations]
+            all_relations.append(remove_dup_relations(relations))
+            start += len(chunks)
+        return all_relations
+
     def create_graph_relations(self, text: str):
-        splitText = ContentFormatter.chunk_text(text, chunk_size=1000, chunk_overlap=500)
+        splitText = ContentFormatter.chunk_text(text, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        logger.info(f"Processing {len(splitText)} chunks in batches of {self.batch_size}")
+        start_time = time.perf_counter()
         all_relations = []
-        for i, chunk in enumerate(splitText):
-            logger.info(f"Processing chunk {i+1} of {len(splitText)}")
-            relations = self.chunk_relations(chunk)
+        for relations in self.batch_chunk_relations(splitText):
             all_relations.extend(relations)
+        elapsed = time.perf_counter() - start_time
+        if len(splitText) > 0 and elapsed > 0:
+            logger.info(f"Processed {len(splitText)} chunks in {elapsed:.1f}s ({len(splitText) / elapsed:.2f} chunks/sec)")
         return remove_dup_relations(all_relations)
-      
\ No newline at end of file
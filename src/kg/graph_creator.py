@@ -64,6 +64,10 @@ class GraphCreator(ABC):
         logger.debug("Initializing GraphCreator")
         pass
 
+    def graph_key(self) -> str:
+        """Identifies the settings that shape this creator's graphs, so cached graphs are never mixed between them."""
+        return type(self).__name__
+
     @abstractmethod
     def create_graph_relations(self, text: str):
         """
@@ -77,6 +81,15 @@ class GraphCreator(ABC):
             GraphRelation("document", text, "CONTAINS")
         ]
 
+    def create_graph_relations_batch(self, texts: list[str]) -> list[list[GraphRelation]]:
+        """
+        Converts several texts into relations, creators that can batch or run requests concurrently override this.
+
+        :param texts: The texts to convert.
+        :return: A list of GraphRelation objects for each text, in the same order as texts.
+        """
+        return [self.create_graph_relations(text) for text in texts]
+
     def create_graph_dict(self, text: str):
         """
         Uses the create_graph_relations method to convert the text into a graph representation.
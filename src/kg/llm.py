@@ -1,24 +1,64 @@
 import re
 import json
 import torch
+from concurrent.futures import ThreadPoolExecutor
 from .graph_creator import GraphCreator, GraphRelation, remove_dup_relations
 from src.llm.wrappers import ChatModelWrapper
 from src.vector_database import Embedder
 from langchain_experimental.graph_transformers import LLMGraphTransformer
 from langchain_core.documents import Document
-from src.llm.content_formatter import ContentFormatter
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_community.graphs.graph_document import GraphDocument, Node, Relationship
+from src.llm.content_formatter import ContentFormatter, TEXT_LABEL
+from src.llm.response_cache import ResponseCache
 from src.system_manager.LoggerController import LoggerController
 
 logger = LoggerController.get_logger()
 
 class LLM_KG(GraphCreator):
+    CACHE_TAG = "LLMGraphTransformer"
+    # Texts graphed at once by create_graph_relations_batch, requests still go through the model's rate limiter
+    MAX_CONCURRENT_TEXTS = 8
+
     def __init__(self, model: ChatModelWrapper, embedder: Embedder):
         self.modelType = model
         self.embedder = embedder
         self.transformer = LLMGraphTransformer(
             llm = model.model,
         )
+
+    def graph_key(self) -> str:
+        return f"{type(self).__name__}:{self.modelType.model_type.argName}"
         
+    def _process_document(self, document: Document) -> GraphDocument:
+        cache = ResponseCache.for_wrapper(self.modelType)
+        if cache is not None:
+            # The transformer builds its own prompt, so the key is the chunk text tagged with what we asked for
+            key = ResponseCache.make_key(self.modelType.model_type.argName, [SystemMessage(content=self.CACHE_TAG), HumanMessage(content=document.page_content)])
+            cached = cache.get_value(key)
+            if cached is not None:
+                return self._graph_document_from_json(cached, document)
+        # Each chunk is its own model request, so each goes through the rate limiter separately
+        graph_document = self.modelType.rate_limiter.call(lambda: self.transformer.process_response(document), ContentFormatter.estimate_tokens({TEXT_LABEL: document.page_content}))
+        if cache is not None:
+            cache.put_value(key, self.modelType.model_type.argName, self._graph_document_to_json(graph_document))
+        return graph_document
+
+    def _graph_document_to_json(self, graph_document: GraphDocument) -> str:
+        return json.dumps({
+            "nodes": [[node.id, node.type] for node in graph_document.nodes],
+            "relationships": [[rel.source.id, rel.source.type, rel.target.id, rel.target.type, rel.type] for rel in graph_document.relationships]
+        })
+
+    def _graph_document_from_json(self, data: str, document: Document) -> GraphDocument:
+        data = json.loads(data)
+        nodes = [Node(id=node_id, type=node_type) for node_id, node_type in data["nodes"]]
+        relationships = [
+            Relationship(source=Node(id=source_id, type=source_type), target=Node(id=target_id, type=target_type), type=rel_type)
+            for source_id, source_type, target_id, target_type, rel_type in data["relationships"]
+        ]
+        return GraphDocument(nodes=nodes, relationships=relationships, source=document)
+
     # Due to chunk based processing approach, this will not work for a mediums of information
     # Like hypothetically a book of short stories, as they may contradict each other regarding graph relations
     def get_nodes_and_relations(self, text: str):
@@ -26,7 +66,7 @@ class LLM_KG(GraphCreator):
         documents = [
             Document(page_content=chunk) for chunk in splitText
         ]
-        graph_documents = self.transformer.convert_to_graph_documents(documents)
+        graph_documents = [self._process_document(document) for document in documents]
         nodes = []
         relationships = []
         for i, graph_document in enumerate(graph_documents):
@@ -45,4 +85,10 @@ class LLM_KG(GraphCreator):
         for relationship in relationships:
             triplet = GraphRelation(relationship.source.id, relationship.target.id, relationship.type)
             triples.append(triplet)
-        return remove_dup_relations(triples)
\ No newline at end of file
+        return remove_dup_relations(triples)
+
+    def create_graph_relations_batch(self, texts: list[str]) -> list[list[GraphRelation]]:
+        if len(texts) <= 1:
+            return [self.create_graph_relations(text) for text in texts]
+        with ThreadPoolExecutor(max_workers=min(self.MAX_CONCURRENT_TEXTS, len(texts))) as executor:
+            return list(executor.map(self.create_graph_relations, texts))
\ No newline at end of file
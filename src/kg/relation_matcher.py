@@ -0,0 +1,101 @@
+import re
+import numpy as np
+from src.kg.graph_creator import GraphRelation
+from src.vector_database import Embedder
+from src.system_manager.LoggerController import LoggerController
+
+logger = LoggerController.get_logger()
+
+# Suffix rules for a light lemmatisation that needs no model or downloaded data, so results match on every machine
+LEMMA_RULES = [("ies", "y", 5), ("sses", "ss", 5), ("ches", "ch", 6), ("shes", "sh", 6), ("xes", "x", 4), ("s", "", 4)]
+# Words the rules would stem wrongly, they're kept as they are
+LEMMA_EXCEPTIONS = {
+    "is", "was", "has", "does", "goes", "this", "its", "us", "bus", "status", "analysis", "basis", "access", "process", "business",
+    "series", "species", "news", "lens", "always", "perhaps", "whereas", "towards", "afterwards", "sometimes", "caches", "aches",
+    "physics", "mathematics", "economics", "politics", "ethics", "statistics", "diabetes", "herpes", "measles",
+}
+
+def normalise_term(term: str) -> str:
+    """
+    Lowercases a term, treats underscores, hyphens and punctuation as spaces, collapses whitespace and lemmatises each word,
+    so "Broadband_Subsidies" and "broadband subsidy" match.
+    """
+    words = re.sub(r"[\W_]+", " ", str(term).lower()).split()
+    lemmas = []
+    for word in words:
+        if word not in LEMMA_EXCEPTIONS and not word.endswith(("ss", "us", "is")):
+            for suffix, replacement, min_length in LEMMA_RULES:
+                if word.endswith(suffix) and len(word) >= min_length:
+                    word = word[:-len(suffix)] + replacement
+                    break
+        lemmas.append(word)
+    return " ".join(lemmas)
+
+def normalise_relation(relation: GraphRelation) -> tuple[str, str, str]:
+    return (normalise_term(relation.subject), normalise_term(relation.relation), normalise_term(relation.object))
+
+class RelationMatcher:
+    """
+    Index of reference relations that finds which relations in another graph they contain.
+    Relations match exactly, after normalising their terms, or when an embedder and threshold are given,
+    when the embedding of the relation's text is close enough to a reference relation's.
+    """
+    def __init__(self, relations: list[GraphRelation], normalise: bool = True, embedder: Embedder = None, similarity_threshold: float = None):
+        """
+        :param relations: Reference relations.
+        :param normalise: Match relations on their normalised terms rather than the exact strings.
+        :param embedder: Embedder for nearest neighbour matching, only used with a similarity_threshold.
+        :param similarity_threshold: Cosine similarity from which relations count as matching, None turns nearest neighbour matching off.
+        """
+        self.relations = relations
+        self.normalise = normalise
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self._keys = {self._key(relation) for relation in relations}
+        # Reference embeddings are only computed once a relation fails to match exactly
+        self._embeddings = None
+
+    def _key(self, relation: GraphRelation):
+        if self.normalise:
+            return normalise_relation(relation)
+        return (relation.subject, relation.relation, relation.object)
+
+    @staticmethod
+    def _relation_text(key: tuple[str, str, str]) -> str:
+        subject, relation, object = key
+        return f"{subject} {relation} {object}"
+
+    def _embed(self, keys: list[tuple[str, str, str]]) -> np.ndarray:
+        embeddings = np.asarray(self.embedder.batch_text_to_embedding([self._relation_text(key) for key in keys]), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms == 0, 1, norms)
+
+    def _nearest_neighbour_matches(self, keys: list[tuple[str, str, str]]) -> np.ndarray:
+        if self._embeddings is None:
+            self._embeddings = self._embed(list(self._keys))
+            logger.debug(f"Embedded {len(self._keys)} reference relations for nearest neighbour matching")
+        similarities = self._embed(keys) @ self._embeddings.T
+        return similarities.max(axis=1) >= self.similarity_threshold
+
+    def matches(self, relations: list[GraphRelation]) -> list[bool]:
+        """
+        :param relations: Relations to look up.
+        :return: Whether each relation matches a reference relation.
+        """
+        keys = [self._key(relation) for relation in relations]
+        matched = [key in self._keys for key in keys]
+        unmatched = [i for i, is_matched in enumerate(matched) if not is_matched]
+        if self.embedder is not None and self.similarity_threshold is not None and len(unmatched) > 0 and len(self._keys) > 0:
+            for i, is_matched in zip(unmatched, self._nearest_neighbour_matches([keys[i] for i in unmatched])):
+                matched[i] = bool(is_matched)
+        return matched
+
+    def match_ratio(self, relations: list[GraphRelation]) -> float:
+        """Share of relations that match a reference relation, 0 when there are none."""
+        if len(relations) == 0:
+            return 0.0
+        return sum(self.matches(relations)) / len(relations)
+
+    def missing(self, relations: list[GraphRelation]) -> list[GraphRelation]:
+        """Relations with no matching reference relation."""
+        return [relation for relation, is_matched in zip(relations, self.matches(relations)) if not is_matched]
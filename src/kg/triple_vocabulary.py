@@ -0,0 +1,54 @@
+import numpy as np
+from typing import Callable
+from numpy import ndarray
+from src.kg.graph_creator import GraphRelation
+
+class TripleVocabulary:
+    """
+    Gives every distinct term and (subject, relation, object) triple an integer ID,
+    so graphs can be stored as sorted arrays of triple IDs and compared with NumPy set operations.
+    Graphs are only comparable when encoded with the same vocabulary.
+    """
+    def __init__(self, term_normaliser: Callable[[str], str] = None):
+        """
+        :param term_normaliser: Optional function applied to terms first, so terms it maps together share an ID.
+        """
+        self.term_normaliser = term_normaliser
+        self._terms = {}
+        self._triples = {}
+
+    def __len__(self):
+        return len(self._triples)
+
+    def term_id(self, term: str) -> int:
+        if self.term_normaliser is not None:
+            term = self.term_normaliser(term)
+        return self._terms.setdefault(term, len(self._terms))
+
+    def triple_id(self, relation: GraphRelation) -> int:
+        key = (self.term_id(relation.subject), self.term_id(relation.relation), self.term_id(relation.object))
+        return self._triples.setdefault(key, len(self._triples))
+
+    def encode(self, relations: list[GraphRelation]) -> ndarray:
+        """
+        :param relations: Graph relations, duplicates are dropped like they are when compared as sets.
+        :return: Sorted unique triple IDs.
+        """
+        return np.unique(np.fromiter((self.triple_id(relation) for relation in relations), dtype=np.int64, count=len(relations)))
+
+def intersection_counts(references: list[ndarray], candidates: list[ndarray], num_triples: int) -> ndarray:
+    """
+    Counts the triples shared by each pair of encoded graphs in a single intersection.
+    Each pair's IDs are offset by the pair's index times num_triples so pairs can't match each other.
+    :param references: Encoded graphs.
+    :param candidates: Encoded graphs, compared with the reference at the same index.
+    :param num_triples: Size of the vocabulary the graphs were encoded with.
+    :return: The size of each intersection.
+    """
+    def keyed(graphs):
+        if len(graphs) == 0:
+            return np.empty(0, dtype=np.int64)
+        pair_indexes = np.repeat(np.arange(len(graphs), dtype=np.int64), [len(graph) for graph in graphs])
+        return pair_indexes * max(num_triples, 1) + np.concatenate(graphs).astype(np.int64)
+    shared = np.intersect1d(keyed(references), keyed(candidates), assume_unique=True)
+    return np.bincount(shared // max(num_triples, 1), minlength=len(references))
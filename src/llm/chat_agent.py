@@ -1,6 +1,7 @@
 from .chat_history import ChatHistory
 from .wrappers import ChatModelWrapper 
-from .content_formatter import ContentFormatter
+from .content_formatter import ContentFormatter, IMAGE_LABEL, TEXT_LABEL
+from .template_cache import TemplateCache
 from src.data.attachments import Attachment, AttachmentTypes
 from typing import Union
 from langchain.prompts import ChatPromptTemplate
@@ -10,12 +11,13 @@ class ChatAgent:
         self.wrapper = model
         self.system_prompt = system_prompt
         if history:
-            self.history = ChatHistory(system_prompt)
+            self.history = ChatHistory(system_prompt, ChatHistory.budget_for(model.model_type.model_tokens))
         else:
             self.history = None
 
-    def process_prompt(self, prompt : list[Union[str, Attachment]], context : list[Union[str, Attachment]] = None):
-        new_history = []
+    def _build_prompt(self, prompt : list[Union[str, Attachment]], context : list[Union[str, Attachment]] = None):
+        # Describes the new messages so the compiled template can be looked up rather than rebuilt
+        message_spec = []
         
         if context is None:
             context = []
@@ -26,12 +28,15 @@ class ChatAgent:
         context_role = "human"
         context_text_count = len(context_text)
         total_added_messages = 0
+        context_message_count = 0
         if context_image_count > 0:
-            new_history.append((context_role, ContentFormatter.prep_images(context_image_count,context_label)))
+            message_spec.append((context_role, IMAGE_LABEL, context_image_count, context_label))
             total_added_messages += context_image_count
+            context_message_count += 1
         if context_text_count > 0:
-            new_history.append((context_role, ContentFormatter.prep_texts(context_text_count, context_label)))
+            message_spec.append((context_role, TEXT_LABEL, context_text_count, context_label))
             total_added_messages += context_text_count
+            context_message_count += 1
         prompt_text = [item for item in prompt if isinstance(item, str)]
         prompt_attachments = [item for item in prompt if isinstance(item, Attachment) and item.attachment_type == AttachmentTypes.IMAGE]
         prompt_label = "prompt"
@@ -39,10 +44,10 @@ class ChatAgent:
         prompt_image_count = len(prompt_attachments)
         prompt_text_count = len(prompt_text)
         if prompt_image_count > 0:
-            new_history.append((prompt_role, ContentFormatter.prep_images(prompt_image_count,prompt_label)))
+            message_spec.append((prompt_role, IMAGE_LABEL, prompt_image_count, prompt_label))
             total_added_messages += prompt_image_count
         if prompt_text_count > 0:
-            new_history.append((prompt_role, ContentFormatter.prep_texts(prompt_text_count, prompt_label)))
+            message_spec.append((prompt_role, TEXT_LABEL, prompt_text_count, prompt_label))
             total_added_messages += prompt_text_count
 
         langchain_prompt = {
@@ -60,19 +65,69 @@ class ChatAgent:
                 context_label)
         }
 
+        return tuple(message_spec), langchain_prompt, total_added_messages, context_message_count
+
+    def _create_template(self, message_spec: tuple, context_message_count: int = 0) -> ChatPromptTemplate:
         if self.history is not None:
-            self.history.chat_history.extend(new_history)
-            template = self.history.create_template()
-        else:
-            extended_chat = [("system", self.system_prompt)]
-            extended_chat.extend(new_history)
-            template = ChatPromptTemplate.from_messages(extended_chat)
-        
-        llm_output = ContentFormatter.chat_to_model(template, self.wrapper, langchain_prompt)
+            # History changes every turn so its template can't be reused
+            return self.history.create_template(TemplateCache.build_messages(message_spec), context_message_count)
+        return TemplateCache.get(self.system_prompt, message_spec)
+
+    def _record_output(self, template: ChatPromptTemplate, langchain_prompt: dict, llm_output, total_added_messages: int, image_summaries: list = None):
         if self.history is not None:
             # We append output to chat, but acknowledge that since we added multiple messages with potential formatting, they'll need to be rewritten without langchain styling so we can reuse history
-            self.history.append_output_to_chat(template, langchain_prompt, llm_output, total_added_messages)
+            self.history.append_output_to_chat(template, langchain_prompt, llm_output, total_added_messages, image_summaries)
+
+    def process_prompt(self, prompt : list[Union[str, Attachment]], context : list[Union[str, Attachment]] = None, image_summaries : list = None):
+        """
+        Sends a prompt with optional context to the model.
+        :param prompt: Prompt texts and images.
+        :param context: Context texts and images.
+        :param image_summaries: Optional text stand-ins for the context images in order, strings or functions returning one. History uses them once the images are compacted out.
+        :return: The model output.
+        """
+        message_spec, langchain_prompt, total_added_messages, context_message_count = self._build_prompt(prompt, context)
+        template = self._create_template(message_spec, context_message_count)
+        llm_output = ContentFormatter.chat_to_model(template, self.wrapper, langchain_prompt)
+        self._record_output(template, langchain_prompt, llm_output, total_added_messages, image_summaries)
         return llm_output
+
+    async def aprocess_prompt(self, prompt : list[Union[str, Attachment]], context : list[Union[str, Attachment]] = None, image_summaries : list = None):
+        # Agents with history must await each call before the next, as every turn builds on the previous one
+        message_spec, langchain_prompt, total_added_messages, context_message_count = self._build_prompt(prompt, context)
+        template = self._create_template(message_spec, context_message_count)
+        llm_output = await ContentFormatter.achat_to_model(template, self.wrapper, langchain_prompt)
+        self._record_output(template, langchain_prompt, llm_output, total_added_messages, image_summaries)
+        return llm_output
+
+    def _build_batch(self, prompts : list[list[Union[str, Attachment]]], contexts : list[list[Union[str, Attachment]]] = None):
+        if self.history is not None:
+            raise ValueError("Batch processing is only available for agents without history, as batched prompts are independent of each other")
+        if contexts is None:
+            contexts = [None] * len(prompts)
+        if len(contexts) != len(prompts):
+            raise ValueError("Number of contexts must match number of prompts")
+        templates = []
+        prompt_data = []
+        for prompt, context in zip(prompts, contexts):
+            message_spec, langchain_prompt, _, _ = self._build_prompt(prompt, context)
+            templates.append(self._create_template(message_spec))
+            prompt_data.append(langchain_prompt)
+        return templates, prompt_data
+
+    def process_batch(self, prompts : list[list[Union[str, Attachment]]], contexts : list[list[Union[str, Attachment]]] = None) -> list:
+        """
+        Processes several independent prompts concurrently, up to the provider's concurrency limit.
+        :param prompts: List of prompts, each in the same format as process_prompt.
+        :param contexts: Optional list of contexts matching prompts.
+        :return: List of model outputs in the same order as prompts.
+        """
+        templates, prompt_data = self._build_batch(prompts, contexts)
+        return ContentFormatter.batch_chat_to_model(templates, self.wrapper, prompt_data)
+
+    async def aprocess_batch(self, prompts : list[list[Union[str, Attachment]]], contexts : list[list[Union[str, Attachment]]] = None) -> list:
+        templates, prompt_data = self._build_batch(prompts, contexts)
+        return await ContentFormatter.abatch_chat_to_model(templates, self.wrapper, prompt_data)
     
     def process_prompt_text(self, prompt : list[Union[str, Attachment]], context : list[Union[str, Attachment]] = None):
         return self.process_prompt(prompt, context).content
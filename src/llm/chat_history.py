@@ -1,28 +1,174 @@
 from src.llm.content_formatter import ContentFormatter
+from src.llm.rate_limiter import RateLimiter
+from src.system_manager import LoggerController
 from langchain.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+
+logger = LoggerController.get_logger()
+
+class ChatTurn:
+    def __init__(self, context: list[BaseMessage], prompt: list[BaseMessage], output: AIMessage, image_summaries: list = None):
+        self.context = context
+        self.prompt = prompt
+        self.output = output
+        # Text stand-ins for the context images in order, either strings or functions that fetch one
+        self.image_summaries = image_summaries or []
+        self.images_summarised = False
+
+    def messages(self) -> list[BaseMessage]:
+        return self.context + self.prompt + [self.output]
+
+    def tokens(self) -> int:
+        return sum(ChatHistory.message_tokens(message) for message in self.messages())
+
+    def summarise_images(self):
+        """Replaces the context images with their text summaries, images without one are dropped."""
+        if self.images_summarised:
+            return
+        self.images_summarised = True
+        image_index = 0
+        context = []
+        for message in self.context:
+            if isinstance(message.content, str):
+                context.append(message)
+                continue
+            content = []
+            for part in message.content:
+                if isinstance(part, dict) and part.get("type") == "image_url":
+                    summary = self._image_summary(image_index)
+                    image_index += 1
+                    if summary:
+                        content.append({"type": "text", "text": f"[Summary of a previously provided image: {summary}]"})
+                else:
+                    content.append(part)
+            if len(content) > 0:
+                context.append(message.model_copy(update={"content": content}))
+        self.context = context
+
+    def _image_summary(self, index: int) -> str:
+        if index >= len(self.image_summaries):
+            return ""
+        summary = self.image_summaries[index]
+        if callable(summary):
+            try:
+                summary = summary()
+            except Exception as e:
+                logger.warning(f"Could not fetch image summary for chat history: {e}")
+                summary = ""
+        return summary or ""
+
 
 class ChatHistory:
-    def __init__(self, system_prompt: str):
+    # Share of the model's context window history may use, leaving the rest for the new prompt and its context
+    HISTORY_FRACTION = 0.5
+    DEFAULT_MAX_TOKENS = 8000
+    # Turns this recent are kept whole, older ones have their images summarised
+    KEEP_RECENT_TURNS = 1
+
+    def __init__(self, system_prompt: str, max_tokens: int = DEFAULT_MAX_TOKENS):
         self.system_prompt = system_prompt
-        self.chat_history = [
-            ("system", system_prompt)
-        ]
-    
+        self.max_tokens = max_tokens
+        self.turns: list[ChatTurn] = []
+        # Template messages added by add_image_prep and add_text, they join the next turn
+        self.pending_messages = []
+        self._context_message_count = 0
+        self._new_message_count = 0
+
+    @staticmethod
+    def budget_for(model_tokens: int | None) -> int:
+        """Works out the history token budget from a model's context window size."""
+        if model_tokens is None:
+            return ChatHistory.DEFAULT_MAX_TOKENS
+        return int(model_tokens * ChatHistory.HISTORY_FRACTION)
+
+    @staticmethod
+    def message_tokens(message: BaseMessage) -> int:
+        content = message.content
+        if isinstance(content, str):
+            return RateLimiter.estimate_tokens(content)
+        tokens = 0
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                tokens += RateLimiter.IMAGE_TOKENS
+            elif isinstance(part, dict):
+                tokens += RateLimiter.estimate_tokens(part.get("text", ""))
+            else:
+                tokens += RateLimiter.estimate_tokens(str(part))
+        return tokens
+
+    @property
+    def chat_history(self) -> list:
+        """The full history as messages, starting with the system prompt."""
+        messages = [SystemMessage(content=self.system_prompt)]
+        for turn in self.turns:
+            messages.extend(turn.messages())
+        return messages
+
+    def tokens(self) -> int:
+        return RateLimiter.estimate_tokens(self.system_prompt) + sum(turn.tokens() for turn in self.turns)
+
     def add_image_prep(self, count: int, role: str = "user", label: str = None):
-        self.chat_history.append(
+        self.pending_messages.append(
             (role, ContentFormatter.prep_images(count, label))
         )
 
     def add_text(self, text: str, role: str = "user"):
-        self.chat_history.append(
+        self.pending_messages.append(
             (role, text)
         )
 
-    def create_template(self):
-        return ChatPromptTemplate.from_messages(self.chat_history)
+    def create_template(self, new_history: list = None, context_message_count: int = 0):
+        """
+        Creates a template of the history followed by the new messages.
+        :param new_history: Template messages for this turn, context messages first.
+        :param context_message_count: How many of new_history are context rather than the user's prompt.
+        :return: Chat template.
+        """
+        new_history = self.pending_messages + (new_history or [])
+        self._context_message_count = len(self.pending_messages) + context_message_count
+        self._new_message_count = len(new_history)
+        # Past messages are already rendered so they're added as messages and never re-formatted
+        return ChatPromptTemplate.from_messages(self.chat_history + new_history)
 
-    def append_output_to_chat(self, template: ChatPromptTemplate, prompt_dict: dict, llm_output: dict, total_added_messages: int = 1):
+    def append_output_to_chat(self, template: ChatPromptTemplate, prompt_dict: dict, llm_output: dict, total_added_messages: int = 1, image_summaries: list = None):
+        """
+        Records the turn from the last template with the model's output, then compacts history to fit the token budget.
+        :param template: Template returned by create_template.
+        :param prompt_dict: Prompt data used with the template.
+        :param llm_output: The model output.
+        :param image_summaries: Optional text stand-ins for the context images, strings or functions returning one.
+        """
         chat_output = template.invoke(prompt_dict)
-        self.chat_history = chat_output.messages
-        self.chat_history.append(("ai", llm_output.content))
-        
+        new_messages = chat_output.messages[len(chat_output.messages) - self._new_message_count:]
+        context = new_messages[:self._context_message_count]
+        prompt = new_messages[self._context_message_count:]
+        self.turns.append(ChatTurn(context, prompt, AIMessage(content=llm_output.content), image_summaries))
+        self.pending_messages = []
+        self.compact()
+
+    def compact(self):
+        """
+        Keeps history within max_tokens. Images in older turns are swapped for their summaries first,
+        then the context of older turns is dropped and finally the oldest turns are dropped altogether.
+        """
+        old_turns = self.turns[:-self.KEEP_RECENT_TURNS] if self.KEEP_RECENT_TURNS > 0 else self.turns
+        for turn in old_turns:
+            turn.summarise_images()
+        tokens = self.tokens()
+        if tokens <= self.max_tokens:
+            return
+        for turn in old_turns:
+            if tokens <= self.max_tokens:
+                break
+            tokens -= sum(ChatHistory.message_tokens(message) for message in turn.context)
+            turn.context = []
+        while tokens > self.max_tokens and len(self.turns) > 1:
+            tokens -= self.turns.pop(0).tokens()
+        if tokens > self.max_tokens:
+            # Only the latest turn is left, so its context goes too and just the question and answer are kept
+            self.turns[-1].context = []
+        logger.debug(f"Compacted chat history to {len(self.turns)} turns, about {self.tokens()} tokens")
+
+    def clear(self):
+        self.turns = []
+        self.pending_messages = []
@@ -1,6 +1,10 @@
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableLambda
 from src.llm.wrappers import ChatModelWrapper
-from langchain_text_splitters import TokenTextSplitter
+from src.llm.rate_limiter import RateLimiter
+from src.llm.response_cache import ResponseCache
+from src.llm.text_chunker import TextChunker
+from typing import Iterable, Iterator
 IMAGE_LABEL = "image"
 TEXT_LABEL = "text"
 class ContentFormatter:
@@ -97,10 +101,87 @@ class ContentFormatter:
         return prompt_map
 
 
-    def chat_to_model(template: ChatPromptTemplate, wrapper: ChatModelWrapper, prompt_data: dict) -> dict:
-        chain = template | wrapper.model
-        response = chain.invoke(prompt_data)
+    def estimate_tokens(prompt_data: dict) -> int:
+        """
+        Roughly estimates the input tokens of a prompt, used by the rate limiter for its tokens per minute budget.
+        Args:
+            prompt_data (dict): Prompt data for a template.
+        Returns:
+            int: Estimated token count.
+        """
+        tokens = 0
+        for key, value in prompt_data.items():
+            if IMAGE_LABEL in key:
+                tokens += RateLimiter.IMAGE_TOKENS
+            else:
+                tokens += RateLimiter.estimate_tokens(str(value))
+        return tokens
+
+    def _cache_key(wrapper: ChatModelWrapper, prompt_value):
+        cache = ResponseCache.for_wrapper(wrapper)
+        if cache is None:
+            return None, None
+        return cache, ResponseCache.make_key(wrapper.model_type.argName, prompt_value.to_messages())
+
+    def _invoke_model(wrapper: ChatModelWrapper, prompt_value, prompt_data: dict):
+        # The prompt is rendered once and reused for both the cache key and the model call
+        cache, key = ContentFormatter._cache_key(wrapper, prompt_value)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        response = wrapper.rate_limiter.call(lambda: wrapper.model.invoke(prompt_value), ContentFormatter.estimate_tokens(prompt_data))
+        if cache is not None:
+            cache.put(key, wrapper.model_type.argName, response)
+        return response
+
+    async def _ainvoke_model(wrapper: ChatModelWrapper, prompt_value, prompt_data: dict):
+        cache, key = ContentFormatter._cache_key(wrapper, prompt_value)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
+        response = await wrapper.rate_limiter.acall(lambda: wrapper.model.ainvoke(prompt_value), ContentFormatter.estimate_tokens(prompt_data))
+        if cache is not None:
+            cache.put(key, wrapper.model_type.argName, response)
         return response
+
+    def chat_to_model(template: ChatPromptTemplate, wrapper: ChatModelWrapper, prompt_data: dict) -> dict:
+        prompt_value = template.invoke(prompt_data)
+        return ContentFormatter._invoke_model(wrapper, prompt_value, prompt_data)
+
+    async def achat_to_model(template: ChatPromptTemplate, wrapper: ChatModelWrapper, prompt_data: dict) -> dict:
+        prompt_value = template.invoke(prompt_data)
+        return await ContentFormatter._ainvoke_model(wrapper, prompt_value, prompt_data)
+
+    def _batch_chain(wrapper: ChatModelWrapper):
+        # Every batch item carries its own template, so one batch can mix prompts with different image and text counts
+        def invoke(item):
+            template, prompt_data = item
+            return ContentFormatter._invoke_model(wrapper, template.invoke(prompt_data), prompt_data)
+
+        async def ainvoke(item):
+            template, prompt_data = item
+            return await ContentFormatter._ainvoke_model(wrapper, template.invoke(prompt_data), prompt_data)
+
+        return RunnableLambda(invoke, afunc=ainvoke)
+
+    def batch_chat_to_model(templates: list[ChatPromptTemplate], wrapper: ChatModelWrapper, prompt_data_list: list[dict]) -> list:
+        """
+        Sends several independent prompts to the model concurrently, limited by the provider's concurrency.
+        Args:
+            templates (list): Chat template for each prompt.
+            wrapper (ChatModelWrapper): The model to use.
+            prompt_data_list (list): Prompt data for each template.
+        Returns:
+            list: Model outputs in the same order as the prompts.
+        """
+        chain = ContentFormatter._batch_chain(wrapper)
+        return chain.batch(list(zip(templates, prompt_data_list)), config={"max_concurrency": wrapper.max_concurrency})
+
+    async def abatch_chat_to_model(templates: list[ChatPromptTemplate], wrapper: ChatModelWrapper, prompt_data_list: list[dict]) -> list:
+        chain = ContentFormatter._batch_chain(wrapper)
+        return await chain.abatch(list(zip(templates, prompt_data_list)), config={"max_concurrency": wrapper.max_concurrency})
         
 
     def append_to_chat(template: ChatPromptTemplate, chat_array: dict, prompt_data: dict, llm_output: dict) -> dict:
@@ -122,6 +203,8 @@ class ContentFormatter:
         
     def chunk_text(text, chunk_size: int = None, chunk_overlap: int = None) -> list:
         """Chunk the text into smaller pieces for embedding."""
-        text_splitter = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        chunks = text_splitter.split_text(text)
-        return chunks
\ No newline at end of file
+        return TextChunker.get(chunk_size, chunk_overlap).split(text)
+
+    def stream_chunks(pages: Iterable[str], chunk_size: int = None, chunk_overlap: int = None) -> Iterator[str]:
+        """Chunk page texts as they arrive, without joining the whole document first."""
+        return TextChunker.get(chunk_size, chunk_overlap).stream(pages)
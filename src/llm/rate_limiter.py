@@ -0,0 +1,216 @@
+import asyncio
+import random
+import threading
+import time
+from src.llm.model_catalogue import Providers
+from src.system_manager import LoggerController
+
+logger = LoggerController.get_logger()
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken from the bucket."""
+        self._refill(now)
+        # A single request larger than the bucket can never fit, so it only waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+
+def is_throttling_error(error: Exception) -> bool:
+    """Checks whether a provider error means we are sending requests too quickly."""
+    for error_class in type(error).__mro__:
+        if any(name in error_class.__name__ for name in ("RateLimit", "Throttl", "ResourceExhausted", "TooManyRequests")):
+            return True
+    if getattr(error, "status_code", None) == 429:
+        return True
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        # botocore ClientError
+        code = response.get("Error", {}).get("Code", "")
+        if code in ("ThrottlingException", "TooManyRequestsException", "ServiceQuotaExceededException"):
+            return True
+    message = str(error).lower()
+    return "429" in message or "throttl" in message or "rate limit" in message or "too many requests" in message
+
+
+class RateLimiter:
+    # Requests per minute, tokens per minute and the most requests in flight at once, None means unlimited
+    DEFAULT_LIMITS = {
+        Providers.OPENAI: (500, 30000, 8),
+        Providers.BEDROCK: (100, 200000, 4),
+        Providers.GEMINI: (300, 1000000, 4),
+        Providers.XAI: (300, 500000, 4),
+        Providers.HUGGINGFACE: (None, None, 1),
+        Providers.OLLAMA: (None, None, 1), # Local models share the one machine so running them concurrently only slows each down
+    }
+    # Models with quotas different to the rest of their provider, keyed by the model argName
+    MODEL_LIMITS = {
+        'anthropic.claude-3-sonnet-20240229-v1:0': (20, 100000, 2),
+        'mistral.mistral-large-2402-v1:0': (20, 50000, 2),
+        'meta.llama3-70b-instruct-v1:0': (20, 50000, 2),
+        'amazon.titan-embed-image-v1': (2000, None, 16), # Embedding quotas are far higher than chat models on the same provider
+    }
+    # Rough size of text and images in tokens, only used to pace requests so it doesn't need a tokenizer
+    CHARS_PER_TOKEN = 4
+    IMAGE_TOKENS = 800
+    MAX_RETRIES = 5
+    BASE_BACKOFF = 1.0
+    MAX_BACKOFF = 60.0
+
+    # Limiters are shared across the whole process so every wrapper of the same model draws from one budget
+    _limiters: dict[tuple[Providers, str], "RateLimiter"] = {}
+    _overrides: dict[str, dict] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, name: str, requests_per_minute: float | None = None, tokens_per_minute: float | None = None, max_concurrency: int = 1, max_retries: int = MAX_RETRIES):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max_retries
+        # AIMD: the concurrency limit grows by roughly one per window of successes and halves on every throttle
+        self.concurrency_limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def for_model(provider: Providers, model_name: str) -> "RateLimiter":
+        """Gets the process wide limiter for a provider and model, creating it on first use."""
+        key = (provider, model_name)
+        with RateLimiter._registry_lock:
+            limiter = RateLimiter._limiters.get(key)
+            if limiter is None:
+                limiter = RateLimiter(f"{provider.name.lower()}:{model_name}", *RateLimiter._limits_for(provider, model_name))
+                RateLimiter._limiters[key] = limiter
+            return limiter
+
+    @staticmethod
+    def _limits_for(provider: Providers, model_name: str) -> tuple:
+        requests_per_minute, tokens_per_minute, max_concurrency = RateLimiter.MODEL_LIMITS.get(model_name, RateLimiter.DEFAULT_LIMITS.get(provider, (None, None, 1)))
+        # Model overrides from config take priority over provider overrides
+        for key in (provider.name.lower(), model_name):
+            override = RateLimiter._overrides.get(key, {})
+            requests_per_minute = override.get("requests_per_minute", requests_per_minute)
+            tokens_per_minute = override.get("tokens_per_minute", tokens_per_minute)
+            max_concurrency = override.get("max_concurrency", max_concurrency)
+        return requests_per_minute, tokens_per_minute, max_concurrency
+
+    @staticmethod
+    def configure(overrides: dict):
+        """
+        Sets limits from config, keyed by provider name (e.g. "openai") or model argName.
+        Existing limiters are replaced so new wrappers pick up the change.
+        """
+        with RateLimiter._registry_lock:
+            if (overrides or {}) == RateLimiter._overrides:
+                # Keeps the limiters, and their learned concurrency, when a new config has the same limits
+                return
+            RateLimiter._overrides = overrides or {}
+            RateLimiter._limiters.clear()
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        return len(text) // RateLimiter.CHARS_PER_TOKEN + 1
+
+    def _concurrency_available(self) -> bool:
+        return self.in_flight < max(1, int(self.concurrency_limit))
+
+    def acquire(self, tokens: int = 0):
+        with self._condition:
+            while True:
+                if not self._concurrency_available():
+                    self._condition.wait()
+                    continue
+                now = time.monotonic()
+                wait = self.blocked_until - now
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1, now))
+                if self.tokens is not None and tokens > 0:
+                    wait = max(wait, self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    if self.requests is not None:
+                        self.requests.take(1)
+                    if self.tokens is not None and tokens > 0:
+                        self.tokens.take(tokens)
+                    self.in_flight += 1
+                    return
+                self._condition.wait(timeout=wait)
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self.concurrency_limit = min(float(self.max_concurrency), self.concurrency_limit + 1.0 / self.concurrency_limit)
+            self._condition.notify_all()
+
+    def on_throttle(self, attempt: int = 0) -> float:
+        """Halves the concurrency limit and pauses new requests, returning the pause length."""
+        backoff = min(self.MAX_BACKOFF, self.BASE_BACKOFF * (2 ** attempt))
+        # Full jitter so throttled callers don't all retry at the same moment
+        backoff = random.uniform(backoff / 2, backoff)
+        with self._condition:
+            self.concurrency_limit = max(1.0, self.concurrency_limit / 2)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + backoff)
+            self._condition.notify_all()
+        logger.warning(f"Throttled by {self.name}, concurrency limit now {int(self.concurrency_limit)}, pausing for {backoff:.1f}s")
+        return backoff
+
+    def call(self, fn, tokens: int = 0):
+        """
+        Runs fn within the rate limit, retrying it when the provider throttles us.
+        :param fn: Function making a single provider request.
+        :param tokens: Estimated tokens used by the request.
+        :return: The result of fn.
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                self.release()
+                if not is_throttling_error(e):
+                    raise
+                self.on_throttle(attempt)
+                if attempt == self.max_retries:
+                    raise
+                continue
+            self.release()
+            self.on_success()
+            return result
+
+    async def acall(self, afn, tokens: int = 0):
+        """Async version of call, afn must return a coroutine."""
+        for attempt in range(self.max_retries + 1):
+            await asyncio.to_thread(self.acquire, tokens)
+            try:
+                result = await afn()
+            except Exception as e:
+                self.release()
+                if not is_throttling_error(e):
+                    raise
+                self.on_throttle(attempt)
+                if attempt == self.max_retries:
+                    raise
+                continue
+            self.release()
+            self.on_success()
+            return result
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+from src.system_manager import LoggerController
+
+logger = LoggerController.get_logger()
+
+class ResponseCache:
+    DEFAULT_PATH = ".psycore_cache/llm_responses.sqlite"
+    DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+    DEFAULT_MAX_ENTRIES = 100000
+
+    # One cache is shared by the whole process, set up from config by configure
+    _shared: "ResponseCache" = None
+    _enabled = True
+    _settings = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path: str = DEFAULT_PATH, ttl_seconds: float | None = DEFAULT_TTL_SECONDS, max_entries: int | None = DEFAULT_MAX_ENTRIES):
+        """
+        Exact match cache of model responses stored in SQLite.
+        :param path: Path of the SQLite database file.
+        :param ttl_seconds: How long a response stays valid, None keeps them forever.
+        :param max_entries: Most responses to keep, the least recently used are evicted first. None means unlimited.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets several sweep processes read the cache while another writes to it
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+        """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._connection.commit()
+        self._puts_since_evict = 0
+
+    @staticmethod
+    def configure(enabled: bool = True, path: str = DEFAULT_PATH, ttl_seconds: float | None = DEFAULT_TTL_SECONDS, max_entries: int | None = DEFAULT_MAX_ENTRIES):
+        settings = {"path": path, "ttl_seconds": ttl_seconds, "max_entries": max_entries}
+        with ResponseCache._shared_lock:
+            if enabled == ResponseCache._enabled and settings == ResponseCache._settings:
+                return
+            ResponseCache._enabled = enabled
+            ResponseCache._settings = settings
+            if ResponseCache._shared is not None:
+                ResponseCache._shared.close()
+                ResponseCache._shared = None
+
+    @staticmethod
+    def shared() -> "ResponseCache":
+        """Gets the process wide cache, or None when caching is disabled."""
+        with ResponseCache._shared_lock:
+            if not ResponseCache._enabled:
+                return None
+            if ResponseCache._shared is None:
+                ResponseCache._shared = ResponseCache(**ResponseCache._settings)
+            return ResponseCache._shared
+
+    @staticmethod
+    def for_wrapper(wrapper) -> "ResponseCache":
+        """
+        Gets the cache for a model wrapper, only models running at temperature 0 are cached as others aren't deterministic.
+        :param wrapper: ChatModelWrapper being called.
+        :return: The shared cache or None.
+        """
+        if getattr(wrapper.model, "temperature", None) != 0:
+            return None
+        return ResponseCache.shared()
+
+    @staticmethod
+    def _normalise_content(content):
+        if isinstance(content, str):
+            return content
+        normalised = []
+        for part in content:
+            if isinstance(part, dict) and part.get("type") == "image_url":
+                url = part["image_url"]["url"] if isinstance(part["image_url"], dict) else part["image_url"]
+                if url.startswith("data:"):
+                    # Hashing the image keeps keys small while still telling different images apart
+                    url = "sha256:" + hashlib.sha256(url.encode("utf-8")).hexdigest()
+                normalised.append({"type": "image_url", "image_url": url})
+            else:
+                normalised.append(part)
+        return normalised
+
+    @staticmethod
+    def make_key(model_name: str, messages: list[BaseMessage]) -> str:
+        """
+        Creates the cache key for a rendered prompt.
+        :param model_name: The model argName.
+        :param messages: Rendered messages sent to the model.
+        :return: Hex digest key.
+        """
+        normalised = [[message.type, ResponseCache._normalise_content(message.content)] for message in messages]
+        payload = json.dumps([model_name, normalised], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_value(self, key: str) -> str:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            response, created = row
+            if self.ttl_seconds is not None and now - created > self.ttl_seconds:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+            self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+        return response
+
+    def put_value(self, key: str, model_name: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, model_name, value, now, now)
+            )
+            self._puts_since_evict += 1
+            # Counting rows on every write is wasteful, so eviction runs in batches
+            if self.max_entries is not None and self._puts_since_evict >= max(1, self.max_entries // 100):
+                self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        self._puts_since_evict = 0
+        if self.ttl_seconds is not None:
+            self._connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+        count = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if count > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+            logger.debug(f"Evicted {count - self.max_entries} cached LLM responses")
+
+    def get(self, key: str) -> BaseMessage:
+        value = self.get_value(key)
+        if value is None:
+            return None
+        return messages_from_dict([json.loads(value)])[0]
+
+    def put(self, key: str, model_name: str, response: BaseMessage):
+        self.put_value(key, model_name, json.dumps(messages_to_dict([response])[0]))
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+import threading
+from langchain_core.prompts import ChatPromptTemplate
+from src.llm.content_formatter import ContentFormatter, IMAGE_LABEL, TEXT_LABEL
+
+class TemplateCache:
+    """
+    Reuses compiled chat templates, since parsing large message lists on every call is slow.
+    Templates are described by a message spec, a tuple of (role, kind, count, label) entries where kind is
+    IMAGE_LABEL or TEXT_LABEL, e.g. (("user", IMAGE_LABEL, 2, "context"), ("user", TEXT_LABEL, 1, "prompt")).
+    """
+    MAX_TEMPLATES = 512
+
+    _templates = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def build_messages(message_spec: tuple) -> list:
+        """Creates the template messages for a message spec."""
+        messages = []
+        for role, kind, count, label in message_spec:
+            if kind == IMAGE_LABEL:
+                messages.append((role, ContentFormatter.prep_images(count, label)))
+            elif kind == TEXT_LABEL:
+                messages.append((role, ContentFormatter.prep_texts(count, label)))
+            else:
+                raise ValueError(f"Unknown message kind: {kind}")
+        return messages
+
+    @staticmethod
+    def get(system_prompt: str, message_spec: tuple) -> ChatPromptTemplate:
+        """
+        Gets the compiled template for a system prompt followed by the messages in message_spec.
+        :param system_prompt: The system prompt.
+        :param message_spec: Tuple of (role, kind, count, label) entries.
+        :return: Chat template, shared between callers so it must not be modified.
+        """
+        key = (system_prompt, tuple(message_spec))
+        with TemplateCache._lock:
+            template = TemplateCache._templates.get(key)
+            if template is not None:
+                TemplateCache._templates.move_to_end(key)
+                return template
+        chat = ContentFormatter.format_base_chat(system_prompt)
+        chat.extend(TemplateCache.build_messages(message_spec))
+        template = ContentFormatter.chat_to_template(chat)
+        with TemplateCache._lock:
+            TemplateCache._templates[key] = template
+            while len(TemplateCache._templates) > TemplateCache.MAX_TEMPLATES:
+                TemplateCache._templates.popitem(last=False)
+        return template
+
+    @staticmethod
+    def clear():
+        with TemplateCache._lock:
+            TemplateCache._templates.clear()
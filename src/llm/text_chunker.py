@@ -0,0 +1,93 @@
+import threading
+from typing import Iterable, Iterator
+import numpy as np
+import tiktoken
+
+class TextChunker:
+    """
+    Splits text into overlapping token windows, giving the same chunks as langchain's TokenTextSplitter.
+    The text is tokenized once and the windows are sliced from it, and chunkers are cached per settings
+    so the tiktoken encoding is only loaded once per process.
+    """
+    DEFAULT_ENCODING = "gpt2" # Matches TokenTextSplitter
+    DEFAULT_CHUNK_SIZE = 4000
+    DEFAULT_CHUNK_OVERLAP = 200
+
+    _chunkers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP, encoding_name: str = DEFAULT_ENCODING):
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+        if chunk_overlap < 0 or chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap must be between 0 and chunk_size ({chunk_size}), got {chunk_overlap}")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.step = chunk_size - chunk_overlap
+        # tiktoken caches encodings itself, this only saves the lookup
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+    @staticmethod
+    def get(chunk_size: int = None, chunk_overlap: int = None, encoding_name: str = DEFAULT_ENCODING) -> "TextChunker":
+        """Gets the shared chunker for these settings, creating it on first use."""
+        if chunk_size is None:
+            chunk_size = TextChunker.DEFAULT_CHUNK_SIZE
+        if chunk_overlap is None:
+            chunk_overlap = TextChunker.DEFAULT_CHUNK_OVERLAP
+        key = (chunk_size, chunk_overlap, encoding_name)
+        with TextChunker._lock:
+            chunker = TextChunker._chunkers.get(key)
+            if chunker is None:
+                chunker = TextChunker(chunk_size, chunk_overlap, encoding_name)
+                TextChunker._chunkers[key] = chunker
+            return chunker
+
+    def encode(self, text: str) -> list[int]:
+        # Same special token handling as TokenTextSplitter
+        return self.encoding.encode(text, allowed_special=set(), disallowed_special="all")
+
+    def window_offsets(self, token_count: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Works out the start and end of every window over token_count tokens.
+        :param token_count: Number of tokens in the text.
+        :return: Arrays of window starts and ends.
+        """
+        if token_count == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # Windows stop at the first one that reaches the end of the text
+        window_count = 1 + max(0, -(-(token_count - self.chunk_size) // self.step))
+        starts = np.arange(window_count, dtype=np.int64) * self.step
+        ends = np.minimum(starts + self.chunk_size, token_count)
+        return starts, ends
+
+    def split(self, text: str) -> list[str]:
+        """
+        Splits text into chunks of chunk_size tokens that overlap by chunk_overlap tokens.
+        :param text: Text to split.
+        :return: List of chunks.
+        """
+        tokens = self.encode(text)
+        starts, ends = self.window_offsets(len(tokens))
+        return self.encoding.decode_batch([tokens[start:end] for start, end in zip(starts.tolist(), ends.tolist())])
+
+    def stream(self, pages: Iterable[str]) -> Iterator[str]:
+        """
+        Yields chunks from an iterator of page texts without holding the whole document in memory.
+        Pages are tokenized separately, so chunks can differ slightly from split on the joined text where a token spans two pages.
+        :param pages: Iterable of page texts.
+        :return: Iterator of chunks.
+        """
+        buffer = []
+        emitted = False
+        for page in pages:
+            buffer.extend(self.encode(page))
+            if len(buffer) < self.chunk_size:
+                continue
+            starts = np.arange(0, len(buffer) - self.chunk_size + 1, self.step, dtype=np.int64)
+            for chunk in self.encoding.decode_batch([buffer[start:start + self.chunk_size] for start in starts.tolist()]):
+                yield chunk
+            emitted = True
+            buffer = buffer[int(starts[-1]) + self.step:]
+        # The last full window already covered the overlap, so only leftover tokens beyond it make a final chunk
+        if len(buffer) > (self.chunk_overlap if emitted else 0):
+            yield self.encoding.decode(buffer)
@@ -9,12 +9,16 @@ from langchain_ollama.embeddings import OllamaEmbeddings
 from src.system_manager.LocalCredentials import LocalCredentials
 from src.llm import ModelType, EmbeddingType, Providers, ModelCatalogue
 from langchain_xai import ChatXAI
-
+from src.llm.rate_limiter import RateLimiter
 
 class ChatModelWrapper:
     def __init__(self, model_type: ModelType):
         self.model_type = model_type
         provider = model_type.provider
+        # Shared with every other wrapper of this model so concurrent callers stay within the provider's limits
+        self.rate_limiter = RateLimiter.for_model(provider, model_type.argName)
+        # How many requests we send at once when batching prompts
+        self.max_concurrency = self.rate_limiter.max_concurrency
         if provider == Providers.OPENAI:
             credential = LocalCredentials.get_credential('OPENAI_API_KEY')
             self.model = ChatOpenAI(
@@ -46,6 +50,7 @@ class BaseModelWrapper:
     def __init__(self, model_type: ModelType):
         self.model_type = model_type
         provider = model_type.provider
+        self.rate_limiter = RateLimiter.for_model(provider, model_type.argName)
         # Some models may break as they may require chat specific APIs like ChatGPT latest
         if provider == Providers.OPENAI:
             credential = LocalCredentials.get_credential('OPENAI_API_KEY')
@@ -74,6 +79,7 @@ class BaseModelWrapper:
 class EmbeddingWrapper:
     def __init__(self, embedding_type: EmbeddingType):
         self.embedding_type = embedding_type
+        self.rate_limiter = RateLimiter.for_model(embedding_type.provider, embedding_type.model)
         if embedding_type.provider == Providers.OPENAI:
             credential = LocalCredentials.get_credential('OPENAI_API_KEY')
             self.embedding = OpenAIEmbeddings(
@@ -83,7 +89,6 @@ class EmbeddingWrapper:
         elif embedding_type.provider == Providers.BEDROCK:
             credential = LocalCredentials.get_credential('AWS_IAM_KEY')
             self.embedding = BedrockEmbeddings(model_id=embedding_type.model, aws_access_key_id=credential.user_key, aws_secret_access_key=credential.secret_key)
-            self.embedding.embed_query()
         elif embedding_type.provider == Providers.GEMINI:
             credential = LocalCredentials.get_credential('GEMINI_API_KEY')
             self.embedding = GoogleGenerativeAIEmbeddings(model=embedding_type.model, google_api_key=credential.secret_key)
@@ -93,4 +98,9 @@ class EmbeddingWrapper:
             raise NotImplementedError("Huggingface is not yet supported")
         else:
             raise ValueError("Invalid provider")
-            
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.rate_limiter.call(lambda: self.embedding.embed_query(text), RateLimiter.estimate_tokens(text))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.rate_limiter.call(lambda: self.embedding.embed_documents(texts), sum(RateLimiter.estimate_tokens(text) for text in texts))
@@ -1,9 +1,25 @@
 from src.kg.graph_creator import GraphCreator, GraphRelation, dict_data_to_relations, remove_dup_relations
+from src.kg.relation_matcher import RelationMatcher
 from src.data.s3_quick_fetch import S3QuickFetch
+from src.vector_database import Embedder
 from src.system_manager.LoggerController import LoggerController
+import hashlib
 import json
+import re
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+
+def split_sentences(text: str) -> list[str]:
+    """Splits text into sentences and lines, dropping empty ones and surrounding whitespace."""
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
 class IterativeStage:
-    def __init__(self, quick_fetch: S3QuickFetch, graphModel: GraphCreator, threshold: float = 0.5, rag_results = []):
+    def __init__(self, quick_fetch: S3QuickFetch, graphModel: GraphCreator, threshold: float = 0.5, rag_results = [], normalise_relations: bool = False, embedder: Embedder = None, similarity_threshold: float = None):
+        """
+        :param normalise_relations: Match the answer's relations to the documents' on normalised terms rather than exact strings.
+        :param embedder: Embedder for matching relations by nearest neighbour, used with similarity_threshold.
+        :param similarity_threshold: Cosine similarity from which relations count as matching, None only matches on terms.
+        """
         self.s3_quick_fetch = quick_fetch
         self.graphModel = graphModel
         self.threshold = threshold
@@ -30,31 +46,48 @@ class IterativeStage:
             self.chunk_summaries[rag_results[i]["vector_id"]] = {
                 "summary": self.s3_quick_fetch.pull_summary(rag_results[i])
             }
-            self.chunk_summaries[rag_results[i]["vector_id"]]["graph"] = self.graphModel.create_graph_relations(self.chunk_summaries[rag_results[i]["vector_id"]]["summary"])
+        # Summaries are graphed together so the graph model can batch them or run them concurrently
+        summary_graphs = self.graphModel.create_graph_relations_batch([value["summary"] for value in self.chunk_summaries.values()])
+        for value, graph in zip(self.chunk_summaries.values(), summary_graphs):
+            value["graph"] = graph
         self.mega_chunk_graph = []
         for key, value in self.chunk_summaries.items():
             self.logger.info(f"Processing graph document {key}")
             self.mega_chunk_graph.extend(value["graph"])
         self.mega_chunk_graph = remove_dup_relations(self.mega_chunk_graph)
-    
-    def relation_percentage(self, item_relations: list[GraphRelation], all_relations: list[GraphRelation]) -> float:
-        # Go through item relation, check if it exists in all_relations (treating all_relations as list of valid relations)
-        # We can then return the percentage of relations that are valid from item_relations
-        valid_items = 0 
-        for i in range(len(item_relations)):
-            if item_relations[i] in all_relations:
-                valid_items += 1
-        return valid_items / len(item_relations) if len(item_relations) > 0 else 0.0
-    
-    def return_missing_relations(self, item_relations: list[GraphRelation], all_relations: list[GraphRelation]) -> list[GraphRelation]:
-        # Go through item relation, check if it exists in all_relations (treating all_relations as list of valid relations)
-        # We can then return the percentage of relations that are valid from item_relations
-        missing_items = []
-        for i in range(len(item_relations)):
-            if item_relations[i] not in all_relations:
-                missing_items.append(item_relations[i])
-        return missing_items
-            
+        # LLM relations rarely match the documents' byte for byte, exact matching would report most of them as missing and retry
+        self.doc_matcher = RelationMatcher(self.mega_doc_graph, normalise_relations, embedder, similarity_threshold)
+        self.chunk_matcher = RelationMatcher(self.mega_chunk_graph, normalise_relations, embedder, similarity_threshold)
+        self._answer_graph = (None, None)
+        # Graphs of answer sentences by hash, retried answers mostly repeat earlier sentences
+        self._sentence_graphs = {}
+
+    def answer_graph(self, text: str) -> list[GraphRelation]:
+        """
+        Creates the graph of a whole answer, reusing the last one if the answer hasn't changed so evaluators share it.
+        """
+        if self._answer_graph[0] != text:
+            self._answer_graph = (text, self.graphModel.create_graph_relations(text))
+        return self._answer_graph[1]
+
+    def sentence_graph(self, text: str) -> list[GraphRelation]:
+        """
+        Creates the graph of an answer one sentence at a time, only graphing sentences not seen in an earlier answer,
+        so verifying a retried answer costs in proportion to how much of it changed.
+        Relations spanning sentences are missed, so evaluation still uses answer_graph.
+        """
+        sentences = split_sentences(text)
+        keys = [hashlib.sha256(sentence.encode("utf-8")).hexdigest() for sentence in sentences]
+        new_sentences = {}
+        for key, sentence in zip(keys, sentences):
+            if key not in self._sentence_graphs:
+                new_sentences[key] = sentence
+        self.logger.info(f"Graphing {len(new_sentences)} new of {len(sentences)} answer sentences")
+        if len(new_sentences) > 0:
+            graphs = self.graphModel.create_graph_relations_batch(list(new_sentences.values()))
+            self._sentence_graphs.update(zip(new_sentences.keys(), graphs))
+        # dict keeps the first of each relation in order, like remove_dup_relations without comparing every pair
+        return list(dict.fromkeys(relation for key in keys for relation in self._sentence_graphs[key]))
     
     def decision_maker(self, rag_results: list[dict], rag_chat_results):
         """
@@ -65,11 +98,11 @@ class IterativeStage:
         :param additional_params: Additional parameters for decision-making.
         :return: The decision made based on the rag_result and additional_params.
         """
-        llm_graph = self.graphModel.create_graph_relations(rag_chat_results.content)
+        llm_graph = self.sentence_graph(rag_chat_results.content)
             
-        valid_relations = self.relation_percentage(llm_graph, self.mega_doc_graph)
+        valid_relations = self.doc_matcher.match_ratio(llm_graph)
         if valid_relations < self.threshold:
-            missing_relations = self.return_missing_relations(llm_graph, self.mega_chunk_graph)
+            missing_relations = self.chunk_matcher.missing(llm_graph)
             self.logger.info(f"Valid relations: {valid_relations} is below threshold: {self.threshold}")
             return (valid_relations, missing_relations, llm_graph)
         else:
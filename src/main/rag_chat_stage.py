@@ -4,24 +4,34 @@ from src.data.s3_handler import S3Handler
 from src.data.s3_quick_fetch import S3QuickFetch
 
 class RAGChatStage:
-    def __init__(self, wrapper: ChatModelWrapper, s3_handler: S3Handler):
+    def __init__(self, wrapper: ChatModelWrapper, s3_handler: S3Handler, s3_quick_fetch: S3QuickFetch = None):
         self.chat_agent = ChatAgent(wrapper,history=True, system_prompt="""
 You are an information retrieval and vertification assistant, you will recieve a variety of source documents and will be asked queries by a user. Your job is to answer user queries as accurately as possible given the information you have available and to prevent halluciations where you can by double checking your sources.
 Refer to any sources provided as third party not as user provided.
                                     """)
         self.s3_handler = s3_handler
-        self.s3_quick_fetch = S3QuickFetch(s3_handler)
+        # Stages can share a quick fetch so they share its image cache
+        self.s3_quick_fetch = s3_quick_fetch if s3_quick_fetch is not None else S3QuickFetch(s3_handler)
 
     def chat(self, prompt: str, rag_results: list) -> str:
+        # We collect every image first so they can be fetched and prepared concurrently
+        image_results = []
+        for result in rag_results:
+            if result["type"] == "image" or result["type"] == "attachment_image":
+                image_results.append(result)
+            elif result["type"] != "text":
+                raise ValueError(f"Unknown result type: {result['type']}")
+        images = iter(self.s3_quick_fetch.get_result_images(image_results))
+
         context = []
         for result in rag_results:
             if result["type"] == "text":
                 context.append(result["text"])
-            elif result["type"] == "image" or result["type"] == "attachment_image":
-                context.append(self.s3_quick_fetch.get_image(result["image_path"]))
             else:
-                raise ValueError(f"Unknown result type: {result['type']}")
+                context.append(next(images))
+        # Summaries are only fetched if the images are later compacted out of the chat history
+        image_summaries = [lambda result=result: self.s3_quick_fetch.pull_summary(result) for result in image_results]
         prompt = [prompt]
-        return self.chat_agent.process_prompt(prompt, context)
-    
+        return self.chat_agent.process_prompt(prompt, context, image_summaries)
+
 
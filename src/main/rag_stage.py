@@ -1,17 +1,24 @@
-from src.vector_database import VectorService
+from src.vector_database import VectorService, ChunkStore
 class RAGStage:
-    def __init__(self, vector_service: VectorService, k: int = 20):
+    def __init__(self, vector_service: VectorService, k: int = 20, chunk_store: ChunkStore = None):
         self.vector_service = vector_service
         self.k = k
+        # Needed when the vectors were stored with chunk and document IDs rather than their text and paths
+        self.chunk_store = chunk_store
 
     def get_rag_prompt(self, prompt: str) -> dict:
         results = self.vector_service.get_data(prompt, self.k)
-        return [self.map_scores(result) for result in results]
+        return self.hydrate([self.map_scores(result) for result in results])
     
     def get_rag_prompt_filtered(self, prompt: str, text_threshold: float = 0.5) -> list[dict]:
         results = self.get_rag_prompt(prompt)
         return self.filter_results(results, text_threshold)
     
+    def get_rag_prompts_filtered(self, prompts: list[str], text_threshold: float = 0.5) -> list[list[dict]]:
+        """Retrieves results for several prompts at once, in the same order as prompts."""
+        results = self.vector_service.get_data_batch(prompts, self.k)
+        return [self.filter_results(self.hydrate([self.map_scores(result) for result in prompt_results]), text_threshold) for prompt_results in results]
+
     def filter_results(self, results: list[dict], text_threshold: float = 0.5) -> list[dict]:
         # We keep everything in sorted order, if it's an image, we keep it regardless of score as they vary a lot
         # But for text, we only keep it if it's above the threshold
@@ -28,14 +35,45 @@ class RAGStage:
         result =  {
             "vector_id": results["id"],
             "score": results["score"],
-            "document_path": results["metadata"]["document_path"],
-            "graph_path": results["metadata"]["graph_path"],
             "type": results["metadata"]["type"]
         }
+        # Pinecone returns numbers in metadata as floats
+        if "doc_id" in results["metadata"]:
+            result["doc_id"] = int(results["metadata"]["doc_id"])
+        else:
+            result["document_path"] = results["metadata"]["document_path"]
+            result["graph_path"] = results["metadata"]["graph_path"]
         if result["type"] == "text":
-            result["text"] = results["metadata"]["text"]
+            if "chunk_id" in results["metadata"]:
+                result["chunk_id"] = int(results["metadata"]["chunk_id"])
+            else:
+                result["text"] = results["metadata"]["text"]
         elif result["type"] == "image":
             result["image_path"] = results["metadata"]["image_path"]
         elif result["type"] == "attachment_image":
             result["image_path"] = results["metadata"]["image_path"]
+        if result["type"] != "text":
+            result["summary_path"] = results["metadata"].get("summary_path")
+            if "llm_image_path" in results["metadata"]:
+                result["llm_image_path"] = results["metadata"]["llm_image_path"]
         return result
+
+    def hydrate(self, results: list[dict]) -> list[dict]:
+        """
+        Fills in chunk text and document paths from the chunk store, reading all of them in one go.
+        Results that already have them, from vectors stored before the chunk store, are left as they are.
+        """
+        chunk_results = [result for result in results if "chunk_id" in result]
+        document_results = [result for result in results if "doc_id" in result]
+        if len(chunk_results) == 0 and len(document_results) == 0:
+            return results
+        if self.chunk_store is None:
+            raise ValueError("Results reference the chunk store but RAGStage was created without one")
+        texts = self.chunk_store.get_chunks([result.pop("chunk_id") for result in chunk_results])
+        for result, text in zip(chunk_results, texts):
+            result["text"] = text
+        documents = self.chunk_store.get_documents([result.pop("doc_id") for result in document_results])
+        for result, document in zip(document_results, documents):
+            result["document_path"] = document["document_path"]
+            result["graph_path"] = document["graph_path"]
+        return results
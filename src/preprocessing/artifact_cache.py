@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from numpy import ndarray
+from src.system_manager import LoggerController
+
+logger = LoggerController.get_logger()
+
+class ArtifactCache:
+    """
+    Caches the intermediate results of preprocessing so configs only recompute what their settings change.
+    Each kind of artifact is keyed by a hash of its inputs and whatever produced it:
+    extractions by the document's contents, summaries by the summariser and image,
+    graphs by the graph creator and text, and embeddings by the embedder and content.
+    """
+    DEFAULT_PATH = ".psycore_cache/artifacts.sqlite"
+    EXTRACTION = "extraction"
+    SUMMARY = "summary"
+    GRAPH = "graph"
+    EMBEDDING = "embedding"
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets several sweep processes read artifacts while another writes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS artifacts (
+                kind TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (kind, key)
+            )
+        """)
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hashes the parts identifying an artifact, strings and bytes are hashed as they are."""
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+            digest.update(hashlib.sha256(part).digest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def get_many(self, kind: str, keys: list[str]) -> dict:
+        if len(keys) == 0:
+            return {}
+        values = {}
+        with self._lock:
+            # SQLite limits the number of parameters in one query
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._connection.execute(
+                    f"SELECT key, value FROM artifacts WHERE kind = ? AND key IN ({','.join('?' * len(batch))})",
+                    [kind] + batch
+                ).fetchall()
+                values.update(rows)
+        return values
+
+    def put_many(self, kind: str, items: dict):
+        if len(items) == 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO artifacts (kind, key, value, created) VALUES (?, ?, ?, ?)",
+                [(kind, key, value, now) for key, value in items.items()]
+            )
+            self._connection.commit()
+
+    def get_json(self, kind: str, key: str):
+        value = self.get_many(kind, [key]).get(key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def put_json(self, kind: str, key: str, value):
+        self.put_many(kind, {key: json.dumps(value)})
+
+    def cached_strings(self, kind: str, keys: list[str], compute) -> list[str]:
+        """
+        Gets a string artifact for each key, computing only the missing ones in a single call.
+        :param kind: Artifact kind.
+        :param keys: Artifact keys.
+        :param compute: Function given the indexes of the missing keys, returning their values in the same order.
+        :return: Values in the same order as keys.
+        """
+        cached = self.get_many(kind, keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        logger.info(f"Reusing {len(keys) - len(missing)} of {len(keys)} cached {kind} artifacts")
+        if len(missing) > 0:
+            computed = compute(missing)
+            new_items = {keys[i]: value for i, value in zip(missing, computed)}
+            self.put_many(kind, new_items)
+            cached.update(new_items)
+        return [cached[key] for key in keys]
+
+    def cached_embeddings(self, embedding_key: str, contents: list, compute) -> list[ndarray]:
+        """
+        Gets an embedding for each piece of content, only embedding content not seen by this embedder before.
+        :param embedding_key: The embedder's embedding_key.
+        :param contents: Texts or image bytes.
+        :param compute: Function embedding a list of contents, e.g. embedder.batch_text_to_embedding.
+        :return: Embeddings in the same order as contents.
+        """
+        keys = [self.make_key(embedding_key, content) for content in contents]
+        cached = self.get_many(self.EMBEDDING, keys)
+        missing = [i for i, key in enumerate(keys) if key not in cached]
+        logger.info(f"Reusing {len(keys) - len(missing)} of {len(keys)} cached embeddings")
+        embeddings = {key: np.frombuffer(value, dtype=np.float32) for key, value in cached.items()}
+        if len(missing) > 0:
+            computed = compute([contents[i] for i in missing])
+            new_items = {}
+            for i, embedding in zip(missing, computed):
+                embedding = np.asarray(embedding, dtype=np.float32)
+                embeddings[keys[i]] = embedding
+                new_items[keys[i]] = embedding.tobytes()
+            self.put_many(self.EMBEDDING, new_items)
+        return [embeddings[key] for key in keys]
+
+    def clear(self, kind: str = None):
+        with self._lock:
+            if kind is None:
+                self._connection.execute("DELETE FROM artifacts")
+            else:
+                self._connection.execute("DELETE FROM artifacts WHERE kind = ?", (kind,))
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
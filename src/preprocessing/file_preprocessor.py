@@ -1,25 +1,31 @@
 from src.vector_database.vector_service import VectorService
 from src.data.s3_handler import S3Handler, S3Bucket
-from src.data.attachments import Attachment, AttachmentTypes
+from src.data.attachments import Attachment, AttachmentTypes, SUMMARY_SYSTEM_PROMPT
 from src.vector_database import Embedder
+from src.vector_database.chunk_store import ChunkStore
 from src.llm.wrappers import ChatModelWrapper
 from src.kg.graph_creator import GraphCreator
+from src.preprocessing.artifact_cache import ArtifactCache
 import base64, json, re
+import fitz
 from io import BytesIO
-from PIL import Image
 from src.system_manager import LoggerController
 
 logger = LoggerController.get_logger()
 
 class FilePreprocessor:
 
-    def __init__(self, s3_handler: S3Handler, vector_database: VectorService, embedder : Embedder, imageConverter: ChatModelWrapper, graph_creator: GraphCreator):
+    def __init__(self, s3_handler: S3Handler, vector_database: VectorService, embedder : Embedder, imageConverter: ChatModelWrapper, graph_creator: GraphCreator, chunk_store: ChunkStore = None, artifact_cache: ArtifactCache = None):
         logger.debug("Entering FilePreprocessor.__init__")
         self.s3_handler = s3_handler
         self.vector_database = vector_database
         self.embedder = embedder
         self.imageConverter = imageConverter
         self.graphModel = graph_creator
+        # Without a chunk store the chunk text and document paths are kept in the vector metadata
+        self.chunk_store = chunk_store
+        # Without an artifact cache every step is recomputed on each run
+        self.artifact_cache = artifact_cache
         logger.debug("Exiting FilePreprocessor.__init__")
 
     def process_files(self, files):
@@ -31,9 +37,114 @@ class FilePreprocessor:
                 key=file,
                 process_callback=self.process_file
             )
+        if self.chunk_store is not None:
+            self.chunk_store.sync_to_s3()
         logger.debug("Exiting process_files")
 
+    def document_metadata(self, document_path: str, graph_path: str) -> dict:
+        """
+        Gets the metadata identifying a document, which is just its ID when a chunk store is used.
+        """
+        if self.chunk_store is None:
+            return {"document_path": document_path, "graph_path": graph_path}
+        return {"doc_id": self.chunk_store.add_document(document_path, graph_path)}
+
+    def text_metadata(self, document_metadata: dict, chunks: list[str]) -> list[dict]:
+        """
+        Gets the metadata for each text chunk, storing the text in the chunk store when there is one.
+        """
+        if self.chunk_store is None:
+            return [{**document_metadata, "text": chunk, "type": "text"} for chunk in chunks]
+        chunk_ids = self.chunk_store.add_chunks(document_metadata["doc_id"], chunks)
+        self.chunk_store.flush()
+        return [{**document_metadata, "chunk_id": chunk_id, "type": "text"} for chunk_id in chunk_ids]
+
+    def extract(self, file_path: str) -> Attachment:
+        """
+        Extracts a document's text and images, reusing a previous extraction of the same file contents.
+        """
+        attachment_file = Attachment(AttachmentTypes.from_filename(file_path),file_path, needs_extraction=True, additional_data=None)
+        if self.artifact_cache is None:
+            attachment_file.extract()
+            return attachment_file
+        key = ArtifactCache.make_key(attachment_file.attachment_type.name, ArtifactCache.hash_file(file_path))
+        cached = self.artifact_cache.get_json(ArtifactCache.EXTRACTION, key)
+        if cached is not None:
+            logger.info(f"Reusing cached extraction of {file_path}")
+            attachment_file.attachment_data = self._extraction_from_json(cached)
+            attachment_file.needs_extraction = False
+            return attachment_file
+        attachment_file.extract()
+        if not attachment_file.needs_extraction and attachment_file.attachment_data is not None:
+            self.artifact_cache.put_json(ArtifactCache.EXTRACTION, key, self._extraction_to_json(attachment_file.attachment_data))
+        return attachment_file
+
+    @staticmethod
+    def _extraction_to_json(data):
+        """Copy of extracted data with the fitz.Rect bounding boxes of PDF images stored as (x0, y0, x1, y1)."""
+        if not isinstance(data, dict) or "images" not in data:
+            return data
+        return {**data, "images": [{**image, "bbox": tuple(image["bbox"])} if "bbox" in image else image for image in data["images"]]}
+
+    @staticmethod
+    def _extraction_from_json(data):
+        """Rebuilds the fitz.Rect bounding boxes of a cached extraction, so it matches a fresh one."""
+        if not isinstance(data, dict) or "images" not in data:
+            return data
+        return {**data, "images": [{**image, "bbox": fitz.Rect(*image["bbox"])} if "bbox" in image else image for image in data["images"]]}
 
+    def summarise_images(self, attachments: list[Attachment]) -> list[str]:
+        """
+        Summarises image attachments, only sending images this summariser hasn't described before to the model.
+        """
+        if self.artifact_cache is None:
+            return Attachment.batch_text_summary(attachments, self.imageConverter)
+        summariser_key = f"{self.imageConverter.model_type.argName}:{SUMMARY_SYSTEM_PROMPT}"
+        keys = [ArtifactCache.make_key(summariser_key, attachment.attachment_data) for attachment in attachments]
+        return self.artifact_cache.cached_strings(
+            ArtifactCache.SUMMARY, keys,
+            lambda missing: Attachment.batch_text_summary([attachments[i] for i in missing], self.imageConverter)
+        )
+
+    def create_graph(self, text: str) -> list[dict]:
+        """
+        Creates the graph of a text, reusing a graph made by a graph creator with the same settings.
+        """
+        if self.artifact_cache is None:
+            return self.graphModel.create_graph_dict(text)
+        key = ArtifactCache.make_key(self.graphModel.graph_key(), text)
+        graph = self.artifact_cache.get_json(ArtifactCache.GRAPH, key)
+        if graph is None:
+            graph = self.graphModel.create_graph_dict(text)
+            self.artifact_cache.put_json(ArtifactCache.GRAPH, key, graph)
+        else:
+            logger.info("Reusing cached graph")
+        return graph
+
+    def embed_texts(self, chunks: list[str]) -> list:
+        if self.artifact_cache is None:
+            return self.embedder.batch_text_to_embedding(chunks)
+        return self.artifact_cache.cached_embeddings(self.embedder.embedding_key(), chunks, self.embedder.batch_text_to_embedding)
+
+    def embed_images(self, images: list[bytes]) -> list:
+        if self.artifact_cache is None:
+            return self.embedder.batch_image_to_embedding(images)
+        return self.artifact_cache.cached_embeddings(self.embedder.embedding_key(), images, self.embedder.batch_image_to_embedding)
+
+
+
+    def upload_llm_image(self, document_name: str, binary_image: BytesIO, image_number: int) -> str:
+        """
+        Stores the resized JPEG that the MLLM receives next to the original image, so queries don't have to re-derive it.
+        :param document_name: Name of the document the image belongs to.
+        :param binary_image: The original image.
+        :param image_number: Index of the image within the document.
+        :return: S3 URI of the LLM ready image.
+        """
+        binary_image.seek(0)
+        llm_image_bytes, _, _ = Attachment.prepare_llm_image(binary_image)
+        binary_image.seek(0)
+        return self.s3_handler.upload_llm_image(document_name, llm_image_bytes, image_number)
 
     def process_file(self, file_path: str, additional_data : dict):
         logger.debug("Entering process_file with file_path=%s, additional_data=%s", file_path, additional_data)
@@ -42,16 +153,19 @@ class FilePreprocessor:
         :param file_path: Path to the file.
         :param additional_data: Additional data to be stored with the file.
         """
-        attachment_file = Attachment(AttachmentTypes.from_filename(file_path),file_path, needs_extraction=True, additional_data=None)
-        attachment_file.extract()
+        attachment_file = self.extract(file_path)
         bucket_name, document_name, graph_path = None, None, None
         if additional_data is not None and "key" in additional_data.keys():
             bucket_name = S3Bucket.DOCUMENTS.value
             document_name = additional_data["key"]
-            graph_path = f"{document_name}/graph.json"
+            graph_path = self.s3_handler.graph_key(document_name)
         if attachment_file.needs_extraction:
             print("Failed to read attachment")
         else:
+            document_metadata = self.document_metadata(
+                f"s3://{S3Bucket.DOCUMENTS.value}/{additional_data['key']}",
+                f"s3://{S3Bucket.GRAPHS.value}/{graph_path}",
+            )
             appended_data = ""
             data = ""
             if type(attachment_file.attachment_data) is str:
@@ -61,44 +175,35 @@ class FilePreprocessor:
                 if attachment_file.attachment_type == AttachmentTypes.IMAGE:
                     binary_image = BytesIO(base64.b64decode(data))
                     try:
-                        embedding_ready_image = Image.open(binary_image)
-                        embedded_image = self.embedder.image_to_embedding(embedding_ready_image)
-                        embedding_ready_image.close()
+                        # The encoded image is passed straight through so embedders that accept JPEG bytes skip a decode and re-encode
+                        embedded_image = self.embed_images([binary_image.getvalue()])[0]
                         
                         binary_image.seek(0)
-                        image_s3_uri = self.s3_handler.upload_image(document_name, binary_image)
-                        summary = self.imageConverter.text_summary(binary_image)
+                        image_s3_uri = self.s3_handler.upload_image(document_name, binary_image, 0)
+                        llm_image_s3_uri = self.upload_llm_image(document_name, binary_image, 0)
+                        summary = self.summarise_images([Attachment(AttachmentTypes.IMAGE, data)])[0]
                         summary_s3_uri = self.s3_handler.upload_document_summary(document_name, summary)
                         logger.info(f"Image {document_name} uploaded to S3 and added to vector database")
                         self.vector_database.add_data(embedded_image, {
-                            "document_path": f"s3://{S3Bucket.DOCUMENTS.value}/{additional_data['key']}",
-                            "graph_path": f"s3://{S3Bucket.GRAPHS.value}/{graph_path}",
+                            **document_metadata,
                             "summary_path": summary_s3_uri,
                             "image_path": image_s3_uri,
+                            "llm_image_path": llm_image_s3_uri,
                             "type": "image",
                         })
-                        graph = self.graphModel.create_graph_dict(summary)
+                        graph = self.create_graph(summary)
                         self.s3_handler.upload_graph(document_name, json.dumps(graph))
                     finally:
                         binary_image.close()
                 else:
                     # If the attachment is a text file, we chunk it and add it to the vector database
                     chunked_data = self.embedder.chunk_text(data)
-                    chunk_embeddings = []
-                    metadata_list = []
-                    for i, chunk in enumerate(chunked_data):
-                        logger.info(f"Embedding chunk {i+1} of {len(chunked_data)}")
-                        embedded_chunk = self.embedder.text_to_embedding(chunk)
-                        chunk_embeddings.append(embedded_chunk)
-                        metadata_list.append({
-                            "document_path": f"s3://{S3Bucket.DOCUMENTS.value}/{additional_data['key']}",
-                            "graph_path": f"s3://{S3Bucket.GRAPHS.value}/{graph_path}",
-                            "text": chunk,
-                            "type": "text"
-                        })
+                    logger.info(f"Embedding {len(chunked_data)} chunks")
+                    chunk_embeddings = self.embed_texts(chunked_data)
+                    metadata_list = self.text_metadata(document_metadata, chunked_data)
                     self.vector_database.batch_add_data(chunk_embeddings, metadata_list,batch_size=50)
                     self.s3_handler.upload_document_text(document_name, data, file_type="summary")
-                    graph = self.graphModel.create_graph_dict(data)
+                    graph = self.create_graph(data)
                     self.s3_handler.upload_graph(document_name, json.dumps(graph))
 
             elif type(attachment_file.attachment_data) is dict:
@@ -110,9 +215,14 @@ class FilePreprocessor:
                     attachment_images = [
                         Attachment.image_to_attachment(image, additional_data=additional_data) for image in attachment_file.attachment_data["images"]
                     ]
+                    logger.info(f"Summarising {len(attachment_images)} images")
+                    text_summaries = self.summarise_images(attachment_images)
+                    logger.info(f"Embedding {len(attachment_images)} images")
+                    # attachment_data is already the base64 JPEG, which is passed straight through so embedders that accept JPEG bytes skip a decode and re-encode
+                    image_embeddings = self.embed_images([base64.b64decode(image.attachment_data) for image in attachment_images])
                     for i, image in enumerate(attachment_images):
                         logger.info(f"Processing image {i+1} of {len(attachment_images)}")
-                        text_summary = image.text_summary(self.imageConverter)
+                        text_summary = text_summaries[i]
                         image.additional_data["summary"] = text_summary
                         image.additional_data["image_path"] = f"{document_name}/image{i}"
                         logger.info(f"Uploading image {i+1} to S3")
@@ -120,18 +230,15 @@ class FilePreprocessor:
                         
                         binary_image = BytesIO(base64.b64decode(image.attachment_data)) # attachment_data is already the base64 string
                         try:
-                            embedding_ready_image = Image.open(binary_image)
-                            embedded_image = self.embedder.image_to_embedding(embedding_ready_image)
-                            embedding_ready_image.close()
-                            
-                            binary_image.seek(0)
+                            embedded_image = image_embeddings[i]
                             image_s3_uri = self.s3_handler.upload_image(document_name, binary_image, i)
+                            llm_image_s3_uri = self.upload_llm_image(document_name, binary_image, i)
                             
                             self.vector_database.add_data(embedded_image, {
-                                "document_path": f"s3://{S3Bucket.DOCUMENTS.value}/{additional_data['key']}",
-                                "graph_path": f"s3://{S3Bucket.GRAPHS.value}/{graph_path}",
+                                **document_metadata,
                                 "summary_path": summary_s3_uri,
                                 "image_path": image_s3_uri,
+                                "llm_image_path": llm_image_s3_uri,
                                 "type": "attachment_image",
                             })
                             logger.info(f"Image {i} uploaded to S3 and added to vector database")
@@ -143,27 +250,19 @@ class FilePreprocessor:
                         data = re.sub(r'\s+', ' ', data)
                         data = data.strip()
                         chunked_data = self.embedder.chunk_text(data)
-                        chunk_embeddings = []
-                        metadata_list = []
-                        for i, chunk in enumerate(chunked_data):
-                            logger.info(f"Processing chunk {i+1} of {len(chunked_data)}")
-                            if (chunk is None or chunk.strip() == ""):
-                                logger.warning(f"Skipping chunk: {chunk}")
-                                continue
-                            embedded_chunk = self.embedder.text_to_embedding(chunk)
-                            chunk_embeddings.append(embedded_chunk)
-                            metadata_list.append({
-                                "document_path": f"s3://{S3Bucket.DOCUMENTS.value}/{additional_data['key']}",
-                                "graph_path": f"s3://{S3Bucket.GRAPHS.value}/{graph_path}",
-                                "text": chunk,
-                                "type": "text"
-                            })
+                        non_empty_chunks = [chunk for chunk in chunked_data if chunk is not None and chunk.strip() != ""]
+                        if len(non_empty_chunks) < len(chunked_data):
+                            logger.warning(f"Skipping {len(chunked_data) - len(non_empty_chunks)} empty chunks")
+                        chunked_data = non_empty_chunks
+                        logger.info(f"Embedding {len(chunked_data)} chunks")
+                        chunk_embeddings = self.embed_texts(chunked_data)
+                        metadata_list = self.text_metadata(document_metadata, chunked_data)
                         self.vector_database.batch_add_data(chunk_embeddings, metadata_list,batch_size=50)
                         data += appended_data
                         logger.info(f"Uploading document text to S3")
                         self.s3_handler.upload_document_text(document_name, data, file_type="summary")
                         logger.info(f"Creating graph")
-                        graph = self.graphModel.create_graph_dict(data)
+                        graph = self.create_graph(data)
                         logger.info(f"Uploading graph to S3")
                         self.s3_handler.upload_graph(document_name, json.dumps(graph))
             else:
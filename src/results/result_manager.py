@@ -2,20 +2,27 @@ import pandas as pd
 import os
 import json
 import hashlib
+import sqlite3
+import tempfile
+import threading
+import time
 from typing import Dict, Any, List
 
 class ResultManager:
     
-    def __init__(self, directory: str = "./results", csv_locator: str = "results.csv", doc_id_delimiter: str = "|"):
+    def __init__(self, directory: str = "./results", csv_locator: str = "results.csv", doc_id_delimiter: str = "|", db_locator: str = "results.sqlite"):
         """
-        Initializes the ResultManager with the given directory and CSV file name.
+        Initializes the ResultManager with the given directory and tracker file names.
+        Results are tracked in SQLite, the CSV is only written by export_csv.
 
-        :param directory: Directory where results and CSV will be stored
-        :param csv_locator: Name of the CSV file for tracking results
+        :param directory: Directory where results and the tracker will be stored
+        :param csv_locator: Name of the CSV file results are exported to, and imported from if the database is new
         :param doc_id_delimiter: Delimiter to use when converting document_ids list to string
+        :param db_locator: Name of the SQLite database tracking results
         """
         self.results_dir = directory
         self.csv_path = os.path.join(self.results_dir, csv_locator)
+        self.db_path = os.path.join(self.results_dir, db_locator)
         self.doc_id_delimiter = doc_id_delimiter
         
         os.makedirs(self.results_dir, exist_ok=True)
@@ -40,6 +47,39 @@ class ResultManager:
             "iteration.pass_threshold"
         ]
         self.all_columns = self.base_columns + self.config_columns + ["result_path"]
+        
+        self._lock = threading.Lock()
+        new_database = not os.path.exists(self.db_path)
+        # Waits for other workers' writes rather than failing while the database is locked
+        self._connection = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False)
+        # WAL lets workers read while another one writes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._create_table()
+        if new_database and os.path.exists(self.csv_path):
+            self.import_csv(self.csv_path)
+    
+    @staticmethod
+    def _quote(column: str) -> str:
+        return '"' + column.replace('"', '""') + '"'
+    
+    def _create_table(self):
+        columns = ", ".join(f"{self._quote(col)} TEXT NOT NULL DEFAULT ''" for col in self.config_columns)
+        with self._lock:
+            self._connection.execute(f"""
+                CREATE TABLE IF NOT EXISTS results (
+                    config_hash TEXT PRIMARY KEY,
+                    {columns},
+                    result_path TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+            # Databases made before a config column was added get it now
+            existing = {row[1] for row in self._connection.execute("PRAGMA table_info(results)")}
+            for col in self.config_columns:
+                if col not in existing:
+                    self._connection.execute(f"ALTER TABLE results ADD COLUMN {self._quote(col)} TEXT NOT NULL DEFAULT ''")
+            self._connection.commit()
     
     def _hash_config(self, config: Dict[str, Any]) -> str:
         """Create a hash of the config dictionary for unique identification."""
@@ -54,6 +94,11 @@ class ResultManager:
         :return: Tuple of (exists: bool, hash: str)
         """
         config_hash = self._hash_config(config)
+        with self._lock:
+            row = self._connection.execute("SELECT 1 FROM results WHERE config_hash = ?", (config_hash,)).fetchone()
+        if row is not None:
+            return True, config_hash
+        # Results written before they were tracked in the database
         result_path = os.path.join(self.results_dir, f"{config_hash}.json")
         return os.path.exists(result_path), config_hash
     
@@ -83,7 +128,8 @@ class ResultManager:
     
     def write_result(self, config: dict, result: dict):
         """
-        Writes results to a JSON file and updates the CSV tracker
+        Writes results to a JSON file and records them in the result tracker.
+        Safe to call from several threads and processes at once.
         
         :param config: The configuration dictionary
         :param result: The result dictionary to be saved
@@ -92,51 +138,86 @@ class ResultManager:
         
         result_path = os.path.join(self.results_dir, f"{config_hash}.json")
         
-        with open(result_path, "w") as f:
+        # Written to a temporary file first so readers never see a half written result
+        with tempfile.NamedTemporaryFile("w", dir=self.results_dir, suffix=".tmp", delete=False) as f:
             json.dump(result, indent=4, fp=f)
+        os.replace(f.name, result_path)
         
         flattened_config = self._flatten_config(config)
         
-        self._update_csv_tracker(flattened_config, config_hash, result_path)
+        self._record_results([self._tracker_row(flattened_config, config_hash, result_path)])
         
         return result_path
     
-    def _update_csv_tracker(self, flattened_config: dict, config_hash: str, result_path: str):
+    def _tracker_row(self, flattened_config: dict, config_hash: str, result_path: str) -> dict:
         """
-        Updates the CSV tracker with the new result information.
-        Uses predefined columns from the known config structure with result_path at the end.
-        No longer includes the full JSON config.
+        Builds the tracker entry for a result from the predefined config columns.
         
         :param flattened_config: Flattened configuration dictionary
         :param config_hash: Hash of the configuration
         :param result_path: Path to the saved result file
         """
-        new_row_data = {
-            "config_hash": config_hash,
-            "result_path": result_path
-        }
-        
-        for col in self.config_columns:
-            new_row_data[col] = ""  
-            
-        for key, value in flattened_config.items():
-            if key in self.config_columns:
-                
-                new_row_data[key] = value
-        
-        
-        if os.path.exists(self.csv_path):
-            df = pd.read_csv(self.csv_path)
-            
-            for col in self.all_columns:
-                if col not in df.columns:
-                    df[col] = ""  
-        else:
-            df = pd.DataFrame(columns=self.all_columns)
-        
-        new_row = pd.DataFrame([new_row_data], columns=self.all_columns)
+        row = {col: flattened_config.get(col, "") for col in self.config_columns}
+        row["config_hash"] = config_hash
+        row["result_path"] = result_path
+        return row
+    
+    def _record_results(self, rows: List[dict]):
+        """Inserts tracker rows in one transaction, replacing earlier results for the same config."""
+        columns = self.all_columns
+        query = f"INSERT OR REPLACE INTO results ({', '.join(self._quote(col) for col in columns)}, created) VALUES ({', '.join('?' * (len(columns) + 1))})"
+        now = time.time()
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(query, [[row[col] for col in columns] + [now] for row in rows])
+    
+    def get_result_path(self, config_hash: str) -> str | None:
+        """Path of the result file for a config hash, or None if there isn't one."""
+        with self._lock:
+            row = self._connection.execute("SELECT result_path FROM results WHERE config_hash = ?", (config_hash,)).fetchone()
+        return None if row is None else row[0]
+    
+    def to_dataframe(self) -> pd.DataFrame:
+        """Every tracked result with the same columns as the exported CSV, oldest first."""
+        query = f"SELECT {', '.join(self._quote(col) for col in self.all_columns)} FROM results ORDER BY created, rowid"
+        with self._lock:
+            rows = self._connection.execute(query).fetchall()
+        return pd.DataFrame(rows, columns=self.all_columns)
+    
+    def export_csv(self, output_path: str = None) -> str:
+        """
+        Writes the tracked results to a CSV file, by default the results.csv the tracker used to maintain.
         
-
-        df = pd.concat([df, new_row], ignore_index=True)
+        :param output_path: Where to write the CSV
+        :return: The path written to
+        """
+        if output_path is None:
+            output_path = self.csv_path
+        directory = os.path.dirname(output_path) or "."
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False, newline="") as f:
+            self.to_dataframe().to_csv(f, index=False)
+        os.replace(f.name, output_path)
+        return output_path
+    
+    def import_csv(self, csv_path: str) -> int:
+        """
+        Imports a results CSV written by the old tracker, later rows for the same config replace earlier ones.
         
-        df.to_csv(self.csv_path, index=False)
\ No newline at end of file
+        :param csv_path: Path to the CSV
+        :return: Number of rows imported
+        """
+        df = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+        rows = []
+        for record in df.to_dict("records"):
+            if not record.get("config_hash") or not record.get("result_path"):
+                continue
+            row = {col: record.get(col, "") for col in self.config_columns}
+            row["config_hash"] = record["config_hash"]
+            row["result_path"] = record["result_path"]
+            rows.append(row)
+        self._record_results(rows)
+        return len(rows)
+    
+    def close(self):
+        with self._lock:
+            self._connection.close()
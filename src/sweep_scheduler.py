@@ -0,0 +1,185 @@
+from src.config_iterator import ConfigIterator
+from src.llm.model_catalogue import ModelCatalogue, LocalModelType
+from src.system_manager import ConfigManager, LoggerController
+
+logger = LoggerController.get_logger()
+
+class ConfigProfile:
+    """
+    The parts of a config that decide how expensive it is to run after another one.
+    """
+    def __init__(self, fingerprint: str, local_models: frozenset, api_limited_models: frozenset):
+        self.fingerprint = fingerprint
+        self.local_models = local_models
+        self.api_limited_models = api_limited_models
+
+    def _key(self):
+        return (self.fingerprint, self.local_models, self.api_limited_models)
+
+    def __eq__(self, other):
+        return isinstance(other, ConfigProfile) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __str__(self):
+        return f"ConfigProfile(fingerprint={self.fingerprint}, local_models={sorted(self.local_models)}, api_limited_models={sorted(self.api_limited_models)})"
+
+class SweepScheduler:
+    """
+    Orders sweep configs to keep the expensive transitions between them to a minimum and splits the plan between workers.
+    Moving to a config with a different preprocessing fingerprint means preprocessing or switching data,
+    each local model it needs that the previous config didn't has to be loaded,
+    and configs run next to each other share rate limits, so neighbours using the same API limited model slow each other down.
+    """
+    PREPROCESSING_COST = 100.0
+    LOCAL_MODEL_COST = 10.0
+    API_LIMITED_COST = 1.0
+    # Relative cost of evaluating one config, used to balance shards
+    EVALUATION_COST = 5.0
+
+    def __init__(self, preprocessing_cost: float = PREPROCESSING_COST, local_model_cost: float = LOCAL_MODEL_COST, api_limited_cost: float = API_LIMITED_COST, evaluation_cost: float = EVALUATION_COST):
+        self.preprocessing_cost = preprocessing_cost
+        self.local_model_cost = local_model_cost
+        self.api_limited_cost = api_limited_cost
+        self.evaluation_cost = evaluation_cost
+
+    @staticmethod
+    def _models_used(config: ConfigManager) -> set:
+        models = {config.get_model(), config.get_text_summariser_model()}
+        if config.get_prompt_mode() != "original":
+            models.add(config.get_elaborator_model())
+        if config.is_graph_verification_enabled():
+            models.add(config.get_graph_llm_model() if config.get_graph_method() == "llm" else config.get_graph_method())
+        if config.get_embedding_method() == "clip":
+            models.add("clip")
+        models.discard(None)
+        return models
+
+    @staticmethod
+    def profile(config: dict) -> ConfigProfile:
+        """
+        :param config: Full config dictionary, as it would be written to config.yaml.
+        :return: The config's profile.
+        """
+        manager = ConfigManager.from_dict(config)
+        models = SweepScheduler._models_used(manager)
+        catalogue = ModelCatalogue._models
+        local_models = {model for model in models if model in ConfigIterator.HARDWARE_INTENSIVE_MODELS or isinstance(catalogue.get(model), LocalModelType)}
+        api_limited_models = {model for model in models if model in ConfigIterator.API_LIMITED_MODELS}
+        return ConfigProfile(manager.get_preprocessing_fingerprint(), frozenset(local_models), frozenset(api_limited_models))
+
+    def transition_cost(self, previous: ConfigProfile | None, current: ConfigProfile) -> float:
+        """Cost of running current straight after previous, or first when previous is None."""
+        if previous is None:
+            return self.preprocessing_cost + self.local_model_cost * len(current.local_models)
+        cost = 0.0
+        if previous.fingerprint != current.fingerprint:
+            cost += self.preprocessing_cost
+        cost += self.local_model_cost * len(current.local_models - previous.local_models)
+        cost += self.api_limited_cost * len(current.api_limited_models & previous.api_limited_models)
+        return cost
+
+    def _order_profiles(self, profiles: list[ConfigProfile]) -> list[ConfigProfile]:
+        """Nearest neighbour tour over the distinct profiles, improved by moving single profiles while that lowers the cost."""
+        if len(profiles) <= 1:
+            return list(profiles)
+        def path_cost(path):
+            return sum(self.transition_cost(path[i - 1] if i > 0 else None, path[i]) for i in range(len(path)))
+
+        best = None
+        # Each starting profile gives a different greedy tour, the cheapest is kept
+        for start in profiles:
+            path = [start]
+            remaining = [profile for profile in profiles if profile is not start]
+            while remaining:
+                next_profile = min(remaining, key=lambda profile: self.transition_cost(path[-1], profile))
+                path.append(next_profile)
+                remaining.remove(next_profile)
+            cost = path_cost(path)
+            if best is None or cost < best[0]:
+                best = (cost, path)
+        cost, path = best
+
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(path)):
+                for j in range(len(path)):
+                    if i == j:
+                        continue
+                    candidate = path[:i] + path[i + 1:]
+                    candidate.insert(j, path[i])
+                    candidate_cost = path_cost(candidate)
+                    if candidate_cost < cost:
+                        cost, path, improved = candidate_cost, candidate, True
+        return path
+
+    def schedule(self, configs: dict[str, dict]) -> list[str]:
+        """
+        Orders configs to minimise the total transition cost.
+        Configs with the same profile cost nothing to move between, so the search only orders the distinct profiles.
+        :param configs: Config dictionaries keyed by a name, such as their file path.
+        :return: Config names in the order to run them.
+        """
+        profiles = self._profiles(configs)
+        by_profile = {}
+        # Sorted so every worker computes the same plan however it listed the configs
+        for name in sorted(configs.keys()):
+            by_profile.setdefault(profiles[name], []).append(name)
+        plan = []
+        for profile in self._order_profiles(list(by_profile.keys())):
+            plan.extend(by_profile[profile])
+        logger.info(f"Scheduled {len(plan)} configs over {len(by_profile)} profiles with cost {self.plan_cost(configs, plan, profiles)}")
+        return plan
+
+    def _profiles(self, configs: dict[str, dict]) -> dict[str, ConfigProfile]:
+        return {name: self.profile(config) for name, config in configs.items()}
+
+    def plan_cost(self, configs: dict[str, dict], plan: list[str], profiles: dict[str, ConfigProfile] = None) -> float:
+        """Total transition cost of running the configs in plan order."""
+        if profiles is None:
+            profiles = self._profiles(configs)
+        cost = 0.0
+        previous = None
+        for name in plan:
+            cost += self.transition_cost(previous, profiles[name])
+            previous = profiles[name]
+        return cost
+
+    def shard(self, configs: dict[str, dict], plan: list[str], num_shards: int) -> list[list[str]]:
+        """
+        Splits a plan between workers. Configs sharing a preprocessing fingerprint stay on one worker
+        so each fingerprint is only preprocessed once, and fingerprints are handed out to balance the estimated work.
+        :param configs: Config dictionaries keyed by name.
+        :param plan: Ordered config names from schedule.
+        :param num_shards: Number of workers.
+        :return: A plan for each worker, each keeping the order of plan.
+        """
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        profiles = self._profiles(configs)
+        groups = {}
+        for name in plan:
+            groups.setdefault(profiles[name].fingerprint, []).append(name)
+        groups = list(groups.values())
+
+        # Largest groups first onto the least loaded worker
+        loads = [0.0] * num_shards
+        assigned = [set() for _ in range(num_shards)]
+        for group in sorted(groups, key=len, reverse=True):
+            shard_index = min(range(num_shards), key=lambda i: loads[i])
+            assigned[shard_index].update(group)
+            loads[shard_index] += self.preprocessing_cost + self.evaluation_cost * len(group)
+        return [[name for name in plan if name in names] for names in assigned]
+
+    def shard_for(self, configs: dict[str, dict], shard_index: int, num_shards: int) -> list[str]:
+        """
+        Schedules the configs and returns one worker's part of the plan.
+        Every worker given the same configs computes the same shards, so workers on different machines need no coordination.
+        Pass the full config set and skip configs that already have results within the returned shard,
+        filtering first would let workers that see different results split different sets.
+        """
+        if not 0 <= shard_index < num_shards:
+            raise ValueError(f"shard_index must be between 0 and {num_shards - 1}")
+        return self.shard(configs, self.schedule(configs), num_shards)[shard_index]
@@ -1,5 +1,7 @@
 import yaml
 import os
+import json
+import hashlib
 
 class ConfigError(Exception):
     pass
@@ -9,12 +11,24 @@ class ConfigManager:
     VALID_PROMPT_MODES = {"original", "elaborated", "q_learning","q_training"}
     VALID_LOG_LEVELS = {"DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"}
     VALID_EMBEDDING_METHODS = {"langchain", "clip", "aws"}
+    VALID_CLIP_BACKENDS = {"torch", "int8", "onnx"}
+    # Bump when the preprocessing output format changes so old vectors and artefacts aren't reused
+    PREPROCESSING_VERSION = 1
 
     def __init__(self, path="config.yaml"):
         self.path = path
         self.config = self._load()
         self._validate()
 
+    @classmethod
+    def from_dict(cls, config):
+        """Validates an already loaded config, e.g. a sweep variation that was never written to a file."""
+        manager = cls.__new__(cls)
+        manager.path = None
+        manager.config = config
+        manager._validate()
+        return manager
+
     def _load(self):
         if not os.path.exists(self.path):
             raise FileNotFoundError(f"Config file not found at: {self.path}")
@@ -47,6 +61,19 @@ class ConfigManager:
             if not isinstance(gv.get("llm_model"), str):
                 raise ConfigError("graph_verification.llm_model must be a string when method is 'llm'")
 
+        for key in ["bert_batch_size", "bert_num_beams", "bert_num_threads"]:
+            if gv.get(key) is not None and (not isinstance(gv[key], int) or gv[key] <= 0):
+                raise ConfigError(f"graph_verification.{key} must be a positive integer")
+        if gv.get("bert_chunk_overlap") is not None and (not isinstance(gv["bert_chunk_overlap"], int) or not 0 <= gv["bert_chunk_overlap"] < 1000):
+            raise ConfigError("graph_verification.bert_chunk_overlap must be an integer between 0 and 999")
+        if gv.get("bert_quantize") is not None and not isinstance(gv["bert_quantize"], bool):
+            raise ConfigError("graph_verification.bert_quantize must be a boolean")
+        if gv.get("relation_normalise") is not None and not isinstance(gv["relation_normalise"], bool):
+            raise ConfigError("graph_verification.relation_normalise must be a boolean")
+        threshold = gv.get("relation_similarity_threshold")
+        if threshold is not None and (not isinstance(threshold, (int, float)) or isinstance(threshold, bool) or not 0 < threshold <= 1):
+            raise ConfigError("graph_verification.relation_similarity_threshold must be a number between 0 and 1, or null")
+
         mode = c["prompt_mode"].get("mode")
         if mode not in self.VALID_PROMPT_MODES:
             raise ConfigError(f"prompt_mode.mode must be one of {self.VALID_PROMPT_MODES}")
@@ -54,8 +81,9 @@ class ConfigManager:
         if not isinstance(c["prompt_mode"].get("elaborator_model"), str):
             raise ConfigError("prompt_mode.elaborator_model must be a string")
 
-        if not isinstance(c["text_summariser"].get("model"), str):
-            raise ConfigError("text_summariser.model must be a string")
+        # Without a summariser model the primary model summarises
+        if c["text_summariser"].get("model") is not None and not isinstance(c["text_summariser"]["model"], str):
+            raise ConfigError("text_summariser.model must be a string or null")
 
         emb = c["embedding"]
         method = emb.get("method")
@@ -65,6 +93,8 @@ class ConfigManager:
         if method in ["langchain", "aws"]:
             if not isinstance(emb.get("model"), str):
                 raise ConfigError(f"embedding.model must be a string when method is '{method}'")
+        if emb.get("clip_backend", "torch") not in self.VALID_CLIP_BACKENDS:
+            raise ConfigError(f"embedding.clip_backend must be one of {self.VALID_CLIP_BACKENDS}")
 
         if not isinstance(c["logger"].get("level"), str):
             raise ConfigError("logger.level must be a string")
@@ -98,6 +128,47 @@ class ConfigManager:
         if not 0 <= iteration["pass_threshold"] <= 1:
             raise ConfigError("iteration.pass_threshold must be between 0 and 1")
 
+        llm_cache = c.get("llm_cache", {})
+        if not isinstance(llm_cache, dict):
+            raise ConfigError("llm_cache must be a mapping")
+        if not isinstance(llm_cache.get("enabled", True), bool):
+            raise ConfigError("llm_cache.enabled must be a boolean")
+        if not isinstance(llm_cache.get("path", ""), str):
+            raise ConfigError("llm_cache.path must be a string")
+        ttl_days = llm_cache.get("ttl_days", 30)
+        if ttl_days is not None and (not isinstance(ttl_days, (int, float)) or ttl_days <= 0):
+            raise ConfigError("llm_cache.ttl_days must be a positive number or null")
+        max_entries = llm_cache.get("max_entries", 100000)
+        if max_entries is not None and (not isinstance(max_entries, int) or max_entries <= 0):
+            raise ConfigError("llm_cache.max_entries must be a positive integer or null")
+
+        evaluation = c.get("evaluation", {})
+        if not isinstance(evaluation, dict):
+            raise ConfigError("evaluation must be a mapping")
+        for key in ["prompt_workers", "config_workers"]:
+            if key in evaluation and (not isinstance(evaluation[key], int) or evaluation[key] <= 0):
+                raise ConfigError(f"evaluation.{key} must be a positive integer")
+
+        artifact_cache = c.get("artifact_cache", {})
+        if not isinstance(artifact_cache, dict):
+            raise ConfigError("artifact_cache must be a mapping")
+        if not isinstance(artifact_cache.get("enabled", True), bool):
+            raise ConfigError("artifact_cache.enabled must be a boolean")
+        if not isinstance(artifact_cache.get("path", ""), str):
+            raise ConfigError("artifact_cache.path must be a string")
+
+        rate_limits = c.get("rate_limits") or {}
+        if not isinstance(rate_limits, dict):
+            raise ConfigError("rate_limits must be a mapping of provider or model names to limits")
+        for name, limits in rate_limits.items():
+            if not isinstance(limits, dict):
+                raise ConfigError(f"rate_limits.{name} must be a mapping")
+            for key, value in limits.items():
+                if key not in ("requests_per_minute", "tokens_per_minute", "max_concurrency"):
+                    raise ConfigError(f"rate_limits.{name}.{key} is not a recognised limit")
+                if value is not None and (not isinstance(value, (int, float)) or value <= 0):
+                    raise ConfigError(f"rate_limits.{name}.{key} must be a positive number or null")
+
     def get_model(self):
         return self.config["model"]["primary"]
 
@@ -115,6 +186,26 @@ class ConfigManager:
             return self.config["graph_verification"]["llm_model"]
         return None
 
+    def get_bert_kg_settings(self):
+        """Optional BERT graph model settings, missing keys use the BERT_KG defaults."""
+        gv = self.config["graph_verification"]
+        settings = {
+            "batch_size": gv.get("bert_batch_size"),
+            "num_beams": gv.get("bert_num_beams"),
+            "chunk_overlap": gv.get("bert_chunk_overlap"),
+            "quantize": gv.get("bert_quantize"),
+            "num_threads": gv.get("bert_num_threads"),
+        }
+        return {key: value for key, value in settings.items() if value is not None}
+
+    def is_relation_normalisation_enabled(self):
+        """Whether verification and evaluation match relations on normalised terms, off unless enabled."""
+        return self.config["graph_verification"].get("relation_normalise", False)
+
+    def get_relation_similarity_threshold(self):
+        """Cosine similarity from which verification matches relations by embedding, None when not set."""
+        return self.config["graph_verification"].get("relation_similarity_threshold")
+
     def get_prompt_mode(self):
         return self.config["prompt_mode"]["mode"]
 
@@ -122,7 +213,7 @@ class ConfigManager:
         return self.config["prompt_mode"]["elaborator_model"]
 
     def get_text_summariser_model(self):
-        return self.config["text_summariser"]["model"]
+        return self.config["text_summariser"].get("model")
 
     def get_embedding_method(self):
         return self.config["embedding"]["method"]
@@ -133,6 +224,9 @@ class ConfigManager:
             return self.config["embedding"]["model"]
         return None
 
+    def get_clip_backend(self):
+        return self.config["embedding"].get("clip_backend", "torch")
+
     def get_log_level(self):
         return self.config["logger"]["level"]
 
@@ -152,6 +246,63 @@ class ConfigManager:
     def get_iteration_pass_threshold(self):
         return self.config["iteration"]["pass_threshold"]
 
+    def is_llm_cache_enabled(self):
+        return self.config.get("llm_cache", {}).get("enabled", True)
+
+    def get_llm_cache_path(self):
+        return self.config.get("llm_cache", {}).get("path", ".psycore_cache/llm_responses.sqlite")
+
+    def get_llm_cache_ttl_seconds(self):
+        """Cache lifetime in seconds, None if cached responses never expire."""
+        ttl_days = self.config.get("llm_cache", {}).get("ttl_days", 30)
+        if ttl_days is None:
+            return None
+        return ttl_days * 24 * 60 * 60
+
+    def get_llm_cache_max_entries(self):
+        return self.config.get("llm_cache", {}).get("max_entries", 100000)
+
+    def get_evaluation_prompt_workers(self):
+        """Number of prompts evaluated at once."""
+        return self.config.get("evaluation", {}).get("prompt_workers", 4)
+
+    def get_evaluation_config_workers(self):
+        """Number of configs evaluated at once by PsycoreTestRunner.evaluate_configs."""
+        return self.config.get("evaluation", {}).get("config_workers", 1)
+
+    def is_artifact_cache_enabled(self):
+        return self.config.get("artifact_cache", {}).get("enabled", True)
+
+    def get_artifact_cache_path(self):
+        return self.config.get("artifact_cache", {}).get("path", ".psycore_cache/artifacts.sqlite")
+
+    def get_preprocessing_settings(self):
+        """The settings that change what preprocessing writes to the vector database and S3."""
+        gv = self.config["graph_verification"]
+        # Batch size and thread count only change how fast BERT runs, not the graphs it makes
+        bert_settings = {key: value for key, value in self.get_bert_kg_settings().items() if key not in ("batch_size", "num_threads")}
+        return {
+            "version": self.PREPROCESSING_VERSION,
+            "embedding_method": self.get_embedding_method(),
+            "embedding_model": self.get_embedding_model(),
+            "clip_backend": self.get_clip_backend() if self.get_embedding_method() == "clip" else None,
+            # Without a summariser model the primary model summarises the images
+            "text_summariser": self.get_text_summariser_model() if self.get_text_summariser_model() is not None else self.get_model(),
+            "graph_enabled": self.is_graph_verification_enabled(),
+            "graph_method": self.get_graph_method() if self.is_graph_verification_enabled() else None,
+            "graph_llm_model": self.get_graph_llm_model() if self.is_graph_verification_enabled() else None,
+            "bert_kg": bert_settings if gv["enabled"] and gv["method"] == "bert" else None,
+        }
+
+    def get_preprocessing_fingerprint(self):
+        """Short hash of the preprocessing settings, configs with the same one can share preprocessed data."""
+        settings = json.dumps(self.get_preprocessing_settings(), sort_keys=True)
+        return hashlib.sha256(settings.encode("utf-8")).hexdigest()[:16]
+
+    def get_rate_limits(self):
+        """Optional rate limit overrides keyed by provider name or model argName."""
+        return self.config.get("rate_limits") or {}
+
 # Example usage
 if __name__ == "__main__":
     try:
@@ -3,4 +3,5 @@ from .embedder import Embedder
 from .pinecone_service import PineconeService
 from .vector_service import VectorService
 from .langchain_embedder import LangchainEmbedder
-from .aws_embedder import AWSEmbedder
\ No newline at end of file
+from .aws_embedder import AWSEmbedder
+from .chunk_store import ChunkStore
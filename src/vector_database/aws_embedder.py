@@ -1,54 +1,74 @@
 from numpy import ndarray
 from boto3 import client
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from typing import BinaryIO, Union
 from PIL import Image
 import json
 from .embedder import Embedder
 from src.system_manager.LocalCredentials import LocalCredentials
+from src.llm.model_catalogue import Providers
+from src.llm.rate_limiter import RateLimiter
 import numpy as np
 class AWSEmbedder(Embedder):
     MODEL_NAMES = [
         "amazon.titan-embed-image-v1"
     ]
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: str, max_in_flight: int = None):
+        """
+        :param model_name: Bedrock embedding model.
+        :param max_in_flight: Most requests the batch methods keep in flight, defaults to the rate limiter's concurrency.
+        """
         super().__init__(90,30,1024)
         if model_name not in self.MODEL_NAMES:
             raise ValueError(f"Invalid model name: {model_name}, must be one of {self.MODEL_NAMES}")
         self.model_name = model_name
+        self.rate_limiter = RateLimiter.for_model(Providers.BEDROCK, model_name)
+        self.max_in_flight = max_in_flight or self.rate_limiter.max_concurrency
         self.client = client(
             service_name="bedrock-runtime",
             region_name=LocalCredentials.get_credential("AWS_DEFAULT_REGION").secret_key,
             aws_access_key_id=LocalCredentials.get_credential("AWS_IAM_KEY").user_key,
-            aws_secret_access_key=LocalCredentials.get_credential("AWS_IAM_KEY").secret_key
+            aws_secret_access_key=LocalCredentials.get_credential("AWS_IAM_KEY").secret_key,
+            # Enough pooled connections that concurrent requests don't queue for one, and throttling
+            # retries are left to the rate limiter so they back off together rather than per thread
+            config=Config(max_pool_connections=max(10, self.max_in_flight), retries={"max_attempts": 1, "mode": "standard"}, tcp_keepalive=True)
         )
         
-    def text_to_embedding(self, text: str) -> ndarray:
-        response = self.client.invoke_model(
+    def embedding_key(self) -> str:
+        return f"{type(self).__name__}:{self.model_name}"
+
+    def _invoke(self, body: dict, tokens: int = 0) -> ndarray:
+        response = self.rate_limiter.call(lambda: self.client.invoke_model(
             modelId=self.model_name,
             contentType="application/json",
             accept="application/json",
-            body=json.dumps({
-                "inputText": text
-            })
-        )
+            body=json.dumps(body)
+        ), tokens)
         response_body = json.loads(response.get("body").read())
         if response_body.get("message") is not None:
             raise Exception(response_body.get("message"))
         embedding = response_body.get("embedding")
         return np.array(embedding)
+
+    def _map_concurrently(self, fn, items: list) -> list:
+        if len(items) <= 1:
+            return [fn(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(items))) as executor:
+            return list(executor.map(fn, items))
+
+    def text_to_embedding(self, text: str) -> ndarray:
+        return self._invoke({"inputText": text}, RateLimiter.estimate_tokens(text))
     
-    def image_to_embedding(self, image: Union[Image.Image, BinaryIO]) -> ndarray:
+    def image_to_embedding(self, image: Union[Image.Image, BinaryIO, bytes]) -> ndarray:
+        # JPEG and PNG bytes are sent as they are, only other inputs are re-encoded
         image_base64 = self.image_to_base64(image)
-        response = self.client.invoke_model(
-            modelId=self.model_name,
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps({
-                "inputImage": image_base64
-            })
-        )
-        response_body = json.loads(response.get("body").read())
-        if response_body.get("message") is not None:
-            raise Exception(response_body.get("message"))
-        embedding = response_body.get("embedding")
-        return np.array(embedding)
\ No newline at end of file
+        return self._invoke({"inputImage": image_base64})
+
+    def batch_text_to_embedding(self, texts: list[str]) -> list[ndarray]:
+        """Embeds several texts, keeping up to max_in_flight requests running at once."""
+        return self._map_concurrently(self.text_to_embedding, texts)
+
+    def batch_image_to_embedding(self, images: list[Union[Image.Image, BinaryIO, bytes]]) -> list[ndarray]:
+        """Embeds several images, keeping up to max_in_flight requests running at once."""
+        return self._map_concurrently(self.image_to_embedding, images)
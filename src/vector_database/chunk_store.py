@@ -0,0 +1,192 @@
+import json
+import mmap
+import os
+import shutil
+import threading
+import numpy as np
+from src.data.s3_handler import S3Handler
+from src.system_manager import LoggerController
+
+logger = LoggerController.get_logger()
+
+class ChunkStore:
+    """
+    Holds chunk text and document paths outside the vector database, so vector metadata only needs integer IDs.
+    Text is stored as one UTF-8 file with an array of byte offsets, read through mmap so lookups don't load the whole store.
+    """
+    DEFAULT_DIR = ".psycore_cache/chunk_store"
+    TEXT_FILE = "chunks.bin"
+    OFFSETS_FILE = "chunk_offsets.npy"
+    CHUNK_DOCS_FILE = "chunk_docs.npy"
+    DOCUMENTS_FILE = "documents.json"
+    FILES = [TEXT_FILE, OFFSETS_FILE, CHUNK_DOCS_FILE, DOCUMENTS_FILE]
+    # ETag of the S3 offsets file the local copy matches, kept locally and never uploaded
+    S3_VERSION_FILE = "s3_version.json"
+
+    def __init__(self, s3_handler: S3Handler = None, directory: str = DEFAULT_DIR):
+        """
+        :param s3_handler: Optional S3 handler used to share the store between machines.
+        :param directory: Local directory of the store files.
+        """
+        self.s3_handler = s3_handler
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._offsets = [0]
+        self._chunk_docs = []
+        self._documents = []
+        self._text_mmap = None
+        self._text_file = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def load(self):
+        """Loads the store, downloading it from S3 first if there is no local copy or S3 has a newer one."""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        if self._loaded:
+            return
+        if self.s3_handler is not None:
+            # Another machine may have re-preprocessed and uploaded a different store since the local copy was made
+            remote_version = self.s3_handler.chunk_store_file_etag(self.OFFSETS_FILE)
+            if remote_version is not None and remote_version != self._local_version():
+                logger.info("Chunk store on S3 differs from the local copy, downloading it")
+                if self._download():
+                    self._write_local_version(remote_version)
+        if os.path.exists(self._path(self.OFFSETS_FILE)):
+            self._offsets = np.load(self._path(self.OFFSETS_FILE)).tolist()
+            self._chunk_docs = np.load(self._path(self.CHUNK_DOCS_FILE)).tolist()
+            with open(self._path(self.DOCUMENTS_FILE), "r") as f:
+                self._documents = json.load(f)
+        self._loaded = True
+
+    def _download(self) -> bool:
+        os.makedirs(self.directory, exist_ok=True)
+        for name in self.FILES:
+            data = self.s3_handler.download_chunk_store_file(name)
+            if data is None:
+                logger.debug(f"No chunk store file {name} on S3, starting an empty store")
+                return False
+            with open(self._path(name), "wb") as f:
+                f.write(data)
+        logger.info("Downloaded chunk store from S3")
+        return True
+
+    def _local_version(self):
+        if not os.path.exists(self._path(self.OFFSETS_FILE)) or not os.path.exists(self._path(self.S3_VERSION_FILE)):
+            return None
+        with open(self._path(self.S3_VERSION_FILE), "r") as f:
+            return json.load(f).get("etag")
+
+    def _write_local_version(self, etag: str):
+        with open(self._path(self.S3_VERSION_FILE), "w") as f:
+            json.dump({"etag": etag}, f)
+
+    def _close_reader(self):
+        if self._text_mmap is not None:
+            self._text_mmap.close()
+            self._text_mmap = None
+        if self._text_file is not None:
+            self._text_file.close()
+            self._text_file = None
+
+    def add_document(self, document_path: str, graph_path: str) -> int:
+        """
+        Registers a document, returning the ID stored in vector metadata in place of its paths.
+        """
+        with self._lock:
+            self._load()
+            self._documents.append({"document_path": document_path, "graph_path": graph_path})
+            return len(self._documents) - 1
+
+    def add_chunks(self, doc_id: int, chunks: list[str]) -> list[int]:
+        """
+        Appends chunk texts for a document.
+        :param doc_id: ID returned by add_document.
+        :param chunks: Chunk texts.
+        :return: Chunk IDs in the same order as chunks.
+        """
+        with self._lock:
+            self._load()
+            os.makedirs(self.directory, exist_ok=True)
+            first_id = len(self._chunk_docs)
+            encoded = [chunk.encode("utf-8") for chunk in chunks]
+            with open(self._path(self.TEXT_FILE), "ab") as f:
+                for data in encoded:
+                    f.write(data)
+                    self._offsets.append(self._offsets[-1] + len(data))
+                    self._chunk_docs.append(doc_id)
+            # The mapped text file is now out of date
+            self._close_reader()
+            return list(range(first_id, first_id + len(chunks)))
+
+    def flush(self):
+        """Writes the offsets and document table so the store can be reopened."""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            # Written to a temporary name first so a crash never leaves a half written index
+            for name, write in [
+                (self.OFFSETS_FILE, lambda f: np.save(f, np.array(self._offsets, dtype=np.int64))),
+                (self.CHUNK_DOCS_FILE, lambda f: np.save(f, np.array(self._chunk_docs, dtype=np.int32))),
+                (self.DOCUMENTS_FILE, lambda f: f.write(json.dumps(self._documents).encode("utf-8"))),
+            ]:
+                temp_path = self._path(name + ".tmp")
+                with open(temp_path, "wb") as f:
+                    write(f)
+                os.replace(temp_path, self._path(name))
+            if not os.path.exists(self._path(self.TEXT_FILE)):
+                open(self._path(self.TEXT_FILE), "wb").close()
+
+    def sync_to_s3(self):
+        """Flushes the store and uploads it to S3."""
+        if self.s3_handler is None:
+            return
+        self.flush()
+        with self._lock:
+            for name in self.FILES:
+                with open(self._path(name), "rb") as f:
+                    self.s3_handler.upload_chunk_store_file(name, f.read())
+            # Recorded so this machine doesn't download the store it just uploaded
+            self._write_local_version(self.s3_handler.chunk_store_file_etag(self.OFFSETS_FILE))
+        logger.info(f"Uploaded chunk store with {len(self._chunk_docs)} chunks to S3")
+
+    def get_chunks(self, chunk_ids: list[int]) -> list[str]:
+        """
+        Reads several chunks at once.
+        :param chunk_ids: Chunk IDs from vector metadata.
+        :return: Chunk texts in the same order as chunk_ids.
+        """
+        if len(chunk_ids) == 0:
+            return []
+        with self._lock:
+            self._load()
+            if self._offsets[-1] == 0:
+                # mmap can't map an empty file
+                return ["" for _ in chunk_ids]
+            if self._text_mmap is None:
+                self._text_file = open(self._path(self.TEXT_FILE), "rb")
+                self._text_mmap = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ)
+            offsets = np.asarray(self._offsets, dtype=np.int64)
+            ids = np.asarray(chunk_ids, dtype=np.int64)
+            starts = offsets[ids].tolist()
+            ends = offsets[ids + 1].tolist()
+            return [self._text_mmap[start:end].decode("utf-8") for start, end in zip(starts, ends)]
+
+    def get_documents(self, doc_ids: list[int]) -> list[dict]:
+        with self._lock:
+            self._load()
+            return [self._documents[doc_id] for doc_id in doc_ids]
+
+    def reset(self):
+        """Deletes the local store, the S3 copy is removed when the buckets are reset."""
+        with self._lock:
+            self._close_reader()
+            if os.path.exists(self.directory):
+                shutil.rmtree(self.directory)
+            self._offsets = [0]
+            self._chunk_docs = []
+            self._documents = []
+            self._loaded = True
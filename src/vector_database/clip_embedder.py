@@ -1,32 +1,170 @@
+import os
+import numpy as np
+import torch
 from numpy import ndarray
 from transformers import CLIPProcessor, CLIPModel
 from typing import BinaryIO, Union
 from PIL import Image
+from io import BytesIO
 from .embedder import Embedder
+from src.system_manager import LoggerController
+
+logger = LoggerController.get_logger()
+
+class _TextTower(torch.nn.Module):
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+
+
+class _ImageTower(torch.nn.Module):
+    def __init__(self, model: CLIPModel):
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values):
+        return self.model.get_image_features(pixel_values=pixel_values)
+
+
 class CLIPEmbedder(Embedder):
     BASE_MODEL = "openai/clip-vit-base-patch32"
     PROCESSOR_MODEL = "openai/clip-vit-base-patch32"
+    # torch runs the model as is, int8 dynamically quantizes its linear layers and onnx runs exported towers on ONNX Runtime
+    BACKENDS = ["torch", "int8", "onnx"]
+    ONNX_DIR = ".psycore_cache/clip_onnx"
+    ONNX_OPSET = 14
+    # Lowest cosine similarity to the eager fp32 embeddings each backend is expected to keep
+    PARITY_THRESHOLDS = {"torch": 0.9999, "int8": 0.95, "onnx": 0.999}
 
-    def __init__(self):
+    def __init__(self, backend: str = "torch", batch_size: int = 32, onnx_dir: str = ONNX_DIR):
         super().__init__()
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Invalid CLIP backend: {backend}, must be one of {self.BACKENDS}")
+        self.backend = backend
+        self.batch_size = batch_size
         self.model = CLIPModel.from_pretrained(self.BASE_MODEL)
+        self.model.eval()
         self.processor = CLIPProcessor.from_pretrained(self.PROCESSOR_MODEL)
         self.max_clip_length = 77
+        self.quantized_model = None
+        self.text_session = None
+        self.image_session = None
+        if backend == "int8":
+            # The fp32 model is kept as the reference for check_parity
+            self.quantized_model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend == "onnx":
+            self._load_onnx(onnx_dir)
+
+    def _load_onnx(self, onnx_dir: str):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("The onnx CLIP backend requires onnxruntime, install it with `pip install onnxruntime`")
+        os.makedirs(onnx_dir, exist_ok=True)
+        text_path = os.path.join(onnx_dir, "clip_text.onnx")
+        image_path = os.path.join(onnx_dir, "clip_image.onnx")
+        if not os.path.exists(text_path):
+            logger.info(f"Exporting CLIP text tower to {text_path}")
+            inputs = self.processor(text=["export"], return_tensors="pt", padding=True)
+            torch.onnx.export(
+                _TextTower(self.model), (inputs["input_ids"], inputs["attention_mask"]), text_path,
+                input_names=["input_ids", "attention_mask"], output_names=["embeds"],
+                dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"}, "embeds": {0: "batch"}},
+                opset_version=self.ONNX_OPSET,
+            )
+        if not os.path.exists(image_path):
+            logger.info(f"Exporting CLIP image tower to {image_path}")
+            inputs = self.processor(images=Image.new("RGB", (224, 224)), return_tensors="pt")
+            torch.onnx.export(
+                _ImageTower(self.model), (inputs["pixel_values"],), image_path,
+                input_names=["pixel_values"], output_names=["embeds"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "embeds": {0: "batch"}},
+                opset_version=self.ONNX_OPSET,
+            )
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.text_session = onnxruntime.InferenceSession(text_path, options, providers=["CPUExecutionProvider"])
+        self.image_session = onnxruntime.InferenceSession(image_path, options, providers=["CPUExecutionProvider"])
+
+    def embedding_key(self) -> str:
+        # Quantized backends give slightly different embeddings so they're cached separately
+        return f"{type(self).__name__}:{self.BASE_MODEL}:{self.backend}"
+
+    @staticmethod
+    def _normalise(embeddings: ndarray) -> ndarray:
+        return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    @staticmethod
+    def _to_pil(image: Union[Image.Image, BinaryIO, bytes]) -> Image.Image:
+        if isinstance(image, Image.Image):
+            return image
+        if isinstance(image, bytes):
+            return Image.open(BytesIO(image))
+        image.seek(0)
+        return Image.open(image)
+
+    def _text_features(self, texts: list[str], backend: str) -> ndarray:
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True, truncation=True, max_length=self.max_clip_length)
+        if backend == "onnx":
+            return self.text_session.run(["embeds"], {
+                "input_ids": inputs["input_ids"].numpy().astype(np.int64),
+                "attention_mask": inputs["attention_mask"].numpy().astype(np.int64),
+            })[0]
+        model = self.quantized_model if backend == "int8" else self.model
+        with torch.inference_mode():
+            return model.get_text_features(**inputs).numpy()
+
+    def _image_features(self, images: list[Image.Image], backend: str) -> ndarray:
+        inputs = self.processor(images=images, return_tensors="pt")
+        if backend == "onnx":
+            return self.image_session.run(["embeds"], {"pixel_values": inputs["pixel_values"].numpy()})[0]
+        model = self.quantized_model if backend == "int8" else self.model
+        with torch.inference_mode():
+            return model.get_image_features(**inputs).numpy()
+
+    def batch_text_to_embedding(self, texts: list[str]) -> list[ndarray]:
+        """Embeds several texts, running batch_size of them through the model at once."""
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            embeddings.extend(self._normalise(self._text_features(texts[start:start + self.batch_size], self.backend)))
+        return embeddings
+
+    def batch_image_to_embedding(self, images: list[Union[Image.Image, BinaryIO, bytes]]) -> list[ndarray]:
+        """Embeds several images, running batch_size of them through the model at once."""
+        embeddings = []
+        for start in range(0, len(images), self.batch_size):
+            batch = [self._to_pil(image) for image in images[start:start + self.batch_size]]
+            embeddings.extend(self._normalise(self._image_features(batch, self.backend)))
+        return embeddings
 
-    
     def text_to_embedding(self,text : str):
         """Convert chunk data to embedding."""
-        inputs = self.processor(text=[text], return_tensors="pt", padding=True, truncation=True, max_length=self.max_clip_length)
-        embedding = self.model.get_text_features(**inputs)
-        embedding = embedding[0] / embedding.norm()
-        embedding = embedding.detach().numpy()
-        return embedding
-    
-    def image_to_embedding(self, image: Union[Image.Image, BinaryIO]):
+        return self.batch_text_to_embedding([text])[0]
+
+    def image_to_embedding(self, image: Union[Image.Image, BinaryIO, bytes]):
         """Convert image data to embedding."""
-        inputs = self.processor(images=image, return_tensors="pt", padding=True, truncation=True, max_length=self.max_clip_length)
-        embedding = self.model.get_image_features(**inputs)
-        embedding = embedding[0] / embedding.norm()
-        embedding = embedding.detach().numpy()
-        return embedding
-    
+        return self.batch_image_to_embedding([image])[0]
+
+    def check_parity(self, texts: list[str], images: list[Union[Image.Image, BinaryIO, bytes]] = None) -> float:
+        """
+        Compares this backend's embeddings with the eager fp32 model's.
+        :param texts: Sample texts to embed.
+        :param images: Optional sample images to embed.
+        :return: The lowest cosine similarity between the two, 1.0 means identical.
+        """
+        similarities = []
+        if len(texts) > 0:
+            expected = self._normalise(self._text_features(texts, "torch"))
+            actual = self._normalise(self._text_features(texts, self.backend))
+            similarities.extend(np.sum(expected * actual, axis=1))
+        if images:
+            pil_images = [self._to_pil(image) for image in images]
+            expected = self._normalise(self._image_features(pil_images, "torch"))
+            actual = self._normalise(self._image_features(pil_images, self.backend))
+            similarities.extend(np.sum(expected * actual, axis=1))
+        lowest = float(min(similarities)) if similarities else 1.0
+        logger.info(f"CLIP {self.backend} backend parity, lowest cosine similarity to eager: {lowest:.5f}")
+        return lowest
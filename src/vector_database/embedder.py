@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import BinaryIO, Union
+from typing import BinaryIO, Iterable, Iterator, Union
 from PIL import Image
 from src.llm.content_formatter import ContentFormatter
 from numpy import ndarray
@@ -13,6 +13,10 @@ class Embedder(ABC):
         self.chunk_overlap = chunk_overlap
         self.dimension_output = dimension_output
 
+    def embedding_key(self) -> str:
+        """Identifies the embedding space, so cached embeddings are never mixed between models."""
+        return f"{type(self).__name__}:{self.dimension_output}"
+
     def chunk_text(self,text, chunk_size: int = None, chunk_overlap: int = None) -> list:
         """Chunk the text into smaller pieces for embedding."""
         if chunk_size is None:
@@ -21,12 +25,38 @@ class Embedder(ABC):
             chunk_overlap = self.chunk_overlap
         return ContentFormatter.chunk_text(text, chunk_size, chunk_overlap)
 
+    def stream_chunks(self, pages: Iterable[str], chunk_size: int = None, chunk_overlap: int = None) -> Iterator[str]:
+        """Chunk an iterator of page texts for embedding, yielding chunks as they are ready."""
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        if chunk_overlap is None:
+            chunk_overlap = self.chunk_overlap
+        return ContentFormatter.stream_chunks(pages, chunk_size, chunk_overlap)
+
     @abstractmethod
     def text_to_embedding(chunk_data : str) -> ndarray:
         """Convert chunk data to embedding."""
         pass
 
-    def image_to_base64(self, image: Union[Image.Image, BinaryIO]) -> str:
+    def batch_text_to_embedding(self, texts: list[str]) -> list[ndarray]:
+        """Convert several chunks to embeddings, embedders that can batch override this."""
+        return [self.text_to_embedding(text) for text in texts]
+
+    # Formats embedding APIs accept directly, identified by their magic bytes
+    PASSTHROUGH_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n")
+
+    def image_to_base64(self, image: Union[Image.Image, BinaryIO, bytes]) -> str:
+        if isinstance(image, bytes):
+            image = BytesIO(image)
+        if not isinstance(image, Image.Image) and not isinstance(image, BytesIO):
+            # Other file-like objects are read into memory so they can be checked and re-read
+            image.seek(0)
+            image = BytesIO(image.read())
+        if isinstance(image, BytesIO):
+            image_bytes = image.getvalue()
+            if not image_bytes.startswith(self.PASSTHROUGH_SIGNATURES):
+                # Anything other than JPEG or PNG is decoded and re-encoded below
+                image = Image.open(BytesIO(image_bytes))
         if isinstance(image, Image.Image):
             # Convert to RGB if not already
             if image.mode != 'RGB':
@@ -46,4 +76,8 @@ class Embedder(ABC):
     @abstractmethod
     def image_to_embedding(image: Union[Image.Image, BinaryIO]) -> ndarray:
         """Convert image data to embedding."""
-        pass
\ No newline at end of file
+        pass
+
+    def batch_image_to_embedding(self, images: list[Union[Image.Image, BinaryIO]]) -> list[ndarray]:
+        """Convert several images to embeddings, embedders that can batch override this."""
+        return [self.image_to_embedding(image) for image in images]
@@ -8,8 +8,14 @@ class LangchainEmbedder(Embedder):
         super().__init__()
         self.embedding_wrapper = embedding_wrapper
 
+    def embedding_key(self) -> str:
+        return f"{type(self).__name__}:{self.embedding_wrapper.embedding_type.model}"
+
     def text_to_embedding(self, text: str) -> ndarray:
         return self.embedding_wrapper.embed_query(text)
 
+    def batch_text_to_embedding(self, texts: list[str]) -> list[ndarray]:
+        return self.embedding_wrapper.embed_documents(texts)
+
     def image_to_embedding(self, image: Union[Image.Image, BinaryIO]) -> ndarray:
         return self.embedding_wrapper.embed_image(image)
@@ -1,4 +1,7 @@
 from pinecone import Pinecone, ServerlessSpec
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import uuid
 from src.system_manager import LoggerController
 from src.vector_database.vector_service import VectorService
@@ -7,34 +10,60 @@ from numpy import ndarray
 logger = LoggerController.get_logger()
 
 class PineconeService(VectorService):
-    def __init__(self, embedder, credentials: dict):
+    QUERY_CACHE_SIZE = 1024
+    MAX_QUERY_WORKERS = 8
+
+    # Query embeddings are shared across services, as sweeps create a new service per config with the same embedder
+    _query_embeddings = OrderedDict()
+    _query_embeddings_lock = threading.Lock()
+
+    def __init__(self, embedder, credentials: dict, namespace: str = ""):
+        """
+        :param embedder: Embedder used for queries, its output dimension picks the index.
+        :param credentials: Dict with index_name, api_key and aws_region.
+        :param namespace: Namespace vectors are written to and read from, so several configs can share an index.
+        """
         super().__init__(embedder)
-        logger.info(f"Initializing PineconeService with index name: {credentials['index_name']}")
-        self.index_name = credentials['index_name']
+        self.region = credentials['aws_region']
+        self.namespace = namespace
         self.service = Pinecone(
             api_key=credentials['api_key']
         )
+        self.index_name = self._index_name_for(credentials['index_name'], embedder.dimension_output)
+        logger.info(f"Initializing PineconeService with index name: {self.index_name}, namespace: {self.namespace}")
         if self.index_name not in [i['name'] for i in self.service.list_indexes()]:
-            logger.info(f"Creating new Pinecone index: {self.index_name}")
-            self.service.create_index(
-                name=self.index_name,
-                dimension=embedder.dimension_output,
-                metric='cosine',
-                spec=ServerlessSpec(
-                    cloud='aws',
-                    region=credentials['aws_region']
-                )
-            )
+            self._create_index()
         self.index = self.service.Index(self.index_name)
         logger.debug("PineconeService initialization complete")
 
+    def _index_name_for(self, base_name: str, dimension: int) -> str:
+        """
+        Indexes have a fixed dimension, so embedders with a different one get their own index next to the configured one.
+        """
+        for index in self.service.list_indexes():
+            if index['name'] == base_name and index['dimension'] != dimension:
+                return f"{base_name}-{dimension}"
+        return base_name
+
+    def _create_index(self):
+        logger.info(f"Creating new Pinecone index: {self.index_name}")
+        self.service.create_index(
+            name=self.index_name,
+            dimension=self.embedder.dimension_output,
+            metric='cosine',
+            spec=ServerlessSpec(
+                cloud='aws',
+                region=self.region
+            )
+        )
+
     def gen_uuid(self):
         """Generate a unique ID for the data."""
         logger.debug("Generating new UUID for data")
         while True:
             uuid_id = str(uuid.uuid4())
             
-            fetch_result = self.index.fetch(ids=[uuid_id])
+            fetch_result = self.index.fetch(ids=[uuid_id], namespace=self.namespace)
             if not fetch_result.vectors:  
                 logger.debug(f"Generated unique UUID: {uuid_id}")
                 return uuid_id
@@ -53,7 +82,8 @@ class PineconeService(VectorService):
                     'id': uuid_id,
                     'values': embedding,
                     'metadata': data
-                }]
+                }],
+                namespace=self.namespace
             )
             logger.info(f"Successfully added data with ID: {uuid_id}")
         except Exception as e:
@@ -83,34 +113,80 @@ class PineconeService(VectorService):
             
             try:
                 logger.info(f"Upserting batch of {len(batch_vectors)} vectors")
-                self.index.upsert(vectors=batch_vectors)
+                self.index.upsert(vectors=batch_vectors, namespace=self.namespace)
                 logger.info(f"Successfully added batch of {len(batch_vectors)} vectors")
             except Exception as e:
                 logger.error(f"Failed to add batch to Pinecone: {str(e)}")
                 raise
 
-    def get_data(self, query: str,k=5) -> dict:
-        """Get data from the vector database."""
-        logger.info(f"Querying vector database with query: {query}, k={k}")
-        embedding = self.embedder.text_to_embedding(query)
+    def _cached_query_embedding(self, query: str) -> ndarray:
+        key = (self.embedder.embedding_key(), query)
+        with PineconeService._query_embeddings_lock:
+            embedding = PineconeService._query_embeddings.get(key)
+            if embedding is not None:
+                PineconeService._query_embeddings.move_to_end(key)
+            return embedding
+
+    def _cache_query_embedding(self, query: str, embedding: ndarray):
+        key = (self.embedder.embedding_key(), query)
+        with PineconeService._query_embeddings_lock:
+            PineconeService._query_embeddings[key] = embedding
+            PineconeService._query_embeddings.move_to_end(key)
+            while len(PineconeService._query_embeddings) > self.QUERY_CACHE_SIZE:
+                PineconeService._query_embeddings.popitem(last=False)
+
+    def embed_queries(self, queries: list[str]) -> list[ndarray]:
+        """Embeds queries, only sending those not already cached to the embedder in a single batch."""
+        embeddings = {query: self._cached_query_embedding(query) for query in queries}
+        missing = [query for query, embedding in embeddings.items() if embedding is None]
+        if len(missing) > 0:
+            for query, embedding in zip(missing, self.embedder.batch_text_to_embedding(missing)):
+                embeddings[query] = embedding
+                self._cache_query_embedding(query, embedding)
+        return [embeddings[query] for query in queries]
+
+    def _query(self, embedding: ndarray, k: int) -> list:
+        if isinstance(embedding, ndarray):
+            embedding = embedding.tolist()
         results = self.index.query(
-            vector=embedding.tolist(),
+            vector=embedding,
             top_k= k,
-            include_metadata=True
+            include_metadata=True,
+            namespace=self.namespace
         )
         return results['matches']
 
+    def get_data(self, query: str,k=5) -> dict:
+        """Get data from the vector database."""
+        logger.info(f"Querying vector database with query: {query}, k={k}")
+        embedding = self.embed_queries([query])[0]
+        return self._query(embedding, k)
+
+    def get_data_batch(self, queries: list[str], k: int = 5) -> list:
+        """
+        Gets data for several queries, embedding them in one batch and querying the index concurrently.
+        :param queries: List of query texts.
+        :param k: Number of results per query.
+        :return: List of matches for each query, in the same order as queries.
+        """
+        logger.info(f"Querying vector database with {len(queries)} queries, k={k}")
+        embeddings = self.embed_queries(queries)
+        if len(embeddings) <= 1:
+            return [self._query(embedding, k) for embedding in embeddings]
+        with ThreadPoolExecutor(max_workers=min(self.MAX_QUERY_WORKERS, len(embeddings))) as executor:
+            return list(executor.map(lambda embedding: self._query(embedding, k), embeddings))
+
     def delete_data(self, data_id: str):
         """Delete data from the vector database."""
         logger.info(f"Deleting data with ID: {data_id}")
-        self.index.delete(ids=[data_id])
+        self.index.delete(ids=[data_id], namespace=self.namespace)
         logger.info(f"Successfully deleted data with ID: {data_id}")
 
     def update_data(self, data_id: str, new_data: dict):
         """Update data in the vector database."""
         logger.info(f"Updating data with ID: {data_id}, new data: {new_data}")
         
-        existing_data = self.index.fetch(ids=[data_id])
+        existing_data = self.index.fetch(ids=[data_id], namespace=self.namespace)
         if existing_data:
             logger.debug(f"Found existing data for ID: {data_id}")
             
@@ -121,24 +197,26 @@ class PineconeService(VectorService):
                     'id': data_id,
                     'values': existing_data['values'],
                     'metadata': existing_data['metadata']
-                }]
+                }],
+                namespace=self.namespace
             )
             logger.debug(f"Successfully updated data with ID: {data_id}")
         else:
             logger.warning(f"No existing data found for ID: {data_id}")
 
+    def vector_count(self) -> int:
+        """Number of vectors in this service's namespace."""
+        namespaces = self.index.describe_index_stats()['namespaces']
+        if self.namespace not in namespaces:
+            return 0
+        return namespaces[self.namespace]['vector_count']
+
     def reset_data(self):
-        """Reset the vector database."""
-        print("Cleaning Pinecone index...")
-        self.service.delete_index(self.index_name)
-        logger.info(f"Deleted index: {self.index_name}")
-        self.service.create_index(
-            name=self.index_name,
-            dimension=self.embedder.dimension_output,
-            metric='cosine',
-            spec=ServerlessSpec(
-                cloud='aws',
-                region='us-east-1'
-            )
-        )
-        logger.info(f"Successfully recreated index: {self.index_name}")
\ No newline at end of file
+        """Reset the vector database, only clearing this service's namespace so other configs keep their vectors."""
+        print(f"Cleaning Pinecone namespace '{self.namespace}'...")
+        if self.vector_count() == 0:
+            # Deleting from a namespace that doesn't exist yet is an error
+            logger.info(f"Namespace '{self.namespace}' is already empty")
+            return
+        self.index.delete(delete_all=True, namespace=self.namespace)
+        logger.info(f"Successfully cleared namespace '{self.namespace}' of index: {self.index_name}")
@@ -28,6 +28,10 @@ class VectorService(ABC):
         """Get data from the vector database."""
         pass
 
+    def get_data_batch(self, queries: list[str], k: int = 5) -> list:
+        """Get data for several queries, in the same order as queries. Services that can batch override this."""
+        return [self.get_data(query, k) for query in queries]
+
     @abstractmethod
     def delete_data(self, data_id: str):
         """Delete data from the vector database."""
@@ -38,6 +42,10 @@ class VectorService(ABC):
         """Update data in the vector database."""
         pass
 
+    def vector_count(self) -> int:
+        """Number of vectors stored, services that can count override this. None if unknown."""
+        return None
+
     @abstractmethod
     def reset_data(self):
         """Reset the vector database."""
@@ -0,0 +1,65 @@
+import hashlib
+import pytest
+
+chunk_store = pytest.importorskip("src.vector_database.chunk_store")
+ChunkStore = chunk_store.ChunkStore
+
+class InMemoryS3Handler:
+    """Keeps chunk store files in a dict, with ETags that change whenever a file is uploaded with new contents."""
+    def __init__(self):
+        self.files = {}
+        self.downloads = 0
+
+    def upload_chunk_store_file(self, name: str, data: bytes) -> str:
+        self.files[name] = data
+        return f"s3://text/chunk_store/{name}"
+
+    def download_chunk_store_file(self, name: str):
+        self.downloads += 1
+        return self.files.get(name)
+
+    def chunk_store_file_etag(self, name: str):
+        if name not in self.files:
+            return None
+        return hashlib.md5(self.files[name]).hexdigest()
+
+def write_store(s3_handler, directory, chunks: list[str], reset: bool = False) -> ChunkStore:
+    store = ChunkStore(s3_handler, str(directory))
+    if reset:
+        store.reset()
+    doc_id = store.add_document("doc.pdf", "graph.json")
+    store.add_chunks(doc_id, chunks)
+    store.sync_to_s3()
+    return store
+
+def test_reopening_an_up_to_date_copy_skips_the_download(tmp_path):
+    s3_handler = InMemoryS3Handler()
+    write_store(s3_handler, tmp_path / "local", ["first", "second"])
+
+    store = ChunkStore(s3_handler, str(tmp_path / "local"))
+
+    assert store.get_chunks([0, 1]) == ["first", "second"]
+    assert s3_handler.downloads == 0
+
+def test_stale_local_copy_is_replaced_by_the_s3_store(tmp_path):
+    s3_handler = InMemoryS3Handler()
+    write_store(s3_handler, tmp_path / "local", ["old chunk"])
+    # Another machine force re-preprocesses and uploads a different store
+    write_store(s3_handler, tmp_path / "elsewhere", ["new chunk", "another new chunk"], reset=True)
+
+    store = ChunkStore(s3_handler, str(tmp_path / "local"))
+
+    assert store.get_chunks([0, 1]) == ["new chunk", "another new chunk"]
+    assert s3_handler.downloads == len(ChunkStore.FILES)
+
+    # The downloaded copy is now current, so opening it again doesn't download it
+    assert ChunkStore(s3_handler, str(tmp_path / "local")).get_chunks([0]) == ["new chunk"]
+    assert s3_handler.downloads == len(ChunkStore.FILES)
+
+def test_local_copy_is_kept_when_nothing_is_on_s3(tmp_path):
+    store = write_store(None, tmp_path / "local", ["only local"])
+    store.flush()
+
+    reopened = ChunkStore(InMemoryS3Handler(), str(tmp_path / "local"))
+
+    assert reopened.get_chunks([0]) == ["only local"]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+Image = pytest.importorskip("PIL.Image")
+clip_embedder = pytest.importorskip("src.vector_database.clip_embedder")
+CLIPEmbedder = clip_embedder.CLIPEmbedder
+
+TEXTS = [
+    "A mental health service for young people",
+    "Broadband subsidies for rural households",
+    "a photo of a dog",
+]
+
+def sample_images() -> list:
+    gradient = np.tile(np.linspace(0, 255, 224, dtype=np.uint8), (224, 1))
+    return [
+        Image.new("RGB", (224, 224), (200, 30, 30)),
+        Image.fromarray(np.stack([gradient, gradient.T, 255 - gradient], axis=2)),
+        Image.fromarray(np.random.default_rng(0).integers(0, 256, (160, 240, 3), dtype=np.uint8)),
+    ]
+
+def load_embedder(backend: str, **kwargs) -> CLIPEmbedder:
+    try:
+        return CLIPEmbedder(backend, **kwargs)
+    except OSError as e:
+        pytest.skip(f"CLIP weights are not available: {e}")
+
+@pytest.fixture(scope="module")
+def eager():
+    return load_embedder("torch")
+
+@pytest.fixture(scope="module", params=CLIPEmbedder.BACKENDS)
+def embedder(request, tmp_path_factory):
+    if request.param == "onnx":
+        pytest.importorskip("onnxruntime")
+    return load_embedder(request.param, batch_size=2, onnx_dir=str(tmp_path_factory.mktemp("clip_onnx")))
+
+def lowest_similarity(expected: list, actual: list) -> float:
+    return float(np.min(np.sum(np.stack(expected) * np.stack(actual), axis=1)))
+
+def test_text_embeddings_match_eager(eager, embedder):
+    similarity = lowest_similarity(eager.batch_text_to_embedding(TEXTS), embedder.batch_text_to_embedding(TEXTS))
+
+    assert similarity >= CLIPEmbedder.PARITY_THRESHOLDS[embedder.backend]
+
+def test_image_embeddings_match_eager(eager, embedder):
+    images = sample_images()
+
+    similarity = lowest_similarity(eager.batch_image_to_embedding(images), embedder.batch_image_to_embedding(images))
+
+    assert similarity >= CLIPEmbedder.PARITY_THRESHOLDS[embedder.backend]
+
+def test_check_parity_reports_threshold(embedder):
+    assert embedder.check_parity(TEXTS, sample_images()) >= CLIPEmbedder.PARITY_THRESHOLDS[embedder.backend]
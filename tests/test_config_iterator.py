@@ -0,0 +1,95 @@
+import copy
+import hashlib
+import itertools
+import os
+import yaml
+import pytest
+from src.config_iterator import ConfigIterator
+
+BASE_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config.yaml")
+
+def baseline_variations(iterator: ConfigIterator, variations: dict) -> list[tuple[int, dict]]:
+    """
+    The eager generation get_all_variations used before it became lazy, as (file number, config) of each written config.
+    Every combination is deep copied and numbered, only the original mode elaborator model is reverted,
+    and configs whose YAML was already written are skipped.
+    """
+    # The C dumper and deepcopy stand in for the slower YAML round trips, they agree on these plain configs
+    dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+    keys = list(variations.keys())
+    written = []
+    written_hashes = set()
+    for count, combination in enumerate(list(itertools.product(*variations.values())), 1):
+        new_config = copy.deepcopy(iterator.base_config)
+        for key, value in zip(keys, combination):
+            current = new_config
+            key_path = key.split('.')
+            for part in key_path[:-1]:
+                if part not in current:
+                    current[part] = {}
+                current = current[part]
+            current[key_path[-1]] = value
+        if new_config.get('prompt_mode', {}).get('mode') == 'original':
+            base_elab = iterator.base_config.get('prompt_mode', {}).get('elaborator_model', None)
+            if base_elab is not None:
+                new_config['prompt_mode']['elaborator_model'] = base_elab
+            elif 'elaborator_model' in new_config['prompt_mode']:
+                del new_config['prompt_mode']['elaborator_model']
+        config_hash = hashlib.md5(yaml.dump(new_config, sort_keys=True, Dumper=dumper).encode()).hexdigest()
+        if config_hash not in written_hashes:
+            written_hashes.add(config_hash)
+            written.append((count, new_config))
+    return written
+
+@pytest.fixture
+def iterator():
+    return ConfigIterator(BASE_CONFIG_PATH)
+
+def test_matches_baseline_on_base_variations(iterator):
+    base_dump = yaml.dump(iterator.base_config)
+    expected = baseline_variations(iterator, ConfigIterator.BASE_VARIATIONS)
+
+    assert list(iterator.iter_variations(ConfigIterator.BASE_VARIATIONS)) == expected
+    assert iterator.estimate_count(ConfigIterator.BASE_VARIATIONS) == len(expected)
+    # Generated configs share sections with the base config, which must not have been modified
+    assert yaml.dump(iterator.base_config) == base_dump
+
+def test_matches_baseline_without_base_elaborator(iterator):
+    del iterator.base_config['prompt_mode']['elaborator_model']
+    variations = {
+        "prompt_mode.mode": ["original", "elaborated"],
+        "prompt_mode.elaborator_model": ["oai_4o_latest", "claude_3_sonnet", "oai_4o_latest"],
+        "iteration.pass_threshold": [0.5, 0.7],
+    }
+
+    assert list(iterator.iter_variations(variations)) == baseline_variations(iterator, variations)
+
+def test_files_are_numbered_by_combination(iterator, tmp_path):
+    variations = {
+        "prompt_mode.elaborator_model": ["oai_4o_latest", "claude_3_sonnet"],
+        "prompt_mode.mode": ["original", "elaborated"],
+    }
+
+    total = iterator.get_all_variations(variations, str(tmp_path))
+
+    written = sorted(name for _, _, files in os.walk(tmp_path) for name in files)
+    # Combination 3 is claude_3_sonnet in original mode, the same config as combination 1
+    assert written == ["config_variation_1.yaml", "config_variation_2.yaml", "config_variation_4.yaml"]
+    assert total == 4
+
+def test_prune_retries_keeps_one_config_without_a_threshold(iterator):
+    variations = {
+        "iteration.pass_threshold": [0, 0.5],
+        "iteration.loop_retries": [3, 5, 7],
+        "prompt_mode.mode": ["original", "elaborated"],
+    }
+
+    generated = list(iterator.iter_variations(variations, prune_retries=True))
+
+    retries = [(config["iteration"]["pass_threshold"], config["iteration"]["loop_retries"]) for _, config in generated]
+    base_retries = iterator.base_config["iteration"]["loop_retries"]
+    assert retries == [(0, base_retries), (0, base_retries), (0.5, 3), (0.5, 3), (0.5, 5), (0.5, 5), (0.5, 7), (0.5, 7)]
+    assert [index for index, _ in generated] == [1, 2, 7, 8, 9, 10, 11, 12]
+    assert iterator.estimate_count(variations, prune_retries=True) == len(generated)
+    # Without opting in every retry count is still generated, like the original generator
+    assert iterator.estimate_count(variations) == len(list(iterator.iter_variations(variations))) == 12
@@ -0,0 +1,32 @@
+import copy
+import os
+import yaml
+import pytest
+from src.system_manager import ConfigManager
+
+BASE_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config.yaml")
+
+@pytest.fixture
+def base_config():
+    with open(BASE_CONFIG_PATH, "r") as f:
+        return yaml.safe_load(f)
+
+def fingerprint(config: dict, **models) -> str:
+    config = copy.deepcopy(config)
+    config["model"]["primary"] = models["primary"]
+    config["text_summariser"]["model"] = models["summariser"]
+    return ConfigManager.from_dict(config).get_preprocessing_fingerprint()
+
+def test_fingerprint_uses_primary_model_when_there_is_no_summariser(base_config):
+    first = fingerprint(base_config, primary="oai_4o_latest", summariser=None)
+    second = fingerprint(base_config, primary="claude_3_sonnet", summariser=None)
+
+    assert first != second
+    # The primary model summarises, so it's the same as naming it as the summariser
+    assert first == fingerprint(base_config, primary="oai_4o_latest", summariser="oai_4o_latest")
+
+def test_fingerprint_ignores_primary_model_with_a_summariser(base_config):
+    first = fingerprint(base_config, primary="oai_4o_latest", summariser="oai_4o_latest")
+    second = fingerprint(base_config, primary="claude_3_sonnet", summariser="oai_4o_latest")
+
+    assert first == second
@@ -0,0 +1,77 @@
+import pytest
+
+fitz = pytest.importorskip("fitz")
+file_preprocessor = pytest.importorskip("src.preprocessing.file_preprocessor")
+from src.preprocessing.artifact_cache import ArtifactCache
+
+FilePreprocessor = file_preprocessor.FilePreprocessor
+
+class CountingGraphCreator:
+    def __init__(self):
+        self.calls = 0
+
+    def graph_key(self) -> str:
+        return "CountingGraphCreator"
+
+    def create_graph_dict(self, text: str) -> list[dict]:
+        self.calls += 1
+        return [{"subject": "text", "relation": "has", "object": text}]
+
+@pytest.fixture
+def artifact_cache(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "artifacts.sqlite"))
+    yield cache
+    cache.close()
+
+def make_preprocessor(graph_creator, artifact_cache=None):
+    return FilePreprocessor(None, None, None, None, graph_creator, artifact_cache=artifact_cache)
+
+def test_create_graph_builds_once_on_cache_miss(artifact_cache):
+    graph_creator = CountingGraphCreator()
+    preprocessor = make_preprocessor(graph_creator, artifact_cache)
+
+    graph = preprocessor.create_graph("broadband")
+
+    assert graph == [{"subject": "text", "relation": "has", "object": "broadband"}]
+    assert graph_creator.calls == 1
+
+def test_create_graph_returns_cached_copy(artifact_cache):
+    graph_creator = CountingGraphCreator()
+    preprocessor = make_preprocessor(graph_creator, artifact_cache)
+
+    first = preprocessor.create_graph("broadband")
+    second = preprocessor.create_graph("broadband")
+
+    assert second == first
+    assert graph_creator.calls == 1
+
+def test_create_graph_without_cache_always_builds():
+    graph_creator = CountingGraphCreator()
+    preprocessor = make_preprocessor(graph_creator)
+
+    preprocessor.create_graph("broadband")
+    preprocessor.create_graph("broadband")
+
+    assert graph_creator.calls == 2
+
+def test_cached_extraction_matches_a_fresh_one(artifact_cache, tmp_path, monkeypatch):
+    extractions = []
+    def extract(attachment):
+        extractions.append(attachment.attachment_data)
+        attachment.needs_extraction = False
+        attachment.attachment_data = {
+            "text": ["page one"],
+            "images": [{"page": 0, "bbox": fitz.Rect(10, 20, 110, 220), "image": "aGVsbG8=", "surrounding_text": "page one"}],
+            "page_count": 1,
+        }
+    monkeypatch.setattr(file_preprocessor.Attachment, "extract", extract)
+    document = tmp_path / "report.pdf"
+    document.write_bytes(b"%PDF-1.4 report")
+    preprocessor = make_preprocessor(CountingGraphCreator(), artifact_cache)
+
+    fresh = preprocessor.extract(str(document)).attachment_data
+    cached = preprocessor.extract(str(document)).attachment_data
+
+    assert len(extractions) == 1
+    assert cached == fresh
+    assert isinstance(cached["images"][0]["bbox"], fitz.Rect)
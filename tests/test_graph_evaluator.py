@@ -0,0 +1,104 @@
+from types import SimpleNamespace
+import pytest
+
+graph_evaluator = pytest.importorskip("src.evaluation.graph_evaluator")
+from src.kg.graph_creator import GraphRelation
+
+GraphEvaluator = graph_evaluator.GraphEvaluator
+
+def relations(*triples) -> list[GraphRelation]:
+    return [GraphRelation(subject=subject, relation=relation, object=object) for subject, relation, object in triples]
+
+def baseline_precision(retrieved_graph, llm_graph) -> float:
+    if not llm_graph:
+        return 0.0
+    return len(set(retrieved_graph).intersection(set(llm_graph))) / len(set(llm_graph))
+
+def baseline_recall(full_truth_graph, retrieved_graph) -> float:
+    if not full_truth_graph:
+        return 0.0
+    return len(set(full_truth_graph).intersection(set(retrieved_graph))) / len(set(full_truth_graph))
+
+def baseline_f_beta(source_graph, result_graph, beta) -> float:
+    precision = baseline_precision(source_graph, result_graph)
+    recall = baseline_recall(source_graph, result_graph)
+    if (precision + recall) == 0:
+        return 0
+    return (1 + beta ** 2) * (precision * recall) / (beta ** 2 * precision + recall)
+
+def baseline_evaluation(doc_graph, summary_graph, llm_graph, beta) -> dict:
+    """The per result metrics GraphEvaluator computed before they were vectorised."""
+    return {
+        "recall": baseline_precision(doc_graph, summary_graph),
+        "precision": baseline_precision(doc_graph, llm_graph),
+        "f_beta": baseline_f_beta(doc_graph, llm_graph, beta),
+        "beta": beta,
+    }
+
+DOC_GRAPHS = {
+    "broadband.pdf": relations(("broadband", "reaches", "rural areas"), ("subsidy", "funds", "broadband"), ("government", "pays", "subsidy")),
+    "health.pdf": relations(("clinic", "treats", "patients"), ("nurse", "works at", "clinic")),
+    "empty.pdf": [],
+}
+SUMMARY_GRAPHS = {
+    "b1": relations(("broadband", "reaches", "rural areas"), ("broadband", "reaches", "rural areas"), ("towns", "get", "fibre")),
+    "b2": relations(("government", "pays", "subsidy")),
+    "h1": relations(("clinic", "treats", "patients"), ("nurse", "works at", "clinic")),
+    "h2": [],
+    "e1": relations(("clinic", "treats", "patients")),
+}
+RAG_RESULTS = [("broadband.pdf", "b1"), ("broadband.pdf", "b2"), ("health.pdf", "h1"), ("health.pdf", "h2"), ("empty.pdf", "e1")]
+
+class FixedGraphCreator:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def create_graph_relations(self, text):
+        return self.graph
+
+def make_evaluator(answer_graph, beta) -> GraphEvaluator:
+    graph_creator = FixedGraphCreator(answer_graph)
+    stage = SimpleNamespace(
+        doc_graphs=DOC_GRAPHS,
+        chunk_summaries={vector_id: {"summary": vector_id, "graph": graph} for vector_id, graph in SUMMARY_GRAPHS.items()},
+        graphModel=graph_creator,
+        answer_graph=graph_creator.create_graph_relations,
+    )
+    return GraphEvaluator(stage, graph_creator, beta)
+
+@pytest.mark.parametrize("answer_graph", [
+    relations(("broadband", "reaches", "rural areas"), ("subsidy", "funds", "broadband"), ("clinic", "treats", "patients"), ("moon", "is", "cheese")),
+    relations(("moon", "is", "cheese")),
+    relations(("nurse", "works at", "clinic"), ("nurse", "works at", "clinic")),
+    [],
+])
+@pytest.mark.parametrize("beta", [1.0, 0.5, 2.0])
+def test_batch_metrics_match_baseline(answer_graph, beta):
+    evaluator = make_evaluator(answer_graph, beta)
+    rag_results = [{"document_path": document_path, "vector_id": vector_id} for document_path, vector_id in RAG_RESULTS]
+
+    evaluated = evaluator.evaluate_rag_results("answer", rag_results)
+
+    for rag_data in evaluated:
+        expected = baseline_evaluation(DOC_GRAPHS[rag_data["document_path"]], SUMMARY_GRAPHS[rag_data["vector_id"]], answer_graph, beta)
+        assert rag_data["graph_evaluation"] == pytest.approx(expected)
+
+def test_single_result_matches_batch():
+    answer_graph = relations(("government", "pays", "subsidy"), ("moon", "is", "cheese"))
+    evaluator = make_evaluator(answer_graph, 1.0)
+
+    single = evaluator.evaluate_rag_result("answer", {"document_path": "broadband.pdf", "vector_id": "b2"})
+
+    assert single["graph_evaluation"] == pytest.approx(baseline_evaluation(DOC_GRAPHS["broadband.pdf"], SUMMARY_GRAPHS["b2"], answer_graph, 1.0))
+
+@pytest.mark.parametrize("first, second", [
+    (DOC_GRAPHS["broadband.pdf"], SUMMARY_GRAPHS["b1"]),
+    (DOC_GRAPHS["health.pdf"], SUMMARY_GRAPHS["h2"]),
+    ([], SUMMARY_GRAPHS["e1"]),
+])
+def test_pairwise_comparisons_match_baseline(first, second):
+    evaluator = make_evaluator([], 1.0)
+
+    assert evaluator.compare_graph_precision(first, second) == pytest.approx(baseline_precision(first, second))
+    assert evaluator.compare_graph_recall(first, second) == pytest.approx(baseline_recall(first, second))
+    assert evaluator.compare_graph_f_beta(first, second, 2.0) == pytest.approx(baseline_f_beta(first, second, 2.0))
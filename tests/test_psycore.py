@@ -0,0 +1,150 @@
+import logging
+from types import SimpleNamespace
+import pytest
+
+psycore_module = pytest.importorskip("psycore")
+Psycore = psycore_module.Psycore
+
+class FakeS3Handler:
+    def __init__(self):
+        self.manifest = None
+        self.resets = 0
+
+    def upload_preprocessing_manifest(self, manifest):
+        self.manifest = manifest
+
+    def download_preprocessing_manifest(self):
+        return self.manifest
+
+    def delete_preprocessing_manifest(self):
+        self.manifest = None
+
+    def reset_buckets(self):
+        self.resets += 1
+
+    def list_base_directory_files(self, bucket):
+        return ["a.pdf", "b.pdf"]
+
+class FakeVectorService:
+    def __init__(self, vector_count=0):
+        self._vector_count = vector_count
+
+    def vector_count(self):
+        return self._vector_count
+
+    def reset_data(self):
+        self._vector_count = 0
+
+class FakeFilePreprocessor:
+    runs = 0
+    fail = False
+
+    def __init__(self, *args):
+        pass
+
+    def process_files(self, files):
+        FakeFilePreprocessor.runs += 1
+        if FakeFilePreprocessor.fail:
+            raise RuntimeError("crashed partway")
+
+@pytest.fixture
+def psycore(monkeypatch):
+    monkeypatch.setattr(psycore_module, "FilePreprocessor", FakeFilePreprocessor)
+    FakeFilePreprocessor.runs = 0
+    FakeFilePreprocessor.fail = False
+    instance = Psycore.__new__(Psycore)
+    instance.logger = logging.getLogger("test")
+    instance.preprocessing_fingerprint = "fingerprint"
+    instance.s3_handler = FakeS3Handler()
+    # Vectors left in the namespace don't show whether preprocessing finished
+    instance.vdb = FakeVectorService(vector_count=10)
+    instance.chunk_store = SimpleNamespace(reset=lambda: None)
+    instance.s3_quick_fetch = SimpleNamespace(clear_image_cache=lambda: None)
+    instance.rag_chat = SimpleNamespace(s3_quick_fetch=instance.s3_quick_fetch)
+    instance.artifact_cache_path = None
+    instance.document_ids = None
+    instance.embedder = instance.text_summariser = instance.graphModel = None
+    return instance
+
+def test_completed_preprocessing_is_skipped(psycore):
+    assert psycore.preprocess(skip_confirmation=True)
+    assert psycore.s3_handler.manifest["fingerprint"] == "fingerprint"
+
+    assert psycore.preprocess(skip_confirmation=True)
+    assert FakeFilePreprocessor.runs == 1
+    assert psycore.s3_handler.resets == 1
+
+def test_crashed_preprocessing_is_redone(psycore):
+    FakeFilePreprocessor.fail = True
+    with pytest.raises(RuntimeError):
+        psycore.preprocess(skip_confirmation=True)
+    assert not psycore.is_preprocessed()
+
+    FakeFilePreprocessor.fail = False
+    assert psycore.preprocess(skip_confirmation=True)
+    assert FakeFilePreprocessor.runs == 2
+    assert psycore.is_preprocessed()
+
+def test_manifest_is_cleared_before_forced_preprocessing(psycore):
+    psycore.preprocess(skip_confirmation=True)
+    FakeFilePreprocessor.fail = True
+
+    with pytest.raises(RuntimeError):
+        psycore.preprocess(skip_confirmation=True, force=True)
+
+    assert psycore.s3_handler.manifest is None
+
+def test_manifest_from_another_fingerprint_does_not_count(psycore):
+    psycore.s3_handler.manifest = {"fingerprint": "other"}
+
+    assert not psycore.is_preprocessed()
+
+class FakeRetrievalService:
+    def __init__(self):
+        self.single_queries = []
+        self.batches = []
+
+    @staticmethod
+    def _matches(query):
+        return [
+            {"id": f"{query}-1", "score": 0.9, "metadata": {"type": "text", "document_path": "doc.pdf", "graph_path": "graph.json", "text": query}},
+            {"id": f"{query}-2", "score": 0.1, "metadata": {"type": "text", "document_path": "doc.pdf", "graph_path": "graph.json", "text": "unrelated"}},
+        ]
+
+    def get_data(self, query, k=5):
+        self.single_queries.append(query)
+        return self._matches(query)
+
+    def get_data_batch(self, queries, k=5):
+        self.batches.append(list(queries))
+        return [self._matches(query) for query in queries]
+
+@pytest.fixture
+def prompt_psycore(monkeypatch):
+    monkeypatch.setattr(psycore_module, "RAGChatStage", lambda *args: None)
+    instance = Psycore.__new__(Psycore)
+    instance.vdb = FakeRetrievalService()
+    instance.chunk_store = None
+    instance.rag_text_similarity_threshold = 0.5
+    instance.prompt_workers = 4
+    instance.main_wrapper = instance.s3_handler = instance.s3_quick_fetch = None
+    instance.choose_prompt = lambda prompt: (f"elaborated {prompt}", f"chosen {prompt}")
+    instance.evaluate_retrieved_prompt = lambda base_prompt, elaborated_prompt, chosen_prompt, rag_results, rag_chat: {
+        "base_prompt": base_prompt, "chosen_prompt": chosen_prompt, "texts": [result["text"] for result in rag_results],
+    }
+    return instance
+
+def test_prompts_are_retrieved_in_one_batch(prompt_psycore):
+    results = prompt_psycore.evaluate_prompts(["first", "second", "third"])
+
+    assert prompt_psycore.vdb.batches == [["chosen first", "chosen second", "chosen third"]]
+    assert prompt_psycore.vdb.single_queries == []
+    assert results == [
+        {"base_prompt": prompt, "chosen_prompt": f"chosen {prompt}", "texts": [f"chosen {prompt}"]}
+        for prompt in ["first", "second", "third"]
+    ]
+
+def test_batched_retrieval_matches_single_prompt_retrieval(prompt_psycore):
+    batched = prompt_psycore.evaluate_prompts(["first", "second"], max_workers=1)
+
+    assert [prompt_psycore.evaluate_prompt(prompt) for prompt in ["first", "second"]] == batched
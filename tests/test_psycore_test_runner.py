@@ -0,0 +1,48 @@
+import pytest
+
+test_runner = pytest.importorskip("PsycoreTestRunner")
+PsycoreTestRunner = test_runner.PsycoreTestRunner
+
+class FakePsycore:
+    preprocess_calls = []
+
+    def __init__(self, config):
+        self.preprocessing_fingerprint = config["fingerprint"]
+        self.fail = config.get("fail", False)
+        self.config_workers = 1
+
+    def preprocess(self, skip_confirmation=False, force=False):
+        FakePsycore.preprocess_calls.append(self.preprocessing_fingerprint)
+        if self.fail:
+            raise RuntimeError(f"preprocessing {self.preprocessing_fingerprint} failed")
+        return True
+
+    def evaluate_prompts(self, prompts, max_workers=None):
+        return [f"{self.preprocessing_fingerprint}: {prompt}" for prompt in prompts]
+
+@pytest.fixture
+def runner(monkeypatch):
+    FakePsycore.preprocess_calls = []
+    monkeypatch.setattr(PsycoreTestRunner, "_build_psycore", lambda self, config=None: FakePsycore(config))
+    instance = PsycoreTestRunner.__new__(PsycoreTestRunner)
+    instance.config = {}
+    instance.psycore = None
+    return instance
+
+def test_preprocesses_once_per_fingerprint(runner):
+    configs = [{"fingerprint": "a"}, {"fingerprint": "a"}, {"fingerprint": "b"}, {"fingerprint": "a"}]
+
+    results = runner.evaluate_configs(configs, ["prompt"], preprocess=True)
+
+    assert FakePsycore.preprocess_calls == ["a", "b"]
+    assert results == [["a: prompt"], ["a: prompt"], ["b: prompt"], ["a: prompt"]]
+
+def test_failed_preprocessing_fails_its_whole_fingerprint(runner):
+    configs = [{"fingerprint": "a", "fail": True}, {"fingerprint": "a"}, {"fingerprint": "b"}]
+
+    results = runner.evaluate_configs(configs, ["prompt"], preprocess=True, return_exceptions=True)
+
+    assert FakePsycore.preprocess_calls == ["a", "b"]
+    assert isinstance(results[0], RuntimeError)
+    assert results[1] is results[0]
+    assert results[2] == ["b: prompt"]
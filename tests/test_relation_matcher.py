@@ -0,0 +1,34 @@
+import pytest
+
+relation_matcher = pytest.importorskip("src.kg.relation_matcher")
+from src.kg.graph_creator import GraphRelation
+
+normalise_term = relation_matcher.normalise_term
+RelationMatcher = relation_matcher.RelationMatcher
+
+@pytest.mark.parametrize("term, expected", [
+    ("Broadband_Subsidies", "broadband subsidy"),
+    ("  mental-health   services ", "mental health service"),
+    ("Churches", "church"),
+    ("boxes", "box"),
+    ("classes", "class"),
+    ("cities", "city"),
+    ("lies", "lie"),
+])
+def test_normalise_term_lemmatises_plurals(term, expected):
+    assert normalise_term(term) == expected
+
+@pytest.mark.parametrize("term", ["does", "goes", "species", "series", "news", "status", "analysis", "physics", "diabetes", "always", "is", "has"])
+def test_normalise_term_keeps_exceptions(term):
+    assert normalise_term(term) == term
+
+def test_words_that_only_share_a_suffix_do_not_match():
+    assert normalise_term("does") != normalise_term("doe")
+    assert normalise_term("species") != normalise_term("specy")
+
+def test_matcher_normalises_only_when_asked():
+    references = [GraphRelation(subject="Broadband_Subsidies", relation="SUPPORTS", object="rural households")]
+    candidates = [GraphRelation(subject="broadband subsidy", relation="supports", object="Rural Household")]
+
+    assert RelationMatcher(references, normalise=True).matches(candidates) == [True]
+    assert RelationMatcher(references, normalise=False).matches(candidates) == [False]
@@ -0,0 +1,102 @@
+import json
+import pytest
+
+pd = pytest.importorskip("pandas")
+result_manager = pytest.importorskip("src.results.result_manager")
+ResultManager = result_manager.ResultManager
+
+def make_config(primary="oai_4o_latest", document_ids=(0, 1, 2)):
+    return {
+        "model": {"primary": primary, "allow_image_input": True},
+        "document_range": {"enabled": True, "document_ids": list(document_ids)},
+        "iteration": {"loop_retries": 5, "pass_threshold": 0.5},
+    }
+
+@pytest.fixture
+def manager(tmp_path):
+    instance = ResultManager(str(tmp_path))
+    yield instance
+    instance.close()
+
+def test_write_result_tracks_flattened_config(manager, tmp_path):
+    result_path = manager.write_result(make_config(), {"prompt": {"response": "first"}})
+    exists, config_hash = manager.check_hash_exists(make_config())
+    assert exists
+    assert manager.get_result_path(config_hash) == result_path
+    with open(result_path) as f:
+        assert json.load(f) == {"prompt": {"response": "first"}}
+    row = manager.to_dataframe().iloc[0]
+    assert row["model.primary"] == "oai_4o_latest"
+    assert row["document_range.document_ids"] == "0|1|2"
+    assert row["iteration.pass_threshold"] == "0.5"
+    # Columns the config doesn't set are left empty
+    assert row["embedding.method"] == ""
+    assert not list(tmp_path.glob("*.tmp"))
+
+def test_write_result_replaces_earlier_result_for_same_config(manager):
+    first_path = manager.write_result(make_config(), {"prompt": {"response": "first"}})
+    manager.write_result(make_config(primary="other"), {"prompt": {"response": "other"}})
+    second_path = manager.write_result(make_config(), {"prompt": {"response": "second"}})
+    assert second_path == first_path
+    df = manager.to_dataframe()
+    assert len(df) == 2
+    assert df["config_hash"].is_unique
+    # The replaced row counts as the newest result
+    assert df.iloc[-1]["model.primary"] == "oai_4o_latest"
+    with open(second_path) as f:
+        assert json.load(f) == {"prompt": {"response": "second"}}
+
+def test_check_hash_exists_for_untracked_result_file(manager, tmp_path):
+    exists, config_hash = manager.check_hash_exists(make_config())
+    assert not exists
+    (tmp_path / f"{config_hash}.json").write_text("{}")
+    assert manager.check_hash_exists(make_config()) == (True, config_hash)
+    assert manager.get_result_path(config_hash) is None
+
+def test_export_csv_round_trips_through_import_csv(manager, tmp_path):
+    manager.write_result(make_config(), {})
+    manager.write_result(make_config(primary="other", document_ids=[3]), {})
+    csv_path = manager.export_csv()
+    assert csv_path == manager.csv_path
+    exported = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    assert list(exported.columns) == manager.all_columns
+    pd.testing.assert_frame_equal(exported, manager.to_dataframe())
+
+    other = ResultManager(str(tmp_path / "other"))
+    try:
+        assert other.import_csv(csv_path) == 2
+        pd.testing.assert_frame_equal(other.to_dataframe(), manager.to_dataframe())
+    finally:
+        other.close()
+
+def test_import_csv_later_rows_replace_and_incomplete_rows_skipped(manager, tmp_path):
+    csv_path = tmp_path / "old.csv"
+    pd.DataFrame([
+        {"config_hash": "aaa", "model.primary": "first", "result_path": "aaa.json"},
+        {"config_hash": "bbb", "model.primary": "kept", "result_path": ""},
+        {"config_hash": "aaa", "model.primary": "second", "result_path": "aaa.json"},
+    ]).to_csv(csv_path, index=False)
+    assert manager.import_csv(str(csv_path)) == 2
+    df = manager.to_dataframe()
+    assert df["config_hash"].tolist() == ["aaa"]
+    assert df.iloc[0]["model.primary"] == "second"
+    assert df.iloc[0]["embedding.method"] == ""
+
+def test_new_database_imports_existing_results_csv(tmp_path):
+    pd.DataFrame([
+        {"config_hash": "aaa", "model.primary": "old", "result_path": "aaa.json"},
+    ]).to_csv(tmp_path / "results.csv", index=False)
+    manager = ResultManager(str(tmp_path))
+    try:
+        assert manager.get_result_path("aaa") == "aaa.json"
+    finally:
+        manager.close()
+    # An existing database isn't re-imported over, so rows written since the CSV are kept
+    pd.DataFrame([
+        {"config_hash": "bbb", "model.primary": "new", "result_path": "bbb.json"},
+    ]).to_csv(tmp_path / "results.csv", index=False)
+    manager = ResultManager(str(tmp_path))
+    try:
+        assert manager.to_dataframe()["config_hash"].tolist() == ["aaa"]
+    finally:
+        manager.close()
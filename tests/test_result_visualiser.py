@@ -0,0 +1,99 @@
+import os
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+result_visualiser = pytest.importorskip("jupyter_testing.resultVisualiser")
+from src.results import ResultManager
+
+ResultVisualiser = result_visualiser.ResultVisualiser
+
+def rag_result(score, recall):
+    return {
+        "score": score,
+        "graph_evaluation": {"recall": recall, "precision": recall, "f_beta": recall},
+        "bertscore_evaluation": {"precision": [recall], "recall": [recall], "f1": [recall]},
+        "rouge_evaluation": {"rougeL": [recall, recall, recall]},
+    }
+
+def make_result(response, rag_results):
+    return {
+        "What is CBT?": {
+            "response": response,
+            "chosen_prompt": "What is cognitive behavioural therapy?",
+            "retry_count": 1,
+            "rag_results": rag_results,
+        }
+    }
+
+def write(results_dir, primary, result):
+    manager = ResultManager(str(results_dir))
+    try:
+        return manager.write_result({"model": {"primary": primary}}, result)
+    finally:
+        manager.close()
+
+def segments(results_dir):
+    return sorted(os.listdir(results_dir / ResultVisualiser.COLUMNAR_DIR))
+
+def test_refresh_only_ingests_new_and_rewritten_results(tmp_path):
+    first_path = write(tmp_path, "first", make_result("one", [rag_result(0.9, 1.0)]))
+    visualiser = ResultVisualiser(str(tmp_path))
+    assert segments(tmp_path) == ["000001-prompts.parquet", "000001-rag_results.parquet"]
+    assert visualiser.refresh() == 0
+    assert len(segments(tmp_path)) == 2
+
+    write(tmp_path, "second", make_result("two", [rag_result(0.5, 0.5)]))
+    assert visualiser.refresh() == 1
+    assert len(segments(tmp_path)) == 4
+    assert sorted(visualiser.weighted["response"]) == ["one", "two"]
+
+    # A rewritten result replaces the rows ingested for its config earlier
+    write(tmp_path, "first", make_result("one again", [rag_result(0.9, 0.0), rag_result(0.1, 0.0)]))
+    mtime = os.path.getmtime(first_path) + 10
+    os.utime(first_path, (mtime, mtime))
+    assert visualiser.refresh() == 1
+    assert len(segments(tmp_path)) == 6
+    assert sorted(visualiser.weighted["response"]) == ["one again", "two"]
+    assert len(visualiser.rag_results) == 3
+    assert visualiser.rag_results.groupby("config_hash")["segment"].nunique().max() == 1
+
+    # A fresh visualiser reads the same tables back from the segments without ingesting anything
+    reloaded = ResultVisualiser(str(tmp_path), refresh=False)
+    assert reloaded.refresh() == 0
+    columns = ["config_hash", "prompt_index", "response", "rag_count", "graph_recall"]
+    expected = visualiser.weighted[columns].sort_values("config_hash").reset_index(drop=True)
+    pd.testing.assert_frame_equal(reloaded.weighted[columns].sort_values("config_hash").reset_index(drop=True), expected)
+
+def test_rag_segment_without_prompts_segment_is_ignored(tmp_path):
+    write(tmp_path, "first", make_result("one", [rag_result(0.9, 1.0)]))
+    visualiser = ResultVisualiser(str(tmp_path))
+    # What a refresh that stopped between writing its two segments leaves behind
+    orphan = visualiser.rag_results.assign(segment=2, score=0.1)
+    orphan.to_parquet(tmp_path / ResultVisualiser.COLUMNAR_DIR / "000002-rag_results.parquet", index=False)
+    assert visualiser.refresh() == 0
+    assert visualiser.rag_results["segment"].tolist() == [1]
+    assert visualiser.weighted["rag_count"].tolist() == [1]
+
+def test_weight_results_weights_by_score_rank():
+    visualiser = ResultVisualiser("unused", refresh=False)
+    weighted = visualiser.weight_results(make_result("one", [rag_result(0.2, 1.0), rag_result(0.8, 0.4), rag_result(0.5, 0.7)]))
+    result = weighted["What is CBT?"]
+    # Sorted by score the recalls are 1.0, 0.7, 0.4 with weights 1/6, 2/6, 3/6
+    assert result["graph_evaluation"]["recall"] == pytest.approx((1.0 + 2 * 0.7 + 3 * 0.4) / 6)
+    assert result["rouge_evaluation"]["rougeL"][2] == pytest.approx((1.0 + 2 * 0.7 + 3 * 0.4) / 6)
+    assert result["rag_count"] == 3
+    assert result["response"] == "one"
+
+def test_weight_results_without_rag_results():
+    visualiser = ResultVisualiser("unused", refresh=False)
+    result = visualiser.weight_results(make_result("one", []))["What is CBT?"]
+    assert result["rag_count"] == 0
+    assert pd.isna(result["graph_evaluation"]["recall"])
+
+def test_configs_pairs_tracked_configs_with_their_results(tmp_path):
+    write(tmp_path, "first", make_result("one", [rag_result(0.9, 1.0)]))
+    configs = ResultVisualiser(str(tmp_path)).configs
+    assert len(configs) == 1
+    assert configs[0]["model"]["primary"] == "first"
+    assert configs[0]["results"]["What is CBT?"]["graph_evaluation"]["recall"] == pytest.approx(1.0)
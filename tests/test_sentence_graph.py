@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+import pytest
+
+iterative_stage = pytest.importorskip("src.main.iterative_stage")
+from src.kg.graph_creator import GraphRelation
+
+IterativeStage = iterative_stage.IterativeStage
+
+class SentenceGraphCreator:
+    """Makes one relation per text and records every batch it was asked to graph."""
+    def __init__(self):
+        self.batches = []
+
+    def create_graph_relations_batch(self, texts: list[str]) -> list[list[GraphRelation]]:
+        self.batches.append(list(texts))
+        return [[GraphRelation(subject=text, relation="states", object="fact")] for text in texts]
+
+    def create_graph_relations(self, text: str) -> list[GraphRelation]:
+        return self.create_graph_relations_batch([text])[0]
+
+def answer(content: str):
+    return SimpleNamespace(content=content)
+
+@pytest.fixture
+def graph_creator():
+    return SentenceGraphCreator()
+
+@pytest.fixture
+def stage(graph_creator):
+    return IterativeStage(None, graph_creator, threshold=0.5, rag_results=[])
+
+def test_retried_answer_only_graphs_new_sentences(stage, graph_creator):
+    stage.decision_maker([], answer("Broadband is subsidised. Rural areas benefit."))
+    stage.decision_maker([], answer("Broadband is subsidised. Rural areas benefit. Prices fell in 2020."))
+
+    # The first batch is the (empty) set of chunk summaries graphed on construction
+    assert graph_creator.batches[1:] == [
+        ["Broadband is subsidised.", "Rural areas benefit."],
+        ["Prices fell in 2020."],
+    ]
+
+def test_retried_answer_keeps_sentence_order_and_drops_repeats(stage):
+    stage.sentence_graph("First point. Second point.")
+
+    graph = stage.sentence_graph("Second point. First point. Second point.")
+
+    assert [relation.subject for relation in graph] == ["Second point.", "First point."]